@@ -0,0 +1,271 @@
+from pathlib import Path
+
+import numpy as np
+
+from gallery import DEFAULT_CHUNK_SIZE, DEFAULT_TOLERANCE, Match, face_distance_matrix
+from metrics import metrics
+
+
+def assign_to_centroids(matrix: np.ndarray, centroids: np.ndarray, chunk_size: int = DEFAULT_CHUNK_SIZE) -> np.ndarray:
+    """
+    Find the closest centroid of every row, in chunks.
+
+    Args:
+        matrix (np.ndarray): The ``(N, D)`` vectors.
+        centroids (np.ndarray): The ``(C, D)`` centroids.
+        chunk_size (int): Number of rows assigned at once.
+
+    Returns:
+        np.ndarray: The ``(N,)`` index of the closest centroid of each row.
+    """
+    assignments = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), chunk_size):
+        distances = face_distance_matrix(centroids, matrix[start:start + chunk_size])
+        assignments[start:start + chunk_size] = np.argmin(distances, axis=1)
+    return assignments
+
+
+def kmeans(matrix: np.ndarray, n_clusters: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Cluster vectors with Lloyd's k-means.
+
+    Args:
+        matrix (np.ndarray): The ``(N, D)`` vectors, N >= n_clusters.
+        n_clusters (int): Number of clusters.
+        iterations (int): Number of assignment/update rounds.
+        seed (int): Seed of the initial centroids.
+
+    Returns:
+        np.ndarray: The ``(n_clusters, D)`` centroids.
+    """
+    rng = np.random.default_rng(seed)
+    matrix = np.asarray(matrix, dtype=np.float64)
+    centroids = matrix[rng.choice(len(matrix), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_to_centroids(matrix, centroids)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, matrix)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, np.newaxis]
+        # Restart empty clusters from random vectors
+        centroids[empty] = matrix[rng.choice(len(matrix), int(empty.sum()), replace=False)]
+    return centroids
+
+
+def _grow(buffer: np.ndarray, used: int, capacity: int) -> np.ndarray:
+    grown = np.empty((capacity,) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:used] = buffer[:used]
+    return grown
+
+
+class IVFIndex:
+    """
+    Approximate nearest neighbour index over face encodings (inverted file).
+
+    The gallery is split into ``n_lists`` cells by a k-means coarse quantizer. A query
+    only visits the ``n_probe`` cells whose centroids are the closest, then re-ranks the
+    encodings of those cells with exact distances. More probes give a better recall at
+    a higher latency; probing every cell is an exact search.
+
+    Examples:
+        >>> index = IVFIndex(n_lists=1024, n_probe=16)
+        >>> index.build(names, matrix)
+        >>> index.save(Path("encodings.ivf.npz"))
+        >>> matches = IVFIndex.load(Path("encodings.ivf.npz")).search(encoding, k=5)
+    """
+
+    def __init__(self, n_lists: int = 256, n_probe: int = 8, dim: int = 128):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.dim = dim
+        self.centroids = None
+        self.names = []
+        self._matrix = np.empty((0, dim))
+        self._count = 0
+        self._assignments = np.empty(0, dtype=np.int64)
+        # Row buffers of the inverted lists, each filled up to its size and grown geometrically
+        self._lists = None
+        self._list_sizes = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """
+        np.ndarray: The ``(N, D)`` indexed encodings, in insertion order.
+        """
+        return self._matrix[:self._count]
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, matrix: np.ndarray, iterations: int = 20, sample_size: int | None = None, seed: int = 0) -> None:
+        """
+        Learn the coarse quantizer.
+
+        Args:
+            matrix (np.ndarray): Representative ``(N, D)`` encodings.
+            iterations (int): Number of k-means rounds.
+            sample_size (int | None): Number of encodings used for training, 64 per list by default.
+            seed (int): Seed of the sampling and of the initial centroids.
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        self.n_lists = min(self.n_lists, len(matrix))
+        sample_size = sample_size or 64 * self.n_lists
+        if len(matrix) > sample_size:
+            rng = np.random.default_rng(seed)
+            matrix = matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))]
+        self.centroids = kmeans(matrix, self.n_lists, iterations=iterations, seed=seed)
+        if self._count:
+            # Encodings already inserted move to the cells of the new quantizer
+            self._assignments[:self._count] = assign_to_centroids(self.matrix, self.centroids)
+        self._lists = None
+
+    def add(self, names: list, matrix: np.ndarray) -> None:
+        """
+        Insert encodings into a trained index.
+
+        The encodings, their cells and the rows of each inverted list are kept in buffers that
+        grow geometrically, so inserting M encodings costs O(M) on top of assigning them to
+        their cells, whatever the size of the index.
+
+        Args:
+            names (list): The names of the encodings.
+            matrix (np.ndarray): The ``(M, D)`` encodings.
+        """
+        if not self.is_trained:
+            raise ValueError("The index must be trained before encodings are added.")
+        matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float64))
+        if len(names) != len(matrix):
+            raise ValueError("names and matrix must have the same length.")
+        self._build_lists()
+        start, end = self._count, self._count + len(matrix)
+        if end > len(self._matrix):
+            capacity = max(end, 2 * len(self._matrix))
+            self._matrix = _grow(self._matrix, start, capacity)
+            self._assignments = _grow(self._assignments, start, capacity)
+        assignments = assign_to_centroids(matrix, self.centroids)
+        self._matrix[start:end] = matrix
+        self._assignments[start:end] = assignments
+
+        order = np.argsort(assignments, kind='stable')
+        cells, firsts = np.unique(assignments[order], return_index=True)
+        for cell, rows in zip(cells, np.split(start + order, firsts[1:])):
+            size = self._list_sizes[cell]
+            if size + len(rows) > len(self._lists[cell]):
+                self._lists[cell] = _grow(self._lists[cell], size, max(size + len(rows), 2 * size))
+            self._lists[cell][size:size + len(rows)] = rows
+            self._list_sizes[cell] = size + len(rows)
+        self.names.extend(names)
+        self._count = end
+
+    def build(self, names: list, matrix: np.ndarray, iterations: int = 20) -> "IVFIndex":
+        """
+        Train the index on a gallery and insert all of it.
+
+        Args:
+            names (list): The gallery names.
+            matrix (np.ndarray): The ``(N, D)`` gallery encodings.
+            iterations (int): Number of k-means rounds.
+
+        Returns:
+            IVFIndex: The index itself.
+        """
+        self.train(matrix, iterations=iterations)
+        self.add(list(names), matrix)
+        return self
+
+    def _build_lists(self) -> None:
+        # Only needed after a load or a training, inserts then extend the lists in place
+        if self._lists is None:
+            assignments = self._assignments[:self._count]
+            order = np.argsort(assignments, kind='stable')
+            bounds = np.searchsorted(assignments[order], np.arange(self.n_lists + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]].copy() for i in range(self.n_lists)]
+            self._list_sizes = np.diff(bounds)
+
+    def _cell_rows(self, cell: int) -> np.ndarray:
+        return self._lists[cell][:self._list_sizes[cell]]
+
+    def search(self, encodings: np.ndarray, k: int = 5, tolerance: float = DEFAULT_TOLERANCE,
+               n_probe: int | None = None) -> list:
+        """
+        Find the approximate k closest identities of one or more encodings.
+
+        Args:
+            encodings (np.ndarray): One ``(128,)`` encoding or a ``(Q, 128)`` batch of encodings.
+            k (int): Number of candidates to return per encoding.
+            tolerance (float): Maximum distance for a candidate to be considered a match.
+            n_probe (int | None): Number of cells visited per query, defaults to ``self.n_probe``.
+
+        Returns:
+            list: The candidates sorted by increasing distance, as a list of ``Match`` for a single
+                encoding, or one such list per encoding for a batch.
+        """
+        encodings = np.asarray(encodings, dtype=np.float64)
+        single = encodings.ndim == 1
+        encodings = np.atleast_2d(encodings)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        self._build_lists()
+        matrix = self.matrix
+
+        with metrics.timer("distance"):
+            results = []
+            cell_distances = face_distance_matrix(self.centroids, encodings)
+            for encoding, distances in zip(encodings, cell_distances):
+                cells = np.argpartition(distances, n_probe - 1)[:n_probe]
+                rows = np.concatenate([self._cell_rows(cell) for cell in cells])
+                if len(rows) == 0:
+                    results.append([])
+                    continue
+                row_distances = face_distance_matrix(matrix[rows], encoding[np.newaxis, :])[0]
+                top = min(k, len(rows))
+                best = np.argpartition(row_distances, top - 1)[:top]
+                best = best[np.argsort(row_distances[best], kind='stable')]
+                results.append([
+                    Match(self.names[rows[i]], float(row_distances[i]), bool(row_distances[i] <= tolerance))
+                    for i in best
+                ])
+        return results[0] if single else results
+
+    def save(self, path: Path) -> None:
+        """
+        Persist the index to a ``.npz`` file.
+
+        Args:
+            path (Path): Path of the file to write, used as given, e.g. "encodings.ivf.npz".
+        """
+        # Through a file object, numpy does not append ".npz" to a path without it
+        with open(path, mode='wb') as file:
+            np.savez(
+                file,
+                centroids=self.centroids,
+                matrix=self.matrix,
+                assignments=self._assignments[:self._count],
+                names=np.array(self.names, dtype=str),
+                params=np.array([self.n_lists, self.n_probe, self.dim]),
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex":
+        """
+        Load an index saved with ``save``.
+
+        Args:
+            path (Path): Path of the ``.npz`` file.
+
+        Returns:
+            IVFIndex: The loaded index.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            n_lists, n_probe, dim = (int(value) for value in data["params"])
+            index = cls(n_lists=n_lists, n_probe=n_probe, dim=dim)
+            index.centroids = data["centroids"]
+            index._matrix = data["matrix"]
+            index._assignments = data["assignments"]
+            index.names = data["names"].tolist()
+        index._count = len(index._matrix)
+        return index
@@ -0,0 +1,66 @@
+"""
+Recall and latency of the IVF index against exact search on synthetic galleries.
+
+Recall@k is the share of the exact top-k that the index also returns.
+
+Usage:
+    python benchmarks/bench_ann_index.py --sizes 100000 1000000 --probes 1 4 16 64
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from ann_index import IVFIndex
+from gallery import search_gallery
+
+
+def synthetic_gallery(size: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """
+    Build clustered encodings with the scale of real face_recognition encodings.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=0.1, size=(clusters, 128))
+    return centers[rng.integers(0, clusters, size)] + rng.normal(scale=0.05, size=(size, 128))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--lists", type=int, default=None, help="defaults to 4 * sqrt(size)")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'gallery':>9} {'lists':>6} {'probe':>6} {'recall':>7} {'ann ms':>8} {'exact ms':>9} {'build s':>8}")
+    for size in args.sizes:
+        matrix = synthetic_gallery(size)
+        names = [str(i) for i in range(size)]
+        rng = np.random.default_rng(1)
+        queries = matrix[rng.integers(0, size, args.queries)] + rng.normal(scale=0.02, size=(args.queries, 128))
+
+        start = time.perf_counter()
+        exact = [search_gallery(matrix, names, query, k=args.k) for query in queries]
+        exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+        n_lists = args.lists or int(4 * np.sqrt(size))
+        start = time.perf_counter()
+        index = IVFIndex(n_lists=n_lists).build(names, matrix, iterations=10)
+        build_s = time.perf_counter() - start
+
+        for n_probe in args.probes:
+            start = time.perf_counter()
+            approximate = [index.search(query, k=args.k, n_probe=n_probe) for query in queries]
+            ann_ms = (time.perf_counter() - start) * 1000 / args.queries
+            recall = np.mean([
+                len({match.name for match in found} & {match.name for match in expected}) / len(expected)
+                for found, expected in zip(approximate, exact)
+            ])
+            print(f"{size:>9} {n_lists:>6} {n_probe:>6} {recall:>7.3f} {ann_ms:>8.2f} {exact_ms:>9.2f} {build_s:>8.1f}")
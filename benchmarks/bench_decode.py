@@ -0,0 +1,83 @@
+"""
+Decode benchmark of large phone photos: full size against OpenCV's reduced JPEG decodes.
+
+For each --images file and each reduction factor, the image is decoded from its bytes in a
+fresh interpreter, so the peak RSS of the process reflects that decode alone:
+- decode: median decode time over --repeat decodes;
+- peak RSS: peak resident memory of the process minus its RSS before the first decode;
+- shape: the size of the decoded image.
+The same is measured for the grayscale decode used by the quality gate with --grayscale.
+
+Usage:
+    python benchmarks/bench_decode.py --images test/test_images/ouail.jpg --repeat 10 --output decode.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from image_io import REDUCTION_FACTORS, image_size
+
+# Runs in the fresh interpreter: decodes an image with one flag and reports the time and memory
+DECODE_CODE = """
+import json, resource, sys, time
+import cv2
+import numpy as np
+
+path, flag, repeat = sys.argv[1], sys.argv[2], int(sys.argv[3])
+data = np.fromfile(path, dtype=np.uint8)
+scale = 1 if sys.platform == "darwin" else 1024
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+samples = []
+for _ in range(repeat):
+    start = time.perf_counter()
+    image = cv2.imdecode(data, getattr(cv2, flag))
+    samples.append(time.perf_counter() - start)
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+print(json.dumps({"decode_ms": float(np.median(samples) * 1000), "peak_rss_delta_mb": (after - before) / 2 ** 20,
+                  "shape": list(image.shape)}))
+"""
+
+
+def decode_flag(factor: int, grayscale: bool) -> str:
+    mode = "GRAYSCALE" if grayscale else "COLOR"
+    return f"IMREAD_{mode}" if factor == 1 else f"IMREAD_REDUCED_{mode}_{factor}"
+
+
+def measure(image_path: Path, flag: str, repeat: int) -> dict:
+    """
+    Decode an image in a new Python process.
+    """
+    output = subprocess.run([sys.executable, "-c", DECODE_CODE, str(image_path), flag, str(repeat)],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, nargs="+",
+                        default=[Path("test/test_images/ouail.jpg"), Path("test/test_images/multiple_persone.jpg")])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--grayscale", action="store_true", help="decode to one channel, as the quality gate does")
+    parser.add_argument("--output", type=Path, default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'image':>28} {'size':>11} {'factor':>6} {'decode ms':>10} {'peak RSS MB':>12} {'shape':>16}")
+    for image_path in args.images:
+        width, height = image_size(image_path) or (0, 0)
+        results[image_path.name] = {}
+        for factor in (1,) + tuple(sorted(REDUCTION_FACTORS)):
+            row = measure(image_path, decode_flag(factor, args.grayscale), args.repeat)
+            results[image_path.name][factor] = row
+            print(f"{image_path.name:>28} {f'{width}x{height}':>11} {factor:>6} {row['decode_ms']:>10.1f} "
+                  f"{row['peak_rss_delta_mb']:>12.1f} {'x'.join(map(str, row['shape'])):>16}")
+
+    if args.output:
+        args.output.write_text(json.dumps({"grayscale": args.grayscale, "results": results}, indent=2))
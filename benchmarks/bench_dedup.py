@@ -0,0 +1,107 @@
+"""
+All-pairs duplicate scan: naive pair loop against the blocked scan, with workers and pruning.
+
+A synthetic gallery of --size identities, --duplicates of them enrolled twice, is scanned for
+pairs closer than the tolerance:
+- naive: one ``np.linalg.norm`` per pair, timed on --naive-rows rows and extrapolated to the
+  N (N - 1) / 2 pairs of the gallery;
+- blocked: ``find_duplicates`` in one process and with 2, 4, ... --max-workers processes;
+- ann: ``find_duplicates(ann=True)``, reporting the recall of the planted duplicates;
+- new batch: a batch of --new-size encodings, a tenth of them already enrolled, checked
+  against the gallery only.
+The recall is the fraction of the planted duplicates found.
+Workers scan blocks in parallel, so their speedup is bounded by the number of cores of the
+machine (reported as "cores").
+
+Usage:
+    python benchmarks/bench_dedup.py --size 200000 --max-workers 8 --output dedup.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from dedup import DEFAULT_BLOCK_SIZE, find_duplicates
+from encoding_store import ENCODING_DIM
+from gallery import DEFAULT_TOLERANCE
+
+
+def naive_seconds(matrix: np.ndarray, rows: int, tolerance: float) -> float:
+    """
+    Time the pair loop on the first rows and extrapolate it to the whole gallery, in seconds.
+    """
+    start = time.perf_counter()
+    for a in range(rows):
+        for b in range(a + 1, rows):
+            np.linalg.norm(matrix[a] - matrix[b]) <= tolerance
+    per_pair = (time.perf_counter() - start) / (rows * (rows - 1) / 2)
+    return per_pair * len(matrix) * (len(matrix) - 1) / 2
+
+
+def planted_recall(output: Path, planted: set) -> float:
+    with open(output) as file:
+        next(file)
+        found = {tuple(line.split(",")[:2]) for line in file}
+    return len(planted & found) / len(planted)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--duplicates", type=int, default=500)
+    parser.add_argument("--new-size", type=int, default=1000)
+    parser.add_argument("--naive-rows", type=int, default=300)
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument("--max-workers", type=int, default=2)
+    parser.add_argument("--n-lists", type=int, default=256)
+    parser.add_argument("--n-probe", type=int, default=8)
+    parser.add_argument("--output", type=Path, default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(scale=0.09, size=(args.size, ENCODING_DIM))
+    originals = rng.choice(args.size - args.duplicates, args.duplicates, replace=False)
+    matrix[-args.duplicates:] = matrix[originals] + rng.normal(scale=0.01, size=(args.duplicates, ENCODING_DIM))
+    names = [f"voter_{i}.jpg" for i in range(args.size)]
+    planted = {(names[a], names[args.size - args.duplicates + i]) for i, a in enumerate(originals)}
+    gallery = (names, matrix)
+    # A tenth of the new batch are voters of the gallery enrolled again
+    new_matrix = rng.normal(scale=0.09, size=(args.new_size, ENCODING_DIM))
+    new_originals = rng.choice(args.size, args.new_size // 10, replace=False)
+    new_matrix[:len(new_originals)] = matrix[new_originals] + rng.normal(scale=0.01, size=(len(new_originals), ENCODING_DIM))
+    new = ([f"new_{i}.jpg" for i in range(args.new_size)], new_matrix)
+    planted_new = {(names[a], f"new_{i}.jpg") for i, a in enumerate(new_originals)}
+
+    results = {"cores": os.cpu_count(), "size": args.size,
+               "naive_seconds": naive_seconds(matrix, args.naive_rows, DEFAULT_TOLERANCE), "scans": {}}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output = Path(temp_dir) / "duplicates.csv"
+        runs = {}
+        workers = 1
+        while workers <= args.max_workers:
+            runs[f"blocked, {workers} workers"] = dict(block_size=args.block_size, workers=workers)
+            workers *= 2
+        runs["ann"] = dict(block_size=args.block_size, ann=True, n_lists=args.n_lists, n_probe=args.n_probe)
+        runs["new batch"] = dict(block_size=args.block_size, new=new)
+        for label, kwargs in runs.items():
+            stats = find_duplicates(gallery, output, **kwargs)
+            expected = planted_new if "new" in kwargs else planted
+            results["scans"][label] = {"seconds": stats["seconds"], "comparisons": stats["comparisons"],
+                                       "pairs": stats["pairs"], "recall": planted_recall(output, expected)}
+
+    print(f"cores: {results['cores']}, gallery: {args.size}, naive loop: {results['naive_seconds']:.0f} s (extrapolated)")
+    print(f"{'scan':>20} {'seconds':>9} {'speedup':>9} {'comparisons':>13} {'pairs':>7} {'recall':>7}")
+    for label, scan in results["scans"].items():
+        print(f"{label:>20} {scan['seconds']:>9.2f} {results['naive_seconds'] / scan['seconds']:>9.0f} "
+              f"{scan['comparisons']:>13} {scan['pairs']:>7} {scan['recall']:>7.3f}")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
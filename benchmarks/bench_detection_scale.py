@@ -0,0 +1,49 @@
+"""
+Latency and match-distance drift of get_image_encoding at several detection scales.
+
+The distance is measured between the encoding computed at each scale and the one computed
+with detection on the full image, so 0.0 means the scale did not change the encoding.
+
+Usage:
+    python benchmarks/bench_detection_scale.py --folder images --scales 1.0 0.5 0.25 0.125
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from encoding_image import get_image_encoding
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", default="images")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.5, 0.25, 0.125])
+    parser.add_argument("--model", default="hog", choices=["hog", "cnn"])
+    parser.add_argument("--num-jitters", type=int, default=1)
+    parser.add_argument("--landmark-model", default="small", choices=["small", "large"])
+    args = parser.parse_args()
+
+    print(f"{'image':>25} {'scale':>6} {'ms':>9} {'drift':>8}")
+    for image_name in sorted(os.listdir(args.folder)):
+        image_path = Path(args.folder) / image_name
+        reference = None
+        for scale in sorted(args.scales, reverse=True):
+            start = time.perf_counter()
+            encoding = get_image_encoding(image_path, detection_scale=scale, model=args.model,
+                                          num_jitters=args.num_jitters, landmark_model=args.landmark_model)
+            elapsed = (time.perf_counter() - start) * 1000
+            if reference is None:
+                reference = encoding
+            if encoding is None or reference is None:
+                drift = "no face"
+            else:
+                drift = f"{np.linalg.norm(encoding - reference):.4f}"
+            print(f"{image_name:>25} {scale:>6} {elapsed:>9.1f} {drift:>8}")
@@ -0,0 +1,106 @@
+"""
+Quality gate latency and decisions: features searched in the whole face against region-restricted,
+size-bounded feature searches.
+
+Every image of --folder is checked by both gates, --repeat times, after being resized by --scale
+(0.5 is what the capture loop checks). The report gives the median latency of the face detection
+both gates share, the median time each gate spends in the eye, mouth and nose cascades of an image
+with one face (stopping at the first failed check, as the gate does), the decision of each gate,
+and the expected decision for the images labelled in LABELS (the images of the take_image tests).
+Changed decisions are flagged.
+
+Usage:
+    python benchmarks/bench_gate_regions.py --folder test/test_images --repeat 5 --scale 0.5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from take_image import FEATURE_CHECKS, FaceQualityGate
+
+# Expected decisions: one person showing a face, two eyes, a nose and a mouth
+LABELS = {
+    "image_with_all_requirements.jpg": True,
+    "ouail.jpg": True,
+    "cat.jpg": False,
+    "hamass.jpg": False,
+    "multiple_persone.jpg": False,
+    "unknown.jpg": False,
+}
+
+
+def feature_stage_ms(gate: FaceQualityGate, image: np.ndarray, repeat: int) -> tuple:
+    """
+    Median time of the face detection, and of the feature cascades run on its face as the gate runs them.
+    """
+    face_cascade, eye_cascade, nose_cascade, mouth_cascade = gate.cascades()
+    cascades = {"eye": eye_cascade, "nose": nose_cascade, "mouth": mouth_cascade}
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    face_samples = []
+    feature_samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+        face_samples.append(time.perf_counter() - start)
+        if len(faces) != 1:
+            continue
+        start = time.perf_counter()
+        for feature, expected in FEATURE_CHECKS:
+            if len(gate._detect_feature(gray, tuple(faces[0]), feature, cascades[feature])) != expected:
+                break
+        feature_samples.append(time.perf_counter() - start)
+    features_ms = float(np.median(feature_samples) * 1000) if feature_samples else None
+    return float(np.median(face_samples) * 1000), features_ms
+
+
+def fmt(value: float | None) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", type=Path, default=Path("test/test_images"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--output", type=Path, default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    whole_face = FaceQualityGate(restrict_regions=False)
+    regions = FaceQualityGate(restrict_regions=True)
+    results = {}
+    print(f"{'image':>35} {'face ms':>8} {'features ms: whole':>19} {'regions':>8} "
+          f"{'accepted: whole':>16} {'regions':>8} {'label':>6}")
+    for image_path in sorted(args.folder.iterdir()):
+        image = cv2.imread(str(image_path))
+        if image is None:
+            continue
+        if args.scale != 1.0:
+            image = cv2.resize(image, None, fx=args.scale, fy=args.scale, interpolation=cv2.INTER_AREA)
+        face_ms, whole_ms = feature_stage_ms(whole_face, image, args.repeat)
+        _, regions_ms = feature_stage_ms(regions, image, args.repeat)
+        row = {"face_ms": face_ms, "whole_face_features_ms": whole_ms, "regions_features_ms": regions_ms,
+               "whole_face": whole_face.check(image), "regions": regions.check(image), "label": LABELS.get(image_path.name)}
+        results[image_path.name] = row
+        flag = "  <- changed" if row["whole_face"] != row["regions"] else ""
+        print(f"{image_path.name:>35} {face_ms:>8.1f} {fmt(whole_ms):>19} {fmt(regions_ms):>8} "
+              f"{str(row['whole_face']):>16} {str(row['regions']):>8} {str(row['label']):>6}{flag}")
+
+    labelled = [row for row in results.values() if row["label"] is not None]
+    for gate in ("whole_face", "regions"):
+        correct = sum(row[gate] == row["label"] for row in labelled)
+        features_ms = sum(row[f"{gate}_features_ms"] or 0.0 for row in results.values())
+        print(f"{gate}: {correct}/{len(labelled)} labelled decisions correct, "
+              f"{features_ms:.1f} ms in the feature cascades for all images")
+
+    if args.output:
+        args.output.write_text(json.dumps({"scale": args.scale, "results": results}, indent=2))
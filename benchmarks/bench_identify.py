@@ -0,0 +1,68 @@
+"""
+Scaling benchmark for 1:N identification over synthetic galleries.
+
+Usage:
+    python benchmarks/bench_identify.py --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from gallery import DEFAULT_CHUNK_SIZE, search_gallery
+
+
+def synthetic_gallery(size: int, seed: int = 0) -> np.ndarray:
+    """
+    Build a gallery of random encodings with the scale of real face_recognition encodings.
+    """
+    rng = np.random.default_rng(seed)
+    return rng.normal(scale=0.1, size=(size, 128))
+
+
+def bench_identify(size: int, k: int, chunk_size: int, repeat: int) -> dict:
+    matrix = synthetic_gallery(size)
+    names = [str(i) for i in range(size)]
+    rng = np.random.default_rng(1)
+    queries = matrix[rng.integers(0, size, repeat)] + rng.normal(scale=0.01, size=(repeat, 128))
+
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        search_gallery(matrix, names, query, k=k, chunk_size=chunk_size)
+        timings.append(time.perf_counter() - start)
+
+    # Reference: the old approach, one Python-level distance per gallery row
+    loop_rows = min(size, 10000)
+    start = time.perf_counter()
+    for row in matrix[:loop_rows]:
+        np.linalg.norm(row - queries[0])
+    loop_time = (time.perf_counter() - start) * size / loop_rows
+
+    return {
+        "size": size,
+        "median_ms": float(np.median(timings)) * 1000,
+        "rows_per_s": size / float(np.median(timings)),
+        "python_loop_ms": loop_time * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'gallery':>10} {'median ms':>10} {'rows/s':>14} {'python loop ms':>15}")
+    for size in args.sizes:
+        result = bench_identify(size, args.k, args.chunk_size, args.repeat)
+        print(f"{result['size']:>10} {result['median_ms']:>10.2f} {result['rows_per_s']:>14.0f} "
+              f"{result['python_loop_ms']:>15.1f}")
@@ -0,0 +1,171 @@
+"""
+Per-stage benchmark of the verification pipeline, with JSON output.
+
+Image stages run on every image of --images: decode, cascade quality gate, face
+detection, landmarking and encoding. The CSV stages look names up in --csv. Gallery stages run on synthetic galleries of
+each --sizes: cold load of the binary store, name lookup and 1:N distance computation.
+Each stage reports count, mean and p50/p90/p99 latencies in milliseconds.
+
+Usage:
+    python benchmarks/bench_pipeline.py --sizes 1000 10000 100000 1000000 --output bench.json
+    python benchmarks/bench_pipeline.py --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from encoding_store import EncodingStore
+from gallery import Gallery, gallery_cache, load_gallery, search_gallery
+from take_image import quality_gate
+
+
+def summarize(samples: list) -> dict:
+    """
+    Summarize latency samples given in seconds.
+    """
+    milliseconds = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": float(milliseconds.mean()),
+        "p50_ms": float(np.percentile(milliseconds, 50)),
+        "p90_ms": float(np.percentile(milliseconds, 90)),
+        "p99_ms": float(np.percentile(milliseconds, 99)),
+    }
+
+
+def timed(samples: list, function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def bench_images(image_folder: Path, repeat: int) -> dict:
+    import dlib
+    import face_recognition
+    from face_recognition import api as face_recognition_api
+
+    stages = {name: [] for name in ("decode", "gate", "detect", "landmark", "encode")}
+    for image_name in sorted(os.listdir(image_folder)):
+        image_path = str(image_folder / image_name)
+        for _ in range(repeat):
+            image = timed(stages["decode"], cv2.imread, image_path)
+            if image is None:
+                break
+            timed(stages["gate"], quality_gate.check, image)
+            rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            locations = timed(stages["detect"], face_recognition.face_locations, rgb)
+            if not locations:
+                continue
+            top, right, bottom, left = locations[0]
+            shape = timed(stages["landmark"], face_recognition_api.pose_predictor_5_point,
+                          rgb, dlib.rectangle(left, top, right, bottom))
+            timed(stages["encode"], face_recognition_api.face_encoder.compute_face_descriptor, rgb, shape, 1)
+    return {name: summarize(samples) for name, samples in stages.items() if samples}
+
+
+def load_store_gallery(root: Path) -> Gallery:
+    """
+    Cold load: open the binary store and copy it into an in-memory gallery.
+    """
+    store = EncodingStore(root)
+    return Gallery(store.names, store.matrix)
+
+
+def bench_gallery(size: int, queries: int, k: int) -> dict:
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(scale=0.1, size=(size, 128))
+    names = [f"voter_{i}.jpg" for i in range(size)]
+    stages = {name: [] for name in ("load", "lookup", "distance")}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = EncodingStore(Path(temp_dir) / "gallery.store")
+        store.write_matrix(names, matrix)
+        del matrix
+        for _ in range(3):
+            gallery = timed(stages["load"], load_store_gallery, store.root)
+        for row in rng.integers(0, size, queries):
+            encoding = timed(stages["lookup"], gallery.get, names[row])
+            timed(stages["distance"], search_gallery, gallery.matrix, gallery.names, encoding, k=k)
+    return {name: summarize(samples) for name, samples in stages.items()}
+
+
+def bench_csv(csv_filename: Path, queries: int) -> dict:
+    """
+    Lookup by name in a CSV gallery, cold (first load) and through the process-wide cache.
+    """
+    stages = {"csv_cold_load": [], "csv_lookup": []}
+    gallery_cache.clear()
+    names = timed(stages["csv_cold_load"], load_gallery, csv_filename).names
+    for i in range(queries):
+        gallery = timed(stages["csv_lookup"], load_gallery, csv_filename)
+        gallery.get(names[i % len(names)])
+    return {name: summarize(samples) for name, samples in stages.items()}
+
+
+def compare(old_path: Path, new_path: Path) -> None:
+    """
+    Print the p50 change of every stage between two result files.
+    """
+    with open(old_path) as file:
+        old = json.load(file)["results"]
+    with open(new_path) as file:
+        new = json.load(file)["results"]
+    print(f"{'stage':>32} {'old p50 ms':>11} {'new p50 ms':>11} {'change':>8}")
+    for group in new:
+        for stage, summary in new[group].items():
+            if stage not in old.get(group, {}):
+                continue
+            before = old[group][stage]["p50_ms"]
+            after = summary["p50_ms"]
+            change = (after - before) / before * 100 if before else 0.0
+            print(f"{group + '/' + stage:>32} {before:>11.3f} {after:>11.3f} {change:>+7.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, default=Path("images"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--csv", type=Path, default=Path("encodings.csv"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--skip-images", action="store_true", help="only run the gallery stages")
+    parser.add_argument("--output", type=Path, default=None, help="write the JSON report to this file")
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("OLD", "NEW"), help="compare two JSON reports")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    results = {}
+    if not args.skip_images:
+        results["images"] = bench_images(args.images, args.repeat)
+    results["csv"] = bench_csv(args.csv, args.queries)
+    for size in args.sizes:
+        results[f"gallery_{size}"] = bench_gallery(size, args.queries, args.k)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    print(output)
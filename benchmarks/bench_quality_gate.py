@@ -0,0 +1,61 @@
+"""
+Per-image latency of the cascade quality gate, before and after loading the cascades once.
+
+Usage:
+    python benchmarks/bench_quality_gate.py --folder test/test_images --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from take_image import FaceQualityGate
+
+
+def check_with_fresh_cascades(image: np.ndarray) -> bool:
+    """
+    The previous behaviour: every check parses the four cascade XML files again.
+    """
+    return FaceQualityGate().check(image)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", default="test/test_images")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    images = []
+    for image_name in sorted(os.listdir(args.folder)):
+        image = cv2.imread(os.path.join(args.folder, image_name))
+        if image is not None:
+            images.append((image_name, image))
+
+    gate = FaceQualityGate()
+    start = time.perf_counter()
+    gate.is_loaded()
+    print(f"Cascade loading: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    print(f"{'image':>35} {'before ms':>10} {'after ms':>10}")
+    for image_name, image in images:
+        before = []
+        after = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            check_with_fresh_cascades(image)
+            before.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            gate.check(image)
+            after.append(time.perf_counter() - start)
+        print(f"{image_name:>35} {np.median(before) * 1000:>10.1f} {np.median(after) * 1000:>10.1f}")
+
+    start = time.perf_counter()
+    gate.check_batch([image for _, image in images])
+    print(f"Batch of {len(images)} images: {(time.perf_counter() - start) * 1000 / len(images):.1f} ms per image")
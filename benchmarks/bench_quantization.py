@@ -0,0 +1,110 @@
+"""
+Accuracy and memory report of the compact gallery precisions.
+
+Every query is compared with every gallery row in float64 and in each compact precision.
+The report gives the bytes per encoding, the distance errors, the number of match decisions
+at --tolerance that flip compared with float64, and how often the closest identity changes.
+The bundled data compares the encodings of --csv with each other. The synthetic data has
+--size identities, and probes of the first --queries identities with noise around the tolerance.
+
+Usage:
+    python benchmarks/bench_quantization.py --csv encodings.csv --size 100000 --output quantization.json
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from encoding_store import ENCODING_DIM, read_encodings_csv
+from gallery import DEFAULT_TOLERANCE, PRECISIONS, QuantizedMatrix, face_distance_matrix
+
+
+def accuracy_report(matrix: np.ndarray, queries: np.ndarray, tolerance: float, query_chunk: int = 256) -> dict:
+    """
+    Compare the decisions of every compact precision with float64.
+    """
+    report = {}
+    for precision in PRECISIONS[1:]:
+        quantized = QuantizedMatrix.from_matrix(matrix, precision)
+        errors = []
+        flips = 0
+        top1_changes = 0
+        for start in range(0, len(queries), query_chunk):
+            chunk = queries[start:start + query_chunk]
+            exact = face_distance_matrix(matrix, chunk)
+            approximate = quantized.distances(chunk)
+            errors.append(np.abs(approximate - exact).ravel())
+            flips += int(np.count_nonzero((exact <= tolerance) != (approximate <= tolerance)))
+            top1_changes += int(np.count_nonzero(exact.argmin(axis=1) != approximate.argmin(axis=1)))
+        errors = np.concatenate(errors)
+        pairs = len(matrix) * len(queries)
+        report[precision] = {
+            "bytes_per_encoding": quantized.nbytes / max(len(matrix), 1),
+            "max_abs_error": float(errors.max()),
+            "mean_abs_error": float(errors.mean()),
+            "decision_flips": flips,
+            "pairs": pairs,
+            "flip_rate": flips / pairs,
+            "top1_changes": top1_changes,
+        }
+    report["float64"] = {"bytes_per_encoding": matrix.shape[1] * 8.0}
+    return report
+
+
+def bundled_data(csv_filename: Path) -> np.ndarray:
+    encodings = read_encodings_csv(csv_filename)
+    return np.stack([encoding for encoding in encodings.values() if encoding.shape == (ENCODING_DIM,)])
+
+
+def synthetic_data(size: int, queries: int, tolerance: float, seed: int = 0) -> tuple:
+    """
+    Identities spread like face encodings, and probes whose distance to their identity is close to the tolerance.
+    """
+    rng = np.random.default_rng(seed)
+    matrix = rng.normal(scale=0.09, size=(size, ENCODING_DIM))
+    # A noise of sigma per dimension moves a probe by about sigma * sqrt(128)
+    sigma = rng.uniform(0.7, 1.3, size=(queries, 1)) * tolerance / np.sqrt(ENCODING_DIM)
+    probes = matrix[:queries] + rng.normal(size=(queries, ENCODING_DIM)) * sigma
+    return matrix, probes
+
+
+def print_report(title: str, report: dict) -> None:
+    print(title)
+    print(f"{'precision':>10} {'bytes/enc':>10} {'max err':>9} {'mean err':>9} {'flips':>8} {'flip rate':>10} {'top1 chg':>9}")
+    for precision in PRECISIONS:
+        row = report[precision]
+        if precision == "float64":
+            print(f"{precision:>10} {row['bytes_per_encoding']:>10.0f} {'-':>9} {'-':>9} {'-':>8} {'-':>10} {'-':>9}")
+            continue
+        print(f"{precision:>10} {row['bytes_per_encoding']:>10.0f} {row['max_abs_error']:>9.2e} "
+              f"{row['mean_abs_error']:>9.2e} {row['decision_flips']:>8} {row['flip_rate']:>10.2e} "
+              f"{row['top1_changes']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", type=Path, default=Path("encodings.csv"))
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--output", type=Path, default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    results = {}
+    if args.csv.exists():
+        bundled = bundled_data(args.csv)
+        results["bundled"] = accuracy_report(bundled, bundled, args.tolerance)
+        print_report(f"Bundled data: {len(bundled)} encodings of {args.csv}, all pairs", results["bundled"])
+    matrix, probes = synthetic_data(args.size, args.queries, args.tolerance)
+    results["synthetic"] = accuracy_report(matrix, probes, args.tolerance)
+    print_report(f"Synthetic data: {args.size} identities, {args.queries} probes", results["synthetic"])
+
+    if args.output:
+        args.output.write_text(json.dumps({"tolerance": args.tolerance, "results": results}, indent=2))
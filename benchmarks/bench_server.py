@@ -0,0 +1,69 @@
+"""
+Load test for the verification server with the bundled client.
+
+Start the server first (python server.py --csv encodings.csv), then:
+
+Usage:
+    python benchmarks/bench_server.py --endpoint verify --image images/unknown.jpg --voter-id ouail.jpg \
+        --requests 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from server import request
+
+
+async def load_test(args) -> None:
+    image = base64.b64encode(Path(args.image).read_bytes()).decode()
+    payload = {"image": image}
+    if args.endpoint == "verify":
+        payload["voter_id"] = args.voter_id
+    else:
+        payload["k"] = args.k
+
+    latencies = []
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one_request():
+        async with semaphore:
+            start = time.perf_counter()
+            status, _ = await request(args.host, args.port, "POST", f"/{args.endpoint}", payload)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one_request() for _ in range(args.requests)])
+    elapsed = time.perf_counter() - start
+
+    milliseconds = np.asarray(latencies) * 1000
+    print(f"{args.requests} requests in {elapsed:.2f}s ({args.requests / elapsed:.1f} requests/sec)")
+    print(f"latency ms: p50 {np.percentile(milliseconds, 50):.1f}, p90 {np.percentile(milliseconds, 90):.1f}, "
+          f"p99 {np.percentile(milliseconds, 99):.1f}")
+    print("status codes:", dict(statuses))
+    print("server stats:", (await request(args.host, args.port, "GET", "/stats"))[1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--endpoint", choices=["verify", "identify"], default="verify")
+    parser.add_argument("--image", default="images/unknown.jpg")
+    parser.add_argument("--voter-id", default="ouail.jpg")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(load_test(parser.parse_args()))
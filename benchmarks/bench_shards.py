@@ -0,0 +1,74 @@
+"""
+Scatter-gather throughput of a sharded gallery against the single-process search.
+
+A synthetic gallery of --size identities is split into 1, 2, 4, ... --max-shards shards,
+each served by its own worker process, and --queries batches of --batch encodings are
+searched through the coordinator. The report gives the queries per second, the speedup over
+one shard and the scaling efficiency (speedup / shards). Shards scan in parallel, so the
+speedup is bounded by the number of cores of the machine (reported as "cores").
+
+Usage:
+    python benchmarks/bench_shards.py --size 1000000 --max-shards 8 --output shards.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from encoding_store import ENCODING_DIM
+from gallery import search_gallery
+from sharded_gallery import ShardedGallery
+
+
+def queries_per_second(search, queries: np.ndarray, batch: int) -> float:
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch):
+        search(queries[offset:offset + batch])
+    return len(queries) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--max-shards", type=int, default=4)
+    parser.add_argument("--output", type=Path, default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(scale=0.09, size=(args.size, ENCODING_DIM))
+    names = [f"voter_{i}.jpg" for i in range(args.size)]
+    queries = matrix[rng.choice(args.size, args.queries)] + rng.normal(scale=0.01, size=(args.queries, ENCODING_DIM))
+
+    results = {"cores": os.cpu_count(), "size": args.size,
+               "single_process_qps": queries_per_second(lambda batch: search_gallery(matrix, names, batch, k=args.k),
+                                                        queries, args.batch),
+               "shards": {}}
+    print(f"cores: {results['cores']}, gallery: {args.size}, single process: {results['single_process_qps']:.1f} queries/sec")
+    print(f"{'shards':>6} {'queries/sec':>12} {'speedup':>8} {'efficiency':>10}")
+    shard_count = 1
+    while shard_count <= args.max_shards:
+        bounds = np.linspace(0, args.size, shard_count + 1).astype(int)
+        shards = {f"shard_{i}": (names[bounds[i]:bounds[i + 1]], matrix[bounds[i]:bounds[i + 1]])
+                  for i in range(shard_count)}
+        with ShardedGallery(shards, timeout=60.0) as gallery:
+            gallery.search(queries[:1], k=args.k)
+            qps = queries_per_second(lambda batch: gallery.search(batch, k=args.k), queries, args.batch)
+        speedup = qps / results["shards"]["1"]["queries_per_sec"] if shard_count > 1 else 1.0
+        results["shards"][str(shard_count)] = {"queries_per_sec": qps, "speedup": speedup,
+                                               "efficiency": speedup / shard_count}
+        print(f"{shard_count:>6} {qps:>12.1f} {speedup:>8.2f} {speedup / shard_count:>10.2f}")
+        shard_count *= 2
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
@@ -0,0 +1,94 @@
+"""
+Startup benchmark: import time, first-call latency and warm worker job latency.
+
+Each import and first call runs in a fresh interpreter, as a CLI invocation would:
+- import: time to import a module, face_recognition being the eager cost it used to pay;
+- first lookup: import encoding_image and read one encoding from --csv;
+- first encode: import encoding_image and encode --image.
+Job latency compares a job run in a freshly spawned worker, which loads the models, with a
+job run in a fresh worker forked from the warm fork server of ``warm_executor``.
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 5 --output startup.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from encoding_image import get_image_encoding, warm_executor
+
+
+def time_in_fresh_interpreter(setup: str, statement: str) -> float:
+    """
+    Time a statement in a new Python process, in seconds.
+    """
+    code = "\n".join([f"import sys, time; sys.path.append({parent_dir!r})", setup,
+                      "start = time.perf_counter()", statement, "print(time.perf_counter() - start)"])
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def median_ms(samples: list) -> float:
+    return float(np.median(samples) * 1000)
+
+
+def job_latency(executor: ProcessPoolExecutor, image_path: Path, repeat: int) -> float:
+    """
+    Median latency of jobs each run by a new worker of the pool, in milliseconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        executor.submit(get_image_encoding, image_path).result()
+        samples.append(time.perf_counter() - start)
+    return median_ms(samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", type=Path, default=Path("encodings.csv"))
+    parser.add_argument("--image", type=Path, default=Path("images/messi.jpg"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    results = {"import_ms": {}, "first_call_ms": {}, "job_ms": {}}
+    for module in ("gallery", "encoding_image", "compare_image", "face_recognition"):
+        samples = [time_in_fresh_interpreter("", f"import {module}") for _ in range(args.repeat)]
+        results["import_ms"][module] = median_ms(samples)
+
+    setup = "from pathlib import Path"
+    name = next(iter(__import__("encoding_store").read_encodings_csv(args.csv)))
+    lookup = (f"import encoding_image; "
+              f"encoding_image.get_image_encoding_from_csv({name!r}, Path({str(args.csv)!r}))")
+    encode = f"import encoding_image; encoding_image.get_image_encoding(Path({str(args.image)!r}))"
+    results["first_call_ms"]["lookup"] = median_ms([time_in_fresh_interpreter(setup, lookup)
+                                                    for _ in range(args.repeat)])
+    results["first_call_ms"]["encode"] = median_ms([time_in_fresh_interpreter(setup, encode)
+                                                    for _ in range(args.repeat)])
+
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"), max_tasks_per_child=1) as cold:
+        results["job_ms"]["spawned_worker"] = job_latency(cold, args.image, args.repeat)
+    with warm_executor(1, max_tasks_per_child=1) as warm:
+        # The first job starts the fork server, which loads the models once
+        warm.submit(get_image_encoding, args.image).result()
+        results["job_ms"]["warm_forked_worker"] = job_latency(warm, args.image, args.repeat)
+
+    for group, values in results.items():
+        print(group)
+        for key, value in values.items():
+            print(f"{key:>24} {value:>10.1f}")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
@@ -0,0 +1,74 @@
+"""
+End-to-end latency of a verification: the two-pass flow against the single-pass ``verify``.
+
+The two-pass flow checks the image with ``detect_person_with_face_eyes_nose_mouth`` and then
+compares it with ``compare_face_use_csv_encoding``: the image is decoded twice and the face is
+searched twice, by the Haar cascade and by dlib on the whole image. ``verify`` decodes once and
+encodes the face box of the gate. It is also run with --max-side and with the box refined by dlib.
+Each run reports the median latency of every stage over --repeat runs, in milliseconds.
+
+Usage:
+    python benchmarks/bench_verify.py --image test/test_images/ouail.jpg --voter ouail.jpg --csv test/test_encodings.csv
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from compare_image import compare_face_use_csv_encoding
+from encoding_image import load_face_models
+from take_image import detect_person_with_face_eyes_nose_mouth, verify
+
+
+def two_pass(image_path: Path, voter_id: str, csv_filename: Path) -> dict:
+    timings = {}
+    start = time.perf_counter()
+    accepted = detect_person_with_face_eyes_nose_mouth(image_path)
+    timings["gate"] = (time.perf_counter() - start) * 1000
+    if accepted:
+        stage = time.perf_counter()
+        compare_face_use_csv_encoding(voter_id, image_path, csv_filename)
+        timings["encode+compare"] = (time.perf_counter() - stage) * 1000
+    timings["total"] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def median_timings(runs: list) -> dict:
+    return {stage: float(np.median([run[stage] for run in runs if stage in run])) for stage in runs[-1]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", type=Path, default=Path("test/test_images/ouail.jpg"))
+    parser.add_argument("--voter", default="ouail.jpg")
+    parser.add_argument("--csv", type=Path, default=Path("test/test_encodings.csv"))
+    parser.add_argument("--max-side", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    load_face_models()
+    flows = {
+        "two_pass": lambda: two_pass(args.image, args.voter, args.csv),
+        "verify": lambda: verify(args.image, args.voter, args.csv).timings,
+        "verify_refine": lambda: verify(args.image, args.voter, args.csv, refine=True).timings,
+        f"verify_max_side_{args.max_side}": lambda: verify(args.image, args.voter, args.csv, max_side=args.max_side).timings,
+    }
+    report = verify(args.image, args.voter, args.csv)
+    print(f"verify: match={report.match} distance={report.distance} reason={report.reason}")
+
+    results = {}
+    for name, flow in flows.items():
+        results[name] = median_timings([flow() for _ in range(args.repeat)])
+        print(f"{name:>24} " + " ".join(f"{stage}={value:.1f}" for stage, value in results[name].items()))
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
@@ -0,0 +1,123 @@
+"""
+Video screening: encoding every face of every frame against tracking faces and encoding each track once.
+
+Both modes run on the frames of --video, or of a synthetic video of --frames frames with two
+people moving across it (test images, --size pixels wide):
+- per frame: ``encode_faces`` on every processed frame, then one gallery search per face;
+- tracked: ``VideoScreener``, with 1 and --encodes-per-track encodes per track.
+Each mode runs with every frame processed and with --sample-every. The report gives the
+processed frames per second, the number of encodes and the encodes saved by tracking.
+
+Usage:
+    python benchmarks/bench_video.py --video footage/station_12.mp4 --sample-every 3 --output video.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from encoding_image import encode_faces, get_image_encoding
+from gallery import as_gallery, search_gallery
+from video import VideoScreener
+
+
+def write_synthetic_video(video_path: Path, frames: int, size: int) -> None:
+    """
+    Write a video of two faces from the test images moving from left to right.
+    """
+    height = size * 9 // 16
+    messi = cv2.imread("test/test_images/messi.jpg")
+    ouail = cv2.imread("test/test_images/ouail.jpg")
+    ouail = cv2.resize(ouail, None, fx=messi.shape[0] / ouail.shape[0], fy=messi.shape[0] / ouail.shape[0],
+                       interpolation=cv2.INTER_AREA)
+    writer = cv2.VideoWriter(str(video_path), cv2.VideoWriter_fourcc(*'MJPG'), 30, (size, height))
+    travel = size // 2 - max(messi.shape[1], ouail.shape[1])
+    for frame_index in range(frames):
+        frame = np.full((height, size, 3), 127, dtype=np.uint8)
+        x = travel * frame_index // max(1, frames - 1)
+        frame[20:20 + messi.shape[0], x:x + messi.shape[1]] = messi
+        frame[20:20 + ouail.shape[0], size // 2 + x:size // 2 + x + ouail.shape[1]] = ouail
+        writer.write(frame)
+    writer.release()
+
+
+def per_frame(video_path: Path, names: list, matrix: np.ndarray, sample_every: int, detection_scale: float) -> dict:
+    """
+    Encode and search every face of every processed frame.
+    """
+    capture = cv2.VideoCapture(str(video_path))
+    frames = encodes = 0
+    start = time.perf_counter()
+    frame_index = 0
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        if frame_index % sample_every == 0:
+            _, encodings = encode_faces(frame, detection_scale)
+            if len(encodings):
+                search_gallery(matrix, names, encodings, k=1)
+            frames += 1
+            encodes += len(encodings)
+        frame_index += 1
+    capture.release()
+    seconds = time.perf_counter() - start
+    return {"fps": frames / seconds, "frames_processed": frames, "encodes": encodes, "encodes_saved": 0}
+
+
+def tracked(video_path: Path, gallery: tuple, sample_every: int, detection_scale: float, encodes_per_track: int) -> dict:
+    screener = VideoScreener(gallery, sample_every=sample_every, detection_scale=detection_scale,
+                             encodes_per_track=encodes_per_track)
+    identities = list(screener.process(video_path))
+    stats = screener.stats()
+    return {"fps": stats["fps"], "frames_processed": stats["frames_processed"], "encodes": stats["encodes"],
+            "encodes_saved": stats["encodes_saved"], "tracks": len(identities)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", type=Path, default=None, help="video file, a synthetic video by default")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--size", type=int, default=640)
+    parser.add_argument("--csv", type=Path, default=None, help="gallery, the two test faces by default")
+    parser.add_argument("--sample-every", type=int, default=3)
+    parser.add_argument("--detection-scale", type=float, default=1.0)
+    parser.add_argument("--encodes-per-track", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.csv is not None:
+        gallery = as_gallery(args.csv)
+    else:
+        gallery = (["messi.jpg", "ouail.jpg"], np.array([get_image_encoding(Path("test/test_images/messi.jpg")),
+                                                         get_image_encoding(Path("test/test_images/ouail.jpg"))]))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video_path = args.video
+        if video_path is None:
+            video_path = Path(temp_dir) / "synthetic.avi"
+            write_synthetic_video(video_path, args.frames, args.size)
+        for sample_every in sorted({1, args.sample_every}):
+            suffix = f", every {sample_every}"
+            results["per frame" + suffix] = per_frame(video_path, *gallery, sample_every, args.detection_scale)
+            results["tracked" + suffix] = tracked(video_path, gallery, sample_every, args.detection_scale, 1)
+            results[f"tracked x{args.encodes_per_track}" + suffix] = tracked(video_path, gallery, sample_every,
+                                                                           args.detection_scale, args.encodes_per_track)
+
+    print(f"{'mode':>24} {'frames/sec':>11} {'frames':>7} {'encodes':>8} {'saved':>6}")
+    for label, result in results.items():
+        print(f"{label:>24} {result['fps']:>11.1f} {result['frames_processed']:>7} {result['encodes']:>8} "
+              f"{result['encodes_saved']:>6}")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
@@ -1,16 +1,44 @@
-import face_recognition
+import logging
 from pathlib import Path
+from typing import NamedTuple
 
-from encoding_image import get_image_encoding,get_image_encoding_from_csv
+import numpy as np
 
+from encoding_cache import EncodingCache
+from encoding_image import STATUS_OK, get_image_encoding, get_image_encoding_from_csv, get_image_encodings_batch
+from encoding_image import get_image_face_encodings
+from gallery import DEFAULT_CHUNK_SIZE, DEFAULT_TOLERANCE, as_gallery, load_gallery, search_gallery
+from sharded_gallery import ShardedGallery
 
-def compare_faces(known_image_path: Path, unknown_image_path: Path) -> bool | None:
+logger = logging.getLogger(__name__)
+
+
+class FaceIdentity(NamedTuple):
+    """
+    One face of an image and its closest gallery identities.
+    """
+    box: tuple
+    matches: list
+
+
+class Verification(NamedTuple):
+    """
+    The outcome of a 1:1 verification against the enrolled encoding of a voter.
+    """
+    voter_id: str
+    match: bool
+    distance: float
+
+
+def compare_faces(known_image_path: Path, unknown_image_path: Path, cache: EncodingCache | None = None) -> bool | None:
     """
     Compare faces in two images.
 
     Args:
         known_image_path (Path): Path to the image file containing the known face.
         unknown_image_path (Path): Path to the image file containing the unknown face.
+        cache (EncodingCache | None): Cache of computed encodings, so a reference image verified
+            against many captures is only encoded once.
 
     Returns:
         bool | None: True if faces match, False if faces don't match, None if there's an error.
@@ -26,18 +54,23 @@ def compare_faces(known_image_path: Path, unknown_image_path: Path) -> bool | No
         >>>     print("Face match:", result)
     """
     if not known_image_path.exists() or not unknown_image_path.exists():
-        print("Error: One or both image files do not exist.")
-        return None
-    try:
-
-        # Proceed with face encoding if images loaded successfully
-        known_encoding = get_image_encoding(known_image_path)
-        unknown_encoding = get_image_encoding(unknown_image_path)
-        results = face_recognition.compare_faces([known_encoding], unknown_encoding)
-        return True if str(results[0])== "True" else False
-    except IndexError:
-        print("No faces detected in one of the images.")
+        logger.error("One or both image files do not exist.",
+                     extra={"known_image": str(known_image_path), "unknown_image": str(unknown_image_path)})
         return None
+    if cache is not None:
+        known_encoding = get_image_encoding(known_image_path, cache=cache)
+        unknown_encoding = get_image_encoding(unknown_image_path, cache=cache)
+        if known_encoding is None or unknown_encoding is None:
+            return None
+    else:
+        # Both images are decoded concurrently and encoded by one batched call
+        encodings, statuses = get_image_encodings_batch([known_image_path, unknown_image_path])
+        if statuses != [STATUS_OK, STATUS_OK]:
+            logger.warning("No faces detected in one of the images.", extra={"statuses": statuses})
+            return None
+        known_encoding, unknown_encoding = encodings
+    # Same rule as face_recognition.compare_faces, without importing the face models
+    return bool(np.linalg.norm(known_encoding - unknown_encoding) <= DEFAULT_TOLERANCE)
 
 
 def compare_face_use_csv_encoding(known_image_name: str, unknown_image_path: Path, csv_filename: Path) -> bool | None:
@@ -64,23 +97,125 @@ def compare_face_use_csv_encoding(known_image_name: str, unknown_image_path: Pat
         >>>     print("Face match:", result)
     """
     if not unknown_image_path.exists() or not csv_filename.exists():
-        print("Error: Image file or CSV file does not exist.")
+        logger.error("Image file or CSV file does not exist.",
+                     extra={"unknown_image": str(unknown_image_path), "csv": str(csv_filename)})
         return None
-    try:
-        known_encoding = get_image_encoding_from_csv(known_image_name, csv_filename)
-        unknown_encoding = get_image_encoding(unknown_image_path)
-        results = face_recognition.compare_faces([known_encoding], unknown_encoding)
-        return True if str(results[0])== "True" else False
-    except IndexError:
-        print("No faces detected in one of the images.")
+    known_encoding = get_image_encoding_from_csv(known_image_name, csv_filename)
+    if known_encoding is None:
+        logger.error("Image not found in the CSV file.", extra={"image": known_image_name, "csv": str(csv_filename)})
         return None
+    encodings, statuses = get_image_encodings_batch([unknown_image_path])
+    if statuses[0] != STATUS_OK:
+        logger.warning("No faces detected in one of the images.", extra={"unknown_image": str(unknown_image_path)})
+        return None
+    unknown_encoding = encodings[0]
+    # Same rule as face_recognition.compare_faces, without importing the face models
+    return bool(np.linalg.norm(known_encoding - unknown_encoding) <= DEFAULT_TOLERANCE)
 
 
+def verify_encoding(voter_id: str, encoding: np.ndarray, gallery, tolerance: float = DEFAULT_TOLERANCE) -> Verification | None:
+    """
+    Verify an already computed encoding against the enrolled encoding of a voter.
 
+    Args:
+        voter_id (str): The name of the enrolled image of the voter, e.g. "ouail.jpg".
+        encoding (np.ndarray): The encoding of the face to verify.
+        gallery (Path | Gallery | EncodingStore | dict | ShardedGallery): The enrolled encodings, e.g. Path("encodings.csv").
+        tolerance (float): Maximum distance for the faces to match.
 
+    Returns:
+        Verification | None: The decision and the distance, None if the voter is not enrolled.
 
+    Examples:
+        >>> verification = verify_encoding("ouail.jpg", encoding, Path("encodings.csv"))
+        >>> if verification is not None:
+        >>>     print("Face match:", verification.match, verification.distance)
+    """
+    if isinstance(gallery, (str, Path)):
+        gallery = load_gallery(Path(gallery))
+    known_encoding = gallery.get(voter_id)
+    if known_encoding is None:
+        logger.error("Voter not found in the gallery.", extra={"voter_id": voter_id})
+        return None
+    distance = float(np.linalg.norm(np.asarray(known_encoding, dtype=np.float64) - encoding))
+    return Verification(voter_id, distance <= tolerance, distance)
 
 
+def identify(unknown_image_path: Path, gallery, k: int = 5, tolerance: float = DEFAULT_TOLERANCE,
+             chunk_size: int = DEFAULT_CHUNK_SIZE, shards: list | None = None) -> list | None:
+    """
+    Identify the face in an image against every identity of a gallery.
+
+    Args:
+        unknown_image_path (Path): Path to the image file containing the unknown face.
+        gallery (Path | EncodingStore | dict | ShardedGallery): The known encodings, e.g. Path("encodings.csv").
+        k (int): Number of candidates to return.
+        tolerance (float): Maximum distance for a candidate to be considered a match.
+        chunk_size (int): Number of gallery rows compared at once.
+        shards (list | None): With a ``ShardedGallery``, search only these shards, e.g. the district of the voter.
+
+    Returns:
+        list | None: Up to k ``Match(name, distance, is_match)`` sorted by increasing distance,
+            None if there's an error.
+
+    Raises:
+        None
+
+    Examples:
+        >>> matches = identify(Path("images/unknown.jpg"), Path("encodings.csv"), k=3)
+        >>> if matches:
+        >>>     print("Best candidate:", matches[0].name, matches[0].is_match)
+    """
+    if not unknown_image_path.exists():
+        logger.error("Image file does not exist.", extra={"unknown_image": str(unknown_image_path)})
+        return None
+    unknown_encoding = get_image_encoding(unknown_image_path)
+    if unknown_encoding is None:
+        return None
+    if isinstance(gallery, ShardedGallery):
+        return gallery.search(unknown_encoding, k=k, tolerance=tolerance, shards=shards)
+    names, matrix = as_gallery(gallery)
+    return search_gallery(matrix, names, unknown_encoding, k=k, tolerance=tolerance, chunk_size=chunk_size)
+
+
+def identify_faces(image_path: Path, gallery, k: int = 1, tolerance: float = DEFAULT_TOLERANCE,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE, shards: list | None = None) -> list | None:
+    """
+    Identify every face of an image against a gallery.
+
+    The faces are detected in a single pass and encoded in a single batched call, then the
+    whole ``(F, 128)`` set is searched at once, so the cost grows with the number of faces
+    and not with the number of detections.
+
+    Args:
+        image_path (Path): Path to the image file, e.g. a group photo.
+        gallery (Path | EncodingStore | dict | ShardedGallery): The known encodings, e.g. Path("encodings.csv").
+        k (int): Number of candidates to return per face.
+        tolerance (float): Maximum distance for a candidate to be considered a match.
+        chunk_size (int): Number of gallery rows compared at once.
+        shards (list | None): With a ``ShardedGallery``, search only these shards.
+
+    Returns:
+        list | None: One ``FaceIdentity(box, matches)`` per face, with the (top, right, bottom, left)
+            box and up to k ``Match`` sorted by increasing distance, None if there's an error.
+
+    Examples:
+        >>> for face in identify_faces(Path("test/test_images/multiple_persone.jpg"), Path("encodings.csv")):
+        >>>     print(face.box, face.matches[0].name, face.matches[0].distance)
+    """
+    faces = get_image_face_encodings(image_path)
+    if faces is None:
+        return None
+    boxes, encodings = faces
+    if not boxes:
+        return []
+    if isinstance(gallery, ShardedGallery):
+        results = gallery.search(encodings, k=k, tolerance=tolerance, shards=shards)
+    else:
+        names, matrix = as_gallery(gallery)
+        results = search_gallery(matrix, names, encodings, k=k, tolerance=tolerance, chunk_size=chunk_size)
+    return [FaceIdentity(box, matches) for box, matches in zip(boxes, results)]
+
 
 if __name__=="__main__":
     import time
@@ -93,6 +228,16 @@ if __name__=="__main__":
     print(compare_faces(Path("images/ouail.jpg"),Path("images/unknown.jpg")))
     end = time.time()
     print("Time:",end-start)
+
+    start = time.time()
+    print(identify(Path("images/unknown.jpg"),Path("encodings.csv"),k=3))
+    end = time.time()
+    print("Time:",end-start)
+
+    start = time.time()
+    print(identify_faces(Path("test/test_images/multiple_persone.jpg"),Path("encodings.csv")))
+    end = time.time()
+    print("Time:",end-start)
     
 
 
@@ -0,0 +1,308 @@
+import argparse
+import csv
+import logging
+import multiprocessing
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from ann_index import assign_to_centroids, kmeans
+from encoding_store import ENCODING_DIM, EncodingStore, open_store_for_csv
+from gallery import DEFAULT_TOLERANCE, as_gallery, face_distance_matrix
+
+logger = logging.getLogger(__name__)
+
+# Rows compared at once on each side of a block: two 2048 x 2048 float64 blocks of distances fit in 64 MB
+DEFAULT_BLOCK_SIZE = 2048
+
+# The rows of a worker process, memory-mapped once by _init_worker
+_worker_matrix = None
+
+
+class StackedRows:
+    """
+    The rows of the gallery followed by the rows of a new batch, without copying either of them.
+
+    Row ``i`` is row ``i`` of the gallery below ``len(gallery)``, and row ``i - len(gallery)`` of
+    the new batch after. Only the rows asked for are gathered, as float64, so the gallery can
+    stay a memory map of its ``EncodingStore``.
+    """
+
+    def __init__(self, gallery: np.ndarray, new: np.ndarray | None = None):
+        self.gallery = gallery
+        self.new = np.empty((0, gallery.shape[1])) if new is None else new
+        self.split = len(gallery)
+
+    def __len__(self) -> int:
+        return self.split + len(self.new)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        if isinstance(rows, slice):
+            rows = np.arange(len(self))[rows]
+        rows = np.asarray(rows)
+        in_gallery = rows < self.split
+        block = np.empty((len(rows), self.gallery.shape[1]), dtype=np.float64)
+        block[in_gallery] = self.gallery[rows[in_gallery]]
+        block[~in_gallery] = self.new[rows[~in_gallery] - self.split]
+        return block
+
+
+def _shareable(matrix: np.ndarray, temp_dir: str, name: str) -> tuple:
+    # How a worker opens a matrix: the file of a memory map as is, anything else saved once
+    if isinstance(matrix, np.memmap) and matrix.offset == 0 and matrix.flags.c_contiguous:
+        return str(matrix.filename), matrix.dtype.str, matrix.shape
+    path = str(Path(temp_dir) / f"{name}.npy")
+    np.save(path, matrix)
+    return path, None, None
+
+
+def _open_shared(path: str, dtype: str | None, shape: tuple | None) -> np.ndarray:
+    if dtype is None:
+        return np.load(path, mmap_mode="r")
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+def _init_worker(gallery_source: tuple, new_source: tuple) -> None:
+    global _worker_matrix
+    _worker_matrix = StackedRows(_open_shared(*gallery_source), _open_shared(*new_source))
+
+
+def scan_block_pairs(matrix: np.ndarray, block_pairs: list, tolerance: float = DEFAULT_TOLERANCE,
+                     new_start: int = 0) -> tuple:
+    """
+    Find the pairs of rows closer than the tolerance within pairs of row blocks.
+
+    Args:
+        matrix (np.ndarray | StackedRows): The ``(N, 128)`` encodings.
+        block_pairs (list): ``(rows_a, rows_b)`` pairs of row index arrays to compare. Each unordered
+            pair of rows must appear in one block pair only; when ``rows_a`` is ``rows_b`` only the
+            pairs with the first row before the second are kept.
+        tolerance (float): Maximum distance of a suspicious pair.
+        new_start (int): Keep only the pairs with at least one row at or after this index.
+
+    Returns:
+        tuple: The first rows, the second rows and the distances of the pairs found, as arrays,
+            and the number of distances computed.
+    """
+    found_a, found_b, found_distances = [], [], []
+    comparisons = 0
+    for rows_a, rows_b in block_pairs:
+        # (len(rows_b), len(rows_a)) distances in one matrix product
+        distances = face_distance_matrix(matrix[rows_a], matrix[rows_b])
+        comparisons += distances.size
+        close = distances <= tolerance
+        if rows_a is rows_b:
+            close &= rows_a[np.newaxis, :] < rows_b[:, np.newaxis]
+        if new_start > 0:
+            close &= (rows_a[np.newaxis, :] >= new_start) | (rows_b[:, np.newaxis] >= new_start)
+        b_index, a_index = np.nonzero(close)
+        first, second = rows_a[a_index], rows_b[b_index]
+        found_a.append(np.minimum(first, second))
+        found_b.append(np.maximum(first, second))
+        found_distances.append(distances[b_index, a_index])
+    if not found_a:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0), comparisons
+    return np.concatenate(found_a), np.concatenate(found_b), np.concatenate(found_distances), comparisons
+
+
+def _scan_in_worker(block_pairs: list, tolerance: float, new_start: int) -> tuple:
+    return scan_block_pairs(_worker_matrix, block_pairs, tolerance, new_start)
+
+
+def _split(rows: np.ndarray, block_size: int) -> list:
+    return [rows[start:start + block_size] for start in range(0, len(rows), block_size)]
+
+
+def exact_tasks(n_rows: int, block_size: int = DEFAULT_BLOCK_SIZE, new_start: int = 0):
+    """
+    Split the all-pairs scan into tasks, one per block of rows, comparing it with the blocks before it.
+
+    Args:
+        n_rows (int): Number of rows of the gallery.
+        block_size (int): Number of rows per block.
+        new_start (int): Index of the first new row; pairs of two older rows are not scanned.
+
+    Yields:
+        list: The ``(rows_a, rows_b)`` block pairs of one task.
+    """
+    blocks = _split(np.arange(n_rows), block_size)
+    for j, block_j in enumerate(blocks):
+        # A block entirely before new_start only holds old-versus-old pairs with the blocks before it
+        if len(block_j) == 0 or block_j[-1] < new_start:
+            continue
+        yield [(blocks[i], block_j) for i in range(j + 1)]
+
+
+def ann_tasks(matrix: np.ndarray, n_lists: int = 256, n_probe: int = 8, block_size: int = DEFAULT_BLOCK_SIZE,
+              new_start: int = 0, seed: int = 0):
+    """
+    Split a pruned scan into tasks, comparing each k-means cell only with its neighbouring cells.
+
+    The rows are clustered into ``n_lists`` cells, and every cell is compared with itself and its
+    ``n_probe - 1`` closest cells (in both directions, so each unordered pair of cells is scanned
+    once). Two close encodings almost always fall in the same or neighbouring cells, so most of
+    the pairs are skipped for a small loss of recall; ``n_probe = n_lists`` scans every pair.
+
+    Args:
+        matrix (np.ndarray | StackedRows): The ``(N, 128)`` encodings.
+        n_lists (int): Number of cells.
+        n_probe (int): Number of cells, including its own, each cell is compared with.
+        block_size (int): Maximum number of rows per block within a cell.
+        new_start (int): Index of the first new row; pairs of cells without new rows are not scanned.
+        seed (int): Seed of the k-means clustering.
+
+    Yields:
+        list: The ``(rows_a, rows_b)`` block pairs of one task.
+    """
+    if len(matrix) == 0:
+        return
+    n_lists = min(n_lists, len(matrix))
+    n_probe = max(1, min(n_probe, n_lists))
+    rng = np.random.default_rng(seed)
+    if len(matrix) > 64 * n_lists:
+        sample = matrix[np.sort(rng.choice(len(matrix), 64 * n_lists, replace=False))]
+    else:
+        sample = matrix[:]
+    centroids = kmeans(np.asarray(sample, dtype=np.float64), n_lists, seed=seed)
+    assignments = assign_to_centroids(matrix, centroids)
+    order = np.argsort(assignments, kind='stable')
+    bounds = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+    cells = [order[bounds[i]:bounds[i + 1]] for i in range(n_lists)]
+    has_new = [len(cell) > 0 and cell.max() >= new_start for cell in cells]
+
+    nearest = np.argsort(face_distance_matrix(centroids, centroids), axis=1)[:, :n_probe]
+    neighbours = [set() for _ in range(n_lists)]
+    for cell, probes in enumerate(nearest):
+        for other in probes:
+            neighbours[min(cell, other)].add(max(cell, other))
+
+    for cell in range(n_lists):
+        blocks = _split(cells[cell], block_size)
+        task = []
+        for other in sorted(neighbours[cell]):
+            if not (has_new[cell] or has_new[other]) or len(cells[other]) == 0:
+                continue
+            if other == cell:
+                task.extend((block_a, block_b) for j, block_b in enumerate(blocks) for block_a in blocks[:j + 1])
+            else:
+                task.extend((block_a, block_b) for block_a in blocks for block_b in _split(cells[other], block_size))
+        if task:
+            yield task
+
+
+def find_duplicates(gallery, output: Path, new=None, tolerance: float = DEFAULT_TOLERANCE,
+                    block_size: int = DEFAULT_BLOCK_SIZE, workers: int = 1, ann: bool = False, n_lists: int = 256,
+                    n_probe: int = 8, progress: bool = False) -> dict:
+    """
+    Find every pair of gallery encodings closer than the tolerance, e.g. a voter enrolled twice.
+
+    The gallery is compared with itself in blocks of ``block_size`` rows, each block pair with one
+    matrix product, instead of one ``compare_faces`` call per pair. The tasks are spread over a
+    pool of processes that memory-map the same matrix, at most ``2 * workers`` tasks
+    are in flight, and the suspicious pairs are appended to ``output`` as soon as a task finishes,
+    so memory does not grow with the number of pairs found.
+
+    With ``new``, only the pairs involving a new encoding are scanned: new against the gallery
+    and new against new, never the gallery against itself again.
+
+    A CSV file or an ``EncodingStore`` gallery is read through the memory map of the store, which
+    the workers map too, so the gallery is neither loaded nor copied; only the new rows are.
+
+    Args:
+        gallery (Path | Gallery | EncodingStore | dict | tuple): The enrolled encodings, e.g. Path("encodings.csv").
+        output (Path): The CSV file the pairs are written to, with their names and distance.
+        new (Path | Gallery | EncodingStore | dict | tuple | None): A newly enrolled batch to check
+            against ``gallery``. None scans all the pairs of ``gallery``.
+        tolerance (float): Maximum distance of a suspicious pair.
+        block_size (int): Number of rows compared at once on each side of a block.
+        workers (int): Number of processes scanning blocks in parallel. 1 scans in the current process.
+        ann (bool): Only compare rows of neighbouring k-means cells (see ``ann_tasks``), faster but
+            approximate.
+        n_lists (int): Number of cells of the pruning.
+        n_probe (int): Number of cells each cell is compared with.
+        progress (bool): Print the progress after every task.
+
+    Returns:
+        dict: The number of rows and new rows, of distances computed and of pairs found, the
+            elapsed seconds and the number of distances computed per second.
+
+    Examples:
+        >>> stats = find_duplicates(Path("encodings.csv"), Path("duplicates.csv"), workers=4)
+        >>> stats = find_duplicates(Path("encodings.csv"), Path("duplicates.csv"), new=Path("batch.csv"))
+        >>> print(stats["pairs"], "suspicious pairs")
+    """
+    if isinstance(gallery, (str, Path)):
+        gallery = open_store_for_csv(Path(gallery))
+    names, gallery_matrix = as_gallery(gallery)
+    if not isinstance(gallery, EncodingStore):
+        gallery_matrix = np.asarray(gallery_matrix, dtype=np.float64).reshape(len(names), ENCODING_DIM)
+    new_start = len(names) if new is not None else 0
+    new_matrix = None
+    if new is not None:
+        new_names, new_matrix = as_gallery(new)
+        names = list(names) + list(new_names)
+        new_matrix = np.ascontiguousarray(new_matrix, dtype=np.float64).reshape(len(new_names), ENCODING_DIM)
+    matrix = StackedRows(gallery_matrix, new_matrix)
+
+    if ann:
+        tasks = ann_tasks(matrix, n_lists, n_probe, block_size, new_start)
+    else:
+        tasks = exact_tasks(len(matrix), block_size, new_start)
+
+    stats = {"rows": len(matrix), "new_rows": len(matrix) - new_start, "comparisons": 0, "pairs": 0}
+    start = time.perf_counter()
+    with open(output, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Image Name A', 'Image Name B', 'distance'])
+
+        def write(result: tuple) -> None:
+            rows_a, rows_b, distances, comparisons = result
+            writer.writerows((names[a], names[b], float(distance)) for a, b, distance in zip(rows_a, rows_b, distances))
+            file.flush()
+            stats["comparisons"] += comparisons
+            stats["pairs"] += len(distances)
+            if progress:
+                print(f"{stats['comparisons']} distances computed, {stats['pairs']} suspicious pairs")
+
+        if workers <= 1:
+            for task in tasks:
+                write(scan_block_pairs(matrix, task, tolerance, new_start))
+        else:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                sources = (_shareable(matrix.gallery, temp_dir, "gallery"), _shareable(matrix.new, temp_dir, "new"))
+                with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                         initializer=_init_worker, initargs=sources) as executor:
+                    in_flight = deque()
+                    for task in tasks:
+                        in_flight.append(executor.submit(_scan_in_worker, task, tolerance, new_start))
+                        if len(in_flight) >= 2 * workers:
+                            write(in_flight.popleft().result())
+                    while in_flight:
+                        write(in_flight.popleft().result())
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = elapsed
+    stats["comparisons_per_sec"] = stats["comparisons"] / elapsed if elapsed > 0 else 0.0
+    logger.info("Found %d suspicious pairs among %d encodings.", stats["pairs"], stats["rows"], extra=stats)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the pairs of enrolled encodings closer than the tolerance.")
+    parser.add_argument("--csv", type=Path, default=Path("encodings.csv"))
+    parser.add_argument("--new", type=Path, default=None, help="CSV file of a new batch to check against --csv only")
+    parser.add_argument("--output", type=Path, default=Path("duplicates.csv"))
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--ann", action="store_true", help="only compare neighbouring k-means cells")
+    parser.add_argument("--n-lists", type=int, default=256)
+    parser.add_argument("--n-probe", type=int, default=8)
+    args = parser.parse_args()
+
+    print(find_duplicates(args.csv, args.output, args.new, args.tolerance, args.block_size, args.workers,
+                          args.ann, args.n_lists, args.n_probe, progress=True))
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from metrics import metrics
+
+DEFAULT_CACHE_DIR = Path("temp/encoding_cache")
+# 256 MB is about 250 000 cached encodings
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Bump when the way encodings are computed changes, so stale entries are never served
+CACHE_VERSION = 1
+
+
+class EncodingCache:
+    """
+    Persistent, content-addressed cache of computed face encodings.
+
+    An entry is keyed by the SHA-256 of the image bytes and of the parameters used to encode
+    it, and stored as the raw float64 bytes of the encoding in ``<root>/<key[:2]>/<key>``.
+    Entries are written to a temporary file and renamed into place, so several processes can
+    share the same folder: a reader sees either a complete entry or no entry at all.
+    A hit refreshes the mtime of the entry, and the least recently used entries are removed
+    once the folder grows over ``max_bytes``.
+
+    Examples:
+        >>> cache = EncodingCache(Path("temp/encoding_cache"))
+        >>> encoding = get_image_encoding(Path("images/ouail.jpg"), cache=cache)
+        >>> print(cache.stats()["hit_rate"])
+    """
+
+    def __init__(self, root: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES, evict_every: int = 64):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(image_bytes: bytes, params: dict | None = None) -> str:
+        """
+        Compute the cache key of an image.
+
+        Args:
+            image_bytes (bytes): The content of the image file.
+            params (dict | None): The parameters used to compute the encoding.
+
+        Returns:
+            str: The hexadecimal SHA-256 key.
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps({"version": CACHE_VERSION, "params": params or {}}, sort_keys=True).encode())
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> np.ndarray | None:
+        """
+        Get a cached encoding.
+
+        Args:
+            key (str): The cache key of the image.
+
+        Returns:
+            np.ndarray | None: The encoding if cached, None otherwise.
+        """
+        path = self._path(key)
+        try:
+            with open(path, mode='rb') as file:
+                data = file.read()
+            os.utime(path)
+        except OSError:
+            data = b''
+        if not data or len(data) % 8:
+            with self._lock:
+                self.misses += 1
+            metrics.increment("cache_miss")
+            return None
+        with self._lock:
+            self.hits += 1
+        metrics.increment("cache_hit")
+        return np.frombuffer(data, dtype=np.float64).copy()
+
+    def put(self, key: str, encoding: np.ndarray) -> None:
+        """
+        Store an encoding.
+
+        Args:
+            key (str): The cache key of the image.
+            encoding (np.ndarray): The encoding to be cached.
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, mode='wb') as file:
+                file.write(np.asarray(encoding, dtype=np.float64).tobytes())
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._puts += 1
+            should_evict = self._puts % self.evict_every == 0
+        if should_evict:
+            self.evict()
+
+    def _entries(self) -> list:
+        entries = []
+        if not self.root.exists():
+            return entries
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Removed by another process
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def size(self) -> int:
+        """
+        Get the size of the cached entries.
+
+        Returns:
+            int: The total size in bytes.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used entries until the cache fits in ``max_bytes``.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass  # Already evicted by another process
+            total -= size
+        with self._lock:
+            self.evictions += removed
+        metrics.increment("cache_eviction", removed)
+        return removed
+
+    def stats(self) -> dict:
+        """
+        Get the counters of this process.
+
+        Returns:
+            dict: The hits, misses, hit rate and evictions.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
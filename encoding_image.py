@@ -1,16 +1,361 @@
 import csv
-import face_recognition
-import cv2
+import logging
+import multiprocessing
 from pathlib import Path
 import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import numpy as np
 
-def get_image_encoding(image_path: Path) -> list | None:
+from encoding_cache import EncodingCache
+from encoding_store import EncodingStore, parse_encoding
+from gallery import load_gallery
+from image_io import read_image
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Everything that changes the encoding computed for a given image, part of the cache key
+ENCODING_PARAMS = {"color": "rgb", "detection_scale": 1.0, "model": "hog", "num_jitters": 1, "landmark_model": "small"}
+
+# Per-image status returned by get_image_encodings_batch
+STATUS_OK = "ok"
+STATUS_NO_FACE = "no_face"
+STATUS_UNREADABLE = "unreadable"
+STATUS_MISSING = "missing"
+
+# dlib face detectors are not safe to call from several threads at once
+_detector_lock = threading.Lock()
+
+# Imported by the fork server before any worker is forked, so workers start with the models loaded
+WARM_MODULES = ["cv2", "face_recognition.api", "encoding_image"]
+
+
+def face_api():
+    """
+    Get the face_recognition API, importing it on first use.
+
+    face_recognition loads dlib and its model files when imported, which takes seconds, so it is
+    only imported once an image actually has to be encoded. CSV lookups never pay for it.
+
+    Returns:
+        module: The ``face_recognition.api`` module.
+    """
+    from face_recognition import api
+    return api
+
+
+def load_face_models() -> None:
+    """
+    Import OpenCV, dlib and the face models now, e.g. in a worker initializer or before serving.
+    """
+    import cv2
+    face_api()
+
+
+def warm_executor(max_workers: int | None = None, max_tasks_per_child: int | None = None) -> ProcessPoolExecutor:
+    """
+    Create a process pool whose workers start with the face models already loaded.
+
+    Where the platform supports it, workers are forked from a fork server that imported the
+    models once, so a worker starts in milliseconds instead of loading the models again. With
+    ``max_tasks_per_child=1`` every job runs in a fresh process forked from the warm server.
+    Elsewhere, workers are spawned and load the models in their initializer.
+
+    Args:
+        max_workers (int | None): Number of worker processes, the executor default if None.
+        max_tasks_per_child (int | None): Jobs run by a worker before it is replaced, unlimited if None.
+
+    Returns:
+        ProcessPoolExecutor: The process pool.
+
+    Examples:
+        >>> with warm_executor(4) as executor:
+        >>>     encodings = list(executor.map(get_image_encoding, image_paths))
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        # Only taken into account when the fork server starts, i.e. for the first pool of the process
+        context.set_forkserver_preload(WARM_MODULES)
+        return ProcessPoolExecutor(max_workers, mp_context=context, max_tasks_per_child=max_tasks_per_child)
+    context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers, mp_context=context, initializer=load_face_models,
+                               max_tasks_per_child=max_tasks_per_child)
+
+
+def scale_face_locations(face_locations: list, scale: float, image_shape: tuple) -> list:
+    """
+    Map face boxes found on a resized image back to the original image.
+
+    Args:
+        face_locations (list): (top, right, bottom, left) boxes on the resized image.
+        scale (float): The factor the original image was resized by.
+        image_shape (tuple): The shape of the original image.
+
+    Returns:
+        list: The (top, right, bottom, left) boxes in the coordinates of the original image.
+    """
+    height, width = image_shape[:2]
+    return [
+        (max(0, int(round(top / scale))), min(width, int(round(right / scale))),
+         min(height, int(round(bottom / scale))), max(0, int(round(left / scale))))
+        for top, right, bottom, left in face_locations
+    ]
+
+
+def detect_face_locations(image: np.ndarray, detection_scale: float = 1.0, model: str = "hog") -> list:
+    """
+    Detect faces on a downscaled copy of an image.
+
+    Args:
+        image (np.ndarray): The RGB image.
+        detection_scale (float): Factor the image is resized by before detection, 1.0 detects on the full image.
+        model (str): The face detection model, "hog" or "cnn".
+
+    Returns:
+        list: The (top, right, bottom, left) boxes in the coordinates of the full image.
+    """
+    import cv2
+
+    if detection_scale >= 1.0:
+        with _detector_lock, metrics.timer("detect"):
+            return face_api().face_locations(image, model=model)
+    small = cv2.resize(image, None, fx=detection_scale, fy=detection_scale, interpolation=cv2.INTER_AREA)
+    with _detector_lock, metrics.timer("detect"):
+        face_locations = face_api().face_locations(small, model=model)
+    return scale_face_locations(face_locations, detection_scale, image.shape)
+
+
+def refine_face_location(image: np.ndarray, face_location: tuple, margin: float = 0.25, face_width: int = 160,
+                         model: str = "hog") -> tuple:
+    """
+    Refine a rough face box, e.g. from a Haar cascade, with the dlib detector run around it only.
+
+    The box is grown by ``margin`` on every side, and that crop is resized so the face is about
+    ``face_width`` pixels wide before detection, so the cost does not depend on the image size.
+
+    Args:
+        image (np.ndarray): The BGR image.
+        face_location (tuple): The rough (top, right, bottom, left) box of the face.
+        margin (float): Fraction of the box size added on every side of the searched crop.
+        face_width (int): Width the face is resized to before detection.
+        model (str): The face detection model, "hog" or "cnn".
+
+    Returns:
+        tuple: The (top, right, bottom, left) box found by dlib closest to the rough box, or the
+            rough box itself if dlib finds no face around it.
+    """
+    import cv2
+
+    top, right, bottom, left = face_location
+    height, width = image.shape[:2]
+    pad_y, pad_x = int((bottom - top) * margin), int((right - left) * margin)
+    crop_top, crop_left = max(0, top - pad_y), max(0, left - pad_x)
+    crop = image[crop_top:min(height, bottom + pad_y), crop_left:min(width, right + pad_x)]
+    scale = min(1.0, face_width / max(1, right - left))
+    face_locations = detect_face_locations(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB), scale, model)
+    if not face_locations:
+        return face_location
+    center_y, center_x = (top + bottom) / 2 - crop_top, (left + right) / 2 - crop_left
+    refined_top, refined_right, refined_bottom, refined_left = min(
+        face_locations, key=lambda box: ((box[0] + box[2]) / 2 - center_y) ** 2 + ((box[1] + box[3]) / 2 - center_x) ** 2)
+    return (refined_top + crop_top, refined_right + crop_left, refined_bottom + crop_top, refined_left + crop_left)
+
+
+def _count_faces(face_locations: list) -> None:
+    # Single-face callers keep the first face, count the images where that is a choice
+    if not face_locations:
+        metrics.increment("no_face")
+    elif len(face_locations) > 1:
+        metrics.increment("multi_face")
+
+
+def encode_image(image: np.ndarray, detection_scale: float = 1.0, model: str = "hog", num_jitters: int = 1,
+                 landmark_model: str = "small", face_locations: list | None = None) -> np.ndarray | None:
+    """
+    Get the face encoding of an image already decoded by OpenCV.
+
+    Args:
+        image (np.ndarray): The BGR image.
+        detection_scale (float): Factor the image is resized by before face detection.
+        model (str): The face detection model, "hog" or "cnn".
+        num_jitters (int): How many times the face is re-sampled when computing the encoding.
+        landmark_model (str): The landmark model, "small" (5 points) or "large" (68 points).
+        face_locations (list | None): The (top, right, bottom, left) boxes of the faces when they are
+            already known, e.g. from the capture quality gate, to skip face detection.
+
+    Returns:
+        np.ndarray | None: The encoding of the first face found, None if there is no face.
+    """
+    import cv2
+
+    # OpenCV decodes to BGR, dlib expects RGB
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    if face_locations is None:
+        face_locations = detect_face_locations(image, detection_scale, model)
+        _count_faces(face_locations)
+    if not face_locations:
+        return None
+    # Only the first face is returned, so only the first face is encoded
+    chips = _face_chips(image, face_locations[:1], landmark_model)
+    with metrics.timer("encode"):
+        return np.array(face_api().face_encoder.compute_face_descriptor(chips[0], num_jitters))
+
+
+def _decode_image(image, max_side: int | None = None) -> tuple:
+    """
+    Decode one input of a batch to a BGR image.
+
+    Returns:
+        tuple: The BGR image (None on failure) and its status.
+    """
+    if not isinstance(image, (np.ndarray, bytes, bytearray, memoryview)) and not os.path.exists(image):
+        return None, STATUS_MISSING
+    decoded = read_image(image, max_side)
+    return (None, STATUS_UNREADABLE) if decoded is None else (decoded, STATUS_OK)
+
+
+def _face_chips(image: np.ndarray, face_locations: list, landmark_model: str = "small") -> list:
+    """
+    Align and cut the 150x150 chips the descriptor network is run on.
+
+    Args:
+        image (np.ndarray): The RGB image.
+        face_locations (list): The (top, right, bottom, left) boxes of the faces.
+        landmark_model (str): The landmark model, "small" (5 points) or "large" (68 points).
+
+    Returns:
+        list: One RGB chip per face.
+    """
+    import dlib
+
+    if landmark_model == "small":
+        pose_predictor = face_api().pose_predictor_5_point
+    else:
+        pose_predictor = face_api().pose_predictor_68_point
+    with metrics.timer("landmark"):
+        shapes = dlib.full_object_detections()
+        for top, right, bottom, left in face_locations:
+            shapes.append(pose_predictor(image, dlib.rectangle(left, top, right, bottom)))
+        # Same chip size and padding as face_recognition.face_encodings
+        return list(dlib.get_face_chips(image, shapes, size=150, padding=0.25))
+
+
+def _face_chip(image, detection_scale: float, model: str, landmark_model: str) -> tuple:
+    """
+    Decode an image and cut the aligned chip of its first face.
+
+    Only the 150x150 chip is kept, so a batch of full resolution photos is never held in memory at once.
+
+    Returns:
+        tuple: The RGB face chip (None on failure) and the status of the image.
+    """
+    import cv2
+
+    image, status = _decode_image(image)
+    if image is None:
+        return None, status
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    face_locations = detect_face_locations(image, detection_scale, model)
+    _count_faces(face_locations)
+    if not face_locations:
+        return None, STATUS_NO_FACE
+    return _face_chips(image, face_locations[:1], landmark_model)[0], STATUS_OK
+
+
+def encode_faces(image: np.ndarray, detection_scale: float = 1.0, model: str = "hog", num_jitters: int = 1,
+                 landmark_model: str = "small") -> tuple:
+    """
+    Detect every face of an image in one pass and encode them all in one batched call.
+
+    Args:
+        image (np.ndarray): The BGR image.
+        detection_scale (float): Factor the image is resized by before face detection.
+        model (str): The face detection model, "hog" or "cnn".
+        num_jitters (int): How many times each face is re-sampled when computing the encoding.
+        landmark_model (str): The landmark model, "small" (5 points) or "large" (68 points).
+
+    Returns:
+        tuple: The F (top, right, bottom, left) boxes and the ``(F, 128)`` encodings, in the same order.
+    """
+    import cv2
+
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    face_locations = detect_face_locations(image, detection_scale, model)
+    if not face_locations:
+        metrics.increment("no_face")
+        return [], np.empty((0, 128))
+    chips = _face_chips(image, face_locations, landmark_model)
+    with metrics.timer("encode"):
+        descriptors = face_api().face_encoder.compute_face_descriptor(chips, num_jitters)
+    return face_locations, np.array(descriptors)
+
+
+def get_image_encodings_batch(images: list, detection_scale: float = 1.0, model: str = "hog", num_jitters: int = 1,
+                              landmark_model: str = "small", workers: int | None = None) -> tuple:
+    """
+    Get the face encodings of many images at once.
+
+    Images are decoded, and their faces detected and aligned, concurrently in a thread pool,
+    then the descriptors of all the faces are computed by a single batched call to dlib.
+    An image without a usable face does not abort the batch, its row is NaN and its status says why.
+
+    Args:
+        images (list): Image paths, encoded image bytes or BGR images already decoded by OpenCV.
+        detection_scale (float): Factor the images are resized by before face detection.
+        model (str): The face detection model, "hog" or "cnn".
+        num_jitters (int): How many times each face is re-sampled when computing the encoding.
+        landmark_model (str): The landmark model, "small" (5 points) or "large" (68 points).
+        workers (int | None): Number of threads decoding and aligning images, the executor default if None.
+
+    Returns:
+        tuple: The ``(N, 128)`` encodings, in the order of ``images``, and the list of the N statuses:
+            "ok", "no_face", "unreadable" or "missing".
+
+    Examples:
+        >>> encodings, statuses = get_image_encodings_batch([Path("ouail.jpg"), Path("messi.jpeg")])
+        >>> for encoding, status in zip(encodings, statuses):
+        >>>     if status == "ok":
+        >>>         print("Face encoding:", encoding)
+    """
+    images = list(images)
+    encodings = np.full((len(images), 128), np.nan)
+    if not images:
+        return encodings, []
+    chip = partial(_face_chip, detection_scale=detection_scale, model=model, landmark_model=landmark_model)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        chips = list(executor.map(chip, images))
+    statuses = [status for _, status in chips]
+    rows = [row for row, status in enumerate(statuses) if status == STATUS_OK]
+    if rows:
+        batch = [chips[row][0] for row in rows]
+        with metrics.timer("encode"):
+            descriptors = face_api().face_encoder.compute_face_descriptor(batch, num_jitters)
+        encodings[rows] = np.array(descriptors)
+    return encodings, statuses
+
+
+def get_image_encoding(image, cache: EncodingCache | None = None, detection_scale: float = 1.0,
+                       model: str = "hog", num_jitters: int = 1, landmark_model: str = "small",
+                       max_side: int | None = None) -> list | None:
     """
     Get face encoding from an image.
 
+    Faces are detected on a copy of the image resized by ``detection_scale``, while the
+    landmarks and the descriptor are computed on the full resolution pixels.
+
     Args:
-        image_path (Path): Path to the image file.
+        image (Path | bytes | np.ndarray): Path to the image file, the content of an image file
+            (e.g. an upload), or an already decoded BGR image (e.g. a camera frame).
+        cache (EncodingCache | None): Cache consulted before computing the encoding, and updated after.
+        detection_scale (float): Factor the image is resized by before face detection, e.g. 0.25 for phone photos.
+        model (str): The face detection model, "hog" or "cnn".
+        num_jitters (int): How many times the face is re-sampled when computing the encoding.
+        landmark_model (str): The landmark model, "small" (5 points) or "large" (68 points).
+        max_side (int | None): Decode a large JPEG at 1/2, 1/4 or 1/8 of its size, as long as its
+            longest side stays at least ``max_side`` pixels. None decodes at full size.
 
     Returns:
         np.ndarray | None: The encoding of the specified image if found, None otherwise.
@@ -20,23 +365,72 @@ def get_image_encoding(image_path: Path) -> list | None:
 
     Examples:
         >>> image_path = Path("ouail.jpg")
-        >>> encoding = get_image_encoding(image_path)
+        >>> encoding = get_image_encoding(image_path, max_side=1000)
+        >>> encoding = get_image_encoding(image_path.read_bytes())
         >>> if encoding is not None:
         >>>     print("Face encoding:", encoding)
     """
+    is_path = not isinstance(image, (np.ndarray, bytes, bytearray, memoryview))
+    source = str(image) if is_path else type(image).__name__
+    if is_path and not Path(image).exists():
+        logger.error("Image file does not exist.", extra={"image": source})
+        return None
+    if cache is not None:
+        params = dict(ENCODING_PARAMS, detection_scale=detection_scale, model=model,
+                      num_jitters=num_jitters, landmark_model=landmark_model)
+        if max_side is not None:
+            # Left out at full size, so the keys of full size encodings do not change
+            params["max_side"] = max_side
+        if isinstance(image, np.ndarray):
+            # The same pixels in another layout are another image
+            params["shape"] = list(image.shape)
+            image_bytes = np.ascontiguousarray(image).tobytes()
+        else:
+            image = image_bytes = Path(image).read_bytes() if is_path else bytes(image)
+        key = cache.key(image_bytes, params)
+        encoding = cache.get(key)
+        if encoding is not None:
+            return encoding
+    decoded = read_image(image, max_side)
+    if decoded is None:
+        logger.error("Could not read the image file.", extra={"image": source})
+        return None
+    encoding = encode_image(decoded, detection_scale, model, num_jitters, landmark_model)
+    if encoding is None:
+        logger.warning("No face detected in the image.", extra={"image": source})
+        return None
+    if cache is not None:
+        cache.put(key, encoding)
+    return encoding
+
+def get_image_face_encodings(image_path: Path, detection_scale: float = 1.0, model: str = "hog",
+                             num_jitters: int = 1, landmark_model: str = "small") -> tuple | None:
+    """
+    Get the encodings of every face of an image, e.g. a group photo or a polling-station frame.
+
+    Args:
+        image_path (Path): Path to the image file.
+        detection_scale (float): Factor the image is resized by before face detection.
+        model (str): The face detection model, "hog" or "cnn".
+        num_jitters (int): How many times each face is re-sampled when computing the encoding.
+        landmark_model (str): The landmark model, "small" (5 points) or "large" (68 points).
+
+    Returns:
+        tuple | None: The (top, right, bottom, left) boxes and the ``(F, 128)`` encodings of the F faces
+            found (F may be 0), None if the image could not be read.
+
+    Examples:
+        >>> boxes, encodings = get_image_face_encodings(Path("multiple_persone.jpg"))
+        >>> print(len(boxes), "faces")
+    """
     if not image_path.exists():
-        print("Error: Image file does not exist.")
+        logger.error("Image file does not exist.", extra={"image": str(image_path)})
         return None
-    try:
-        image = cv2.imread(str(image_path))
-        if image is None:
-            print("Error: Could not read the image file.")
-            return None
-        encoding = face_recognition.face_encodings(image)[0]
-        return encoding
-    except IndexError:
-        print("No face detected in the image.")
+    image = read_image(image_path)
+    if image is None:
+        logger.error("Could not read the image file.", extra={"image": str(image_path)})
         return None
+    return encode_faces(image, detection_scale, model, num_jitters, landmark_model)
 
 def get_image_encoding_from_csv(image_name: str, csv_filename: Path) -> list | None:
     """
@@ -49,37 +443,113 @@ def get_image_encoding_from_csv(image_name: str, csv_filename: Path) -> list | N
     Returns:
         np.ndarray | None: The encoding of the specified image if found, None otherwise.
     """
-    # Read the CSV file
-    with open(csv_filename, mode='r') as file:
+    # The parsed gallery is cached for the whole process and reloaded only when the CSV changes
+    with metrics.timer("lookup"):
+        encoding = load_gallery(Path(csv_filename)).get(image_name)
+    return None if encoding is None else np.array(encoding)
+
+
+def _encode_batch(image_paths: list, workers: int | None = None) -> list:
+    """
+    Encode a chunk of images, in the current process or in a worker of the enrollment pool.
+
+    Returns:
+        list: The (image name, encoding or None when no face was found) pairs of the chunk.
+    """
+    encodings, statuses = get_image_encodings_batch(image_paths, workers=workers)
+    return [
+        (os.path.basename(image_path), encoding if status == STATUS_OK else None)
+        for image_path, encoding, status in zip(image_paths, encodings, statuses)
+    ]
+
+
+def _read_checkpoint(checkpoint: Path) -> dict:
+    """
+    Read the images already processed by an interrupted enrollment.
+
+    Returns:
+        dict: Image names as keys, their encodings (or None when no face was found) as values.
+    """
+    done = {}
+    with open(checkpoint, mode='r', newline='') as file:
         reader = csv.reader(file)
-        next(reader)  # Skip the header row
+        next(reader, None)  # Skip the header row
         for row in reader:
-            if row[0] == image_name:
-                # Convert the string representation of encoding to a list of floats
-                encoding = np.array([float(value) for value in row[1].replace('[','').replace(']','').split()])
-                return encoding
-    return None
+            if len(row) < 2:
+                continue  # Row cut short by the interruption
+            done[row[0]] = parse_encoding(row[1]) if row[1] else None
+    return done
 
 
-def extract_encodings(image_folder:Path) -> dict:
+def extract_encodings(image_folder:Path, workers: int = 1, chunk_size: int = 8,
+                      checkpoint: Path | None = None, progress: bool = False) -> dict:
     """
     Extract face encodings from images in a folder.
 
     Args:
         image_folder (str): Path to the folder containing images.
+        workers (int): Number of processes encoding images in parallel. 1 encodes in the current process.
+        chunk_size (int): Number of images encoded in one batch, and sent to a worker at once.
+        checkpoint (Path | None): CSV file recording every processed image. When it already exists,
+            the images it lists are not encoded again, so an interrupted run resumes where it stopped.
+        progress (bool): Print the progress and the throughput in images/sec.
 
     Returns:
-        dict: A dictionary containing image names as keys and their encodings as values.
+        dict: A dictionary containing image names as keys and their encodings as values,
+            sorted by image name.
+
+    Examples:
+        >>> encodings_dict = extract_encodings(Path("images"), workers=4, checkpoint=Path("temp/enroll.csv"))
     """
+    image_names = sorted(os.listdir(image_folder))
+    done = {}
+    if checkpoint is not None and Path(checkpoint).exists():
+        done = _read_checkpoint(Path(checkpoint))
+    pending = [os.path.join(image_folder, image_name) for image_name in image_names if image_name not in done]
+
+    checkpoint_file = None
+    if checkpoint is not None:
+        is_new = not Path(checkpoint).exists()
+        checkpoint_file = open(checkpoint, mode='a', newline='')
+        writer = csv.writer(checkpoint_file)
+        if is_new:
+            writer.writerow(['Image Name', 'encodings'])
+
+    start = time.perf_counter()
+    executor = warm_executor(workers) if workers > 1 and len(pending) > 1 else None
+    try:
+        chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+        if executor is not None:
+            # map() yields in submission order, so the results are deterministic.
+            # Each process already runs in parallel, so its batches are decoded by one thread.
+            results = executor.map(partial(_encode_batch, workers=1), chunks)
+        else:
+            results = map(_encode_batch, chunks)
+        count = 0
+        for batch in results:
+            for image_name, face_encodings in batch:
+                done[image_name] = face_encodings
+                if checkpoint_file is not None:
+                    writer.writerow([image_name, face_encodings if face_encodings is not None else ''])
+            if checkpoint_file is not None:
+                checkpoint_file.flush()
+            count += len(batch)
+            if progress:
+                elapsed = time.perf_counter() - start
+                print(f"Encoded {count}/{len(pending)} images ({count / elapsed:.1f} images/sec)")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if checkpoint_file is not None:
+            checkpoint_file.close()
+
     encodings_dict = {}
-    for image_name in os.listdir(image_folder):
-        image_path = os.path.join(image_folder, image_name)
-        face_encodings = get_image_encoding(Path(image_path))
-        if face_encodings is not None:
-            if len(face_encodings) > 0:
-                encodings_dict[image_name] = face_encodings
-            else:
-                print(f"No face detected in {image_name}")
+    for image_name in image_names:
+        face_encodings = done.get(image_name)
+        if face_encodings is not None and len(face_encodings) > 0:
+            encodings_dict[image_name] = face_encodings
+        else:
+            logger.warning("No face detected in %s", image_name, extra={"image": image_name})
     return encodings_dict
 
 def write_encodings_to_csv(encodings_dict:dict, csv_filename:Path)->None:
@@ -96,6 +566,9 @@ def write_encodings_to_csv(encodings_dict:dict, csv_filename:Path)->None:
         for image_name, embedding in encodings_dict.items():
             writer.writerow([image_name, embedding])
 
+    # Keep the binary store in sync so lookups never have to parse the CSV file
+    EncodingStore.for_csv(Path(csv_filename)).write(encodings_dict, source=Path(csv_filename))
+
 def add_encoding_to_csv(image_name: str, encoding: np.ndarray, csv_filename: Path) -> None:
     """
     Add a new encoding to an existing CSV file.
@@ -108,18 +581,14 @@ def add_encoding_to_csv(image_name: str, encoding: np.ndarray, csv_filename: Pat
     Returns:
         None
     """
-    # Convert the encoding array to a string representation
-
     # Check if the CSV file exists
     if not csv_filename.exists():
-        print("Error: CSV file does not exist.")
+        logger.error("CSV file does not exist.", extra={"csv": str(csv_filename)})
         return
 
-    # Append the new encoding to the CSV file
-    with open(csv_filename, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([image_name, encoding])
-    print(f"Encoding added to {csv_filename}")
+    # Appended to the CSV file and to its binary store under the store lock, so concurrent stations never lose a row
+    EncodingStore.for_csv(csv_filename).append_to_csv(csv_filename, [(image_name, encoding)])
+    logger.info("Encoding added to %s", csv_filename, extra={"image": image_name, "csv": str(csv_filename)})
 
 
 if __name__=="__main__":
@@ -0,0 +1,646 @@
+import csv
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+ENCODING_DIM = 128
+STORE_SUFFIX = ".store"
+STORE_VERSION = 2
+META_FILE = "meta.json"
+LOCK_FILE = "lock"
+
+# Log record: magic, operation, name length, payload length, CRC32 of operation + name + payload
+LOG_MAGIC = b'\xfaENC'
+LOG_HEADER = struct.Struct('<4sBHII')
+OP_UPSERT = 1
+OP_DELETE = 2
+
+
+def parse_encoding(text: str) -> np.ndarray:
+    """
+    Parse an encoding written by numpy's ``str()`` into a float array.
+
+    Args:
+        text (str): The string representation stored in the CSV file, e.g. "[0.1 0.2 0.3]".
+
+    Returns:
+        np.ndarray: The parsed encoding.
+    """
+    return np.array(text.replace('[', ' ').replace(']', ' ').split(), dtype=np.float64)
+
+
+def _file_signature(path: Path) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _encode_record(op: int, image_name: str, payload: bytes) -> bytes:
+    name = image_name.encode('utf-8')
+    crc = zlib.crc32(bytes([op]) + name + payload)
+    return LOG_HEADER.pack(LOG_MAGIC, op, len(name), len(payload), crc) + name + payload
+
+
+def read_log(path: Path) -> list:
+    """
+    Read the valid records of a store log.
+
+    A record cut short by a crash, or otherwise corrupted, fails its CRC check and is skipped;
+    reading resumes at the next record marker.
+
+    Args:
+        path (Path): Path to the log file.
+
+    Returns:
+        list: ``(operation, image name, payload bytes)`` tuples, in write order.
+    """
+    try:
+        with open(path, mode='rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return []
+    records = []
+    offset = 0
+    while True:
+        offset = data.find(LOG_MAGIC, offset)
+        if offset < 0 or offset + LOG_HEADER.size > len(data):
+            break
+        _, op, name_length, payload_length, crc = LOG_HEADER.unpack_from(data, offset)
+        start = offset + LOG_HEADER.size
+        end = start + name_length + payload_length
+        body = data[start:end]
+        if end > len(data) or zlib.crc32(bytes([op]) + body) != crc:
+            offset += 1
+            continue
+        records.append((op, body[:name_length].decode('utf-8'), body[name_length:]))
+        offset = end
+    return records
+
+
+class EncodingStore:
+    """
+    Crash-safe, memory-mapped storage for face encodings.
+
+    A store is a directory holding:
+
+    - ``meta.json``: the vector dimension and dtype, the current generation and the signature
+      of the CSV file the store mirrors, if any.
+    - ``vectors-<generation>.bin`` and ``names-<generation>.txt``: an immutable snapshot, the
+      encodings as one contiguous, row-major matrix of raw floats and the names in row order.
+    - ``log-<generation>.bin``: an append-only log of the upserts and deletes made since the snapshot.
+    - ``lock``: the file locked by writers, so several processes can write at once.
+
+    An upsert or a delete appends one checksummed record to the log, so enrolling costs the
+    same whatever the size of the gallery, and re-enrolling a name replaces its encoding.
+    ``compact`` folds the log into a new snapshot generation; ``meta.json`` is switched to it
+    with an atomic rename, so a crash at any point leaves either the old or the new generation.
+    The snapshot matrix is memory-mapped on open, so loading a gallery does not parse any floats,
+    and names are resolved to rows through an in-memory index in O(1).
+
+    Examples:
+        >>> store = EncodingStore.for_csv(Path("encodings.csv"))
+        >>> encoding = store.get("ouail.jpg")
+        >>> store.upsert("amine.jpg", new_encoding)
+        >>> store.delete("unknown.jpg")
+        >>> store.compact()
+    """
+
+    def __init__(self, root: Path, dim: int = ENCODING_DIM, dtype: str = "float64", fsync: bool = True):
+        self.root = Path(root)
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.fsync = fsync
+        self._names = None
+        self._index = None
+        self._matrix = None
+        self._meta = None
+
+    @classmethod
+    def for_csv(cls, csv_filename: Path) -> "EncodingStore":
+        """
+        Get the store that sits next to a CSV file (``encodings.csv`` -> ``encodings.store``).
+
+        Args:
+            csv_filename (Path): Path to the CSV file containing image encodings.
+
+        Returns:
+            EncodingStore: The (possibly not yet created) store for the CSV file.
+        """
+        return cls(Path(csv_filename).with_suffix(STORE_SUFFIX))
+
+    @property
+    def meta_path(self) -> Path:
+        return self.root / META_FILE
+
+    def vectors_path(self, generation: int) -> Path:
+        return self.root / f"vectors-{generation}.bin"
+
+    def names_path(self, generation: int) -> Path:
+        return self.root / f"names-{generation}.txt"
+
+    def log_path(self, generation: int) -> Path:
+        return self.root / f"log-{generation}.bin"
+
+    def exists(self) -> bool:
+        """
+        Check whether the store has been written to disk.
+
+        Returns:
+            bool: True if the store holds a snapshot in the current format, False otherwise.
+        """
+        if not self.meta_path.exists():
+            return False
+        return self._read_meta().get("version") == STORE_VERSION
+
+    @contextmanager
+    def _locked(self, shared: bool = False):
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / LOCK_FILE, mode='a+b') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _read_meta(self) -> dict:
+        with open(self.meta_path, mode='r') as file:
+            self._meta = json.load(file)
+        self.dim = self._meta.get("dim", self.dim)
+        self.dtype = np.dtype(self._meta.get("dtype", self.dtype))
+        return self._meta
+
+    def _write_meta(self, generation: int, source: dict | None) -> None:
+        meta = {
+            "version": STORE_VERSION,
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "generation": generation,
+            "source": source,
+        }
+        tmp_path = self.meta_path.with_suffix(".tmp")
+        with open(tmp_path, mode='w') as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, self.meta_path)
+        self._meta = meta
+
+    def _read_snapshot(self, generation: int) -> tuple:
+        with open(self.names_path(generation), mode='r', encoding='utf-8') as file:
+            names = file.read().split('\n')
+        if names and names[-1] == '':
+            names.pop()
+        if names:
+            matrix = np.memmap(self.vectors_path(generation), dtype=self.dtype, mode='r',
+                               shape=(len(names), self.dim))
+        else:
+            matrix = np.empty((0, self.dim), dtype=self.dtype)
+        return names, matrix
+
+    def _read_live(self, generation: int) -> tuple:
+        """
+        Apply the log of a generation on top of its snapshot.
+
+        Returns:
+            tuple: The live names and their ``(N, dim)`` matrix. The matrix is the memory map of
+                the snapshot itself when the log is empty.
+        """
+        names, matrix = self._read_snapshot(generation)
+        overlay = {}
+        for op, image_name, payload in read_log(self.log_path(generation)):
+            # Re-inserting moves the name to the end, in log order
+            overlay.pop(image_name, None)
+            overlay[image_name] = np.frombuffer(payload, dtype=self.dtype) if op == OP_UPSERT else None
+        if not overlay:
+            return names, matrix
+
+        live = [row for row, name in enumerate(names) if name not in overlay]
+        upserts = {name: encoding for name, encoding in overlay.items() if encoding is not None}
+        names = [names[row] for row in live] + list(upserts.keys())
+        parts = [np.asarray(matrix[live])]
+        if upserts:
+            parts.append(np.stack(list(upserts.values())))
+        return names, np.concatenate(parts).astype(self.dtype, copy=False)
+
+    def _load(self) -> None:
+        if self._names is not None:
+            return
+        with self._locked(shared=True):
+            names, matrix = self._read_live(self._read_meta()["generation"])
+        self._names = names
+        self._index = {name: row for row, name in enumerate(names)}
+        self._matrix = matrix
+
+    def _reset(self) -> None:
+        self._names = None
+        self._index = None
+        self._matrix = None
+
+    @property
+    def names(self) -> list:
+        """
+        list: The image names, in row order.
+        """
+        self._load()
+        return self._names
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """
+        np.ndarray: The read-only ``(N, dim)`` encoding matrix, memory-mapped when the log is empty.
+        """
+        self._load()
+        return self._matrix
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, image_name: str) -> bool:
+        self._load()
+        return image_name in self._index
+
+    def get(self, image_name: str) -> np.ndarray | None:
+        """
+        Get the encoding stored for an image.
+
+        Args:
+            image_name (str): Name of the image.
+
+        Returns:
+            np.ndarray | None: A float64 copy of the encoding if found, None otherwise.
+        """
+        self._load()
+        row = self._index.get(image_name)
+        if row is None:
+            return None
+        return np.array(self._matrix[row], dtype=np.float64)
+
+    def is_fresh(self, csv_filename: Path) -> bool:
+        """
+        Check whether the store still mirrors the given CSV file.
+
+        Args:
+            csv_filename (Path): Path to the CSV file the store was built from.
+
+        Returns:
+            bool: True if the CSV file has not changed since the store was last synced with it.
+        """
+        if not self.exists():
+            return False
+        return self._meta.get("source") == _file_signature(csv_filename)
+
+    def log_size(self) -> int:
+        """
+        Get the size of the log not yet compacted.
+
+        Returns:
+            int: The size of the current log in bytes.
+        """
+        if not self.exists():
+            return 0
+        try:
+            return os.path.getsize(self.log_path(self._meta["generation"]))
+        except FileNotFoundError:
+            return 0
+
+    def write(self, encodings_dict: dict, source: Path | None = None) -> None:
+        """
+        Replace the content of the store with the given encodings.
+
+        Args:
+            encodings_dict (dict): Dictionary containing image names as keys and their encodings as values.
+            source (Path | None): The CSV file holding the same encodings, if any.
+        """
+        self.write_matrix(*self._rows(encodings_dict), source=source)
+
+    def _rows(self, encodings_dict: dict) -> tuple:
+        """
+        Stack the encodings that fit the store.
+
+        Returns:
+            tuple: The names and the ``(N, dim)`` matrix of the encodings, others are skipped.
+        """
+        names = []
+        rows = []
+        for image_name, encoding in encodings_dict.items():
+            encoding = np.asarray(encoding, dtype=self.dtype)
+            if encoding.shape != (self.dim,):
+                logger.warning("Skipping %s: expected %d values, got %d", image_name, self.dim, encoding.size)
+                continue
+            names.append(image_name)
+            rows.append(encoding)
+        return names, np.stack(rows) if rows else np.empty((0, self.dim), dtype=self.dtype)
+
+    def write_matrix(self, names: list, matrix: np.ndarray, source: Path | None = None) -> None:
+        """
+        Replace the content of the store with a matrix of encodings.
+
+        Args:
+            names (list): The unique image names, in row order.
+            matrix (np.ndarray): The ``(N, dim)`` encodings.
+            source (Path | None): The CSV file holding the same encodings, if any.
+        """
+        with self._locked():
+            signature = _file_signature(source) if source is not None else None
+            self._write_generation(names, matrix, signature)
+
+    def _write_generation(self, names: list, matrix: np.ndarray, source: dict | None) -> None:
+        # Called with the lock held
+        previous = self._read_meta().get("generation") if self.meta_path.exists() else None
+        generation = (previous or 0) + 1
+        matrix = np.ascontiguousarray(matrix, dtype=self.dtype)
+        with open(self.vectors_path(generation), mode='wb') as file:
+            file.write(matrix.tobytes())
+            self._sync(file.fileno(), file)
+        with open(self.names_path(generation), mode='w', encoding='utf-8', newline='\n') as file:
+            file.writelines(name + '\n' for name in names)
+            self._sync(file.fileno(), file)
+        # The generation becomes visible atomically, once all its files are complete
+        self._write_meta(generation, source)
+        self._reset()
+        self._remove_generations(keep=generation)
+
+    def _remove_generations(self, keep: int) -> None:
+        for path in self.root.iterdir():
+            prefix, _, generation = path.name.partition('.')[0].rpartition('-')
+            if prefix in ("vectors", "names", "log") and generation.isdigit() and int(generation) != keep:
+                try:
+                    # Readers still holding a memory map of an old generation keep their data
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _sync(self, fd: int, file=None) -> None:
+        if self.fsync:
+            if file is not None:
+                file.flush()
+            os.fsync(fd)
+
+    def _append_records(self, records: bytes, source: Path | None = None) -> None:
+        with self._locked():
+            self._append_records_locked(records, source)
+        self._reset()
+
+    def _append_records_locked(self, records: bytes, source: Path | None) -> None:
+        # Called with the lock held
+        if not self.exists():
+            self._write_generation([], np.empty((0, self.dim)), None)
+        generation = self._meta["generation"]
+        fd = os.open(self.log_path(generation), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # One write call per batch of records, so a record is never interleaved with another
+            os.write(fd, records)
+            self._sync(fd)
+        finally:
+            os.close(fd)
+        if source is not None:
+            self._write_meta(generation, _file_signature(source))
+
+    def _upsert_records(self, items) -> list:
+        records = []
+        for image_name, encoding in items:
+            encoding = np.asarray(encoding, dtype=self.dtype)
+            if encoding.shape != (self.dim,):
+                logger.warning("Skipping %s: expected %d values, got %d", image_name, self.dim, encoding.size)
+                continue
+            records.append(_encode_record(OP_UPSERT, image_name, encoding.tobytes()))
+        return records
+
+    def upsert(self, image_name: str, encoding: np.ndarray, source: Path | None = None) -> bool:
+        """
+        Insert or replace the encoding of an image.
+
+        Args:
+            image_name (str): Name of the image.
+            encoding (np.ndarray): The encoding to be stored.
+            source (Path | None): The CSV file the same row was appended to, if any.
+
+        Returns:
+            bool: True if the encoding was stored, False if it does not fit the store.
+        """
+        if self.exists():
+            self._read_meta()
+        encoding = np.asarray(encoding, dtype=self.dtype)
+        if encoding.shape != (self.dim,):
+            logger.warning("Skipping %s: expected %d values, got %d", image_name, self.dim, encoding.size)
+            return False
+        self._append_records(_encode_record(OP_UPSERT, image_name, encoding.tobytes()), source)
+        return True
+
+    def upsert_many(self, items, source: Path | None = None) -> int:
+        """
+        Insert or replace many encodings with a single write and a single fsync.
+
+        Args:
+            items: Iterable of (image name, encoding) pairs.
+            source (Path | None): The CSV file the same rows were appended to, if any.
+
+        Returns:
+            int: The number of encodings stored, encodings that do not fit the store are skipped.
+        """
+        if self.exists():
+            self._read_meta()
+        records = self._upsert_records(items)
+        if records or source is not None:
+            self._append_records(b''.join(records), source)
+        return len(records)
+
+    def append_to_csv(self, csv_filename: Path, items) -> int:
+        """
+        Append rows to the CSV file the store mirrors, and the same encodings to the store.
+
+        The freshness check, the CSV append and the store append all happen under the store
+        lock, so a row another writer appends to the CSV file in between cannot be stamped as
+        synced without being in the store. If the CSV file had already changed behind the
+        store's back, the store is re-imported from it instead, rows included.
+
+        Args:
+            csv_filename (Path): Path to the CSV file mirrored by the store.
+            items: Iterable of (image name, encoding) pairs.
+
+        Returns:
+            int: The number of rows appended to the CSV file.
+
+        Examples:
+            >>> store = EncodingStore.for_csv(Path("encodings.csv"))
+            >>> store.append_to_csv(Path("encodings.csv"), [("amine.jpg", encoding)])
+        """
+        csv_filename = Path(csv_filename)
+        rows = list(items)
+        with self._locked():
+            fresh = self.exists() and self._meta.get("source") == _file_signature(csv_filename)
+            with open(csv_filename, mode='a', newline='') as file:
+                csv.writer(file).writerows(rows)
+            if fresh:
+                self._append_records_locked(b''.join(self._upsert_records(rows)), csv_filename)
+            else:
+                names, matrix = self._rows(read_encodings_csv(csv_filename))
+                self._write_generation(names, matrix, _file_signature(csv_filename))
+        self._reset()
+        return len(rows)
+
+    # The CSV helpers append rows, which for the store is an upsert
+    append = upsert
+
+    def delete(self, image_name: str) -> None:
+        """
+        Remove an image from the store.
+
+        Args:
+            image_name (str): Name of the image.
+        """
+        self._append_records(_encode_record(OP_DELETE, image_name, b''))
+
+    def compact(self) -> bool:
+        """
+        Fold the log into a new snapshot generation and drop the previous generation.
+
+        Returns:
+            bool: True if there was a log to compact.
+        """
+        with self._locked():
+            if not self.exists() or self.log_size() == 0:
+                return False
+            source = self._meta.get("source")
+            names, matrix = self._read_live(self._meta["generation"])
+            self._write_generation(names, matrix, source)
+        return True
+
+
+class BackgroundCompactor:
+    """
+    Compacts a store from a daemon thread whenever its log grows over a size.
+
+    Examples:
+        >>> compactor = BackgroundCompactor(store, interval=60, min_log_bytes=1024 * 1024).start()
+        >>> compactor.stop()
+    """
+
+    def __init__(self, store: EncodingStore, interval: float = 60.0, min_log_bytes: int = 1024 * 1024):
+        self.store = store
+        self.interval = interval
+        self.min_log_bytes = min_log_bytes
+        self.compactions = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> "BackgroundCompactor":
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def run_once(self) -> bool:
+        """
+        Compact the store if its log is large enough.
+
+        Returns:
+            bool: True if the store was compacted.
+        """
+        if self.store.log_size() < self.min_log_bytes:
+            return False
+        start = time.perf_counter()
+        if not self.store.compact():
+            return False
+        self.compactions += 1
+        logger.info("Compacted %s in %.2fs", self.store.root, time.perf_counter() - start)
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def read_encodings_csv(csv_filename: Path) -> dict:
+    """
+    Read every encoding of a CSV file into a dictionary.
+
+    Args:
+        csv_filename (Path): Path to the CSV file containing image encodings.
+
+    Returns:
+        dict: A dictionary containing image names as keys and their encodings as values.
+            When a name appears more than once, the last row wins, like a re-enrollment.
+    """
+    encodings_dict = {}
+    with open(csv_filename, mode='r') as file:
+        reader = csv.reader(file)
+        next(reader, None)  # Skip the header row
+        for row in reader:
+            if len(row) < 2:
+                continue
+            encodings_dict.pop(row[0], None)
+            encodings_dict[row[0]] = parse_encoding(row[1])
+    return encodings_dict
+
+
+def import_csv(csv_filename: Path, store: EncodingStore | None = None) -> EncodingStore:
+    """
+    Build a binary store from an encodings CSV file.
+
+    Args:
+        csv_filename (Path): Path to the CSV file containing image encodings.
+        store (EncodingStore | None): The store to write to. Defaults to the store next to the CSV file.
+
+    Returns:
+        EncodingStore: The store holding the imported encodings.
+
+    Examples:
+        >>> store = import_csv(Path("encodings.csv"))
+        >>> print(len(store), "encodings imported")
+    """
+    csv_filename = Path(csv_filename)
+    if store is None:
+        store = EncodingStore.for_csv(csv_filename)
+    store.write(read_encodings_csv(csv_filename), source=csv_filename)
+    return store
+
+
+def open_store_for_csv(csv_filename: Path) -> EncodingStore:
+    """
+    Open the store next to a CSV file, re-importing the CSV file if it changed.
+
+    Args:
+        csv_filename (Path): Path to the CSV file containing image encodings.
+
+    Returns:
+        EncodingStore: A store in sync with the CSV file.
+    """
+    csv_filename = Path(csv_filename)
+    store = EncodingStore.for_csv(csv_filename)
+    if not store.is_fresh(csv_filename):
+        import_csv(csv_filename, store)
+    return store
+
+
+if __name__ == "__main__":
+    import sys
+
+    csv_filename = Path(sys.argv[1] if len(sys.argv) > 1 else "encodings.csv")
+    store = import_csv(csv_filename)
+    print(f"{len(store)} encodings imported to {store.root}")
@@ -0,0 +1,263 @@
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+from pathlib import Path
+
+
+from encoding_image import (STATUS_NO_FACE, STATUS_OK, get_image_encodings_batch, warm_executor,
+                            write_encodings_to_csv)
+from encoding_store import EncodingStore, open_store_for_csv, read_encodings_csv
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"}
+DEFAULT_BATCH_SIZE = 256
+
+
+def iter_image_files(image_folder: Path):
+    """
+    Walk a folder tree lazily and yield its images.
+
+    Directories are read with ``os.scandir`` one entry at a time, so memory does not
+    grow with the number of files in a folder.
+
+    Args:
+        image_folder (Path): The root folder.
+
+    Yields:
+        tuple: The image name relative to ``image_folder`` (with ``/`` separators) and its path.
+    """
+    image_folder = Path(image_folder)
+    pending = [image_folder]
+    while pending:
+        directory = pending.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(Path(entry.path))
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                    yield Path(entry.path).relative_to(image_folder).as_posix(), entry.path
+
+
+def _batched(iterable, batch_size: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def _encode_paths(image_paths: list, workers: int | None = None) -> tuple:
+    """
+    Encode one batch, in the current process or in a worker of the enrollment pool.
+    """
+    return get_image_encodings_batch(image_paths, workers=workers)
+
+
+def iter_encoded_batches(images, batch_size: int = DEFAULT_BATCH_SIZE, workers: int = 1):
+    """
+    Encode (name, path) pairs lazily, batch by batch.
+
+    With several workers at most ``2 * workers`` batches are in flight, so the producer never
+    runs ahead of the encoders and memory stays bounded.
+
+    Args:
+        images: Iterable of (image name, image path) pairs, e.g. ``iter_image_files(folder)``.
+        batch_size (int): Number of images encoded at once.
+        workers (int): Number of processes encoding batches in parallel. 1 encodes in the current process.
+
+    Yields:
+        tuple: The image names of a batch, their ``(B, 128)`` encodings and their statuses, in input order.
+    """
+    batches = _batched(images, batch_size)
+    if workers <= 1:
+        for batch in batches:
+            names = [name for name, _ in batch]
+            encodings, statuses = _encode_paths([path for _, path in batch])
+            yield names, encodings, statuses
+        return
+
+    with warm_executor(workers) as executor:
+        in_flight = deque()
+        try:
+            for batch in batches:
+                # Each process already runs in parallel, so its batches are decoded by one thread
+                in_flight.append(([name for name, _ in batch],
+                                  executor.submit(_encode_paths, [path for _, path in batch], 1)))
+                if len(in_flight) >= 2 * workers:
+                    names, future = in_flight.popleft()
+                    yield names, *future.result()
+            while in_flight:
+                names, future = in_flight.popleft()
+                yield names, *future.result()
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+
+
+def peak_rss_bytes() -> int | None:
+    """
+    Get the peak resident memory of this process and of its largest child process.
+
+    Worker processes are only accounted for once they have exited, i.e. after the pool is shut down.
+
+    Returns:
+        int | None: The peak RSS in bytes, None where the platform does not report it.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return scale * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def enroll_folder(image_folder: Path, csv_filename: Path, batch_size: int = DEFAULT_BATCH_SIZE, workers: int = 1,
+                  resume: bool = False, progress: bool = False) -> dict:
+    """
+    Enroll every image of a folder tree, streaming the encodings to the CSV file and its store.
+
+    Unlike ``extract_encodings``, nothing is accumulated: each batch is appended to the CSV file
+    and to the binary store as soon as it is encoded, so memory stays flat whatever the size of
+    the folder, and a crash only loses the batch in progress. Images in subfolders are named
+    by their path relative to ``image_folder``.
+
+    Args:
+        image_folder (Path): The root folder of the images.
+        csv_filename (Path): The CSV file the encodings are appended to, created if it does not exist.
+        batch_size (int): Number of images encoded and written at once.
+        workers (int): Number of processes encoding images in parallel.
+        resume (bool): Skip the images already in the store, to finish an interrupted enrollment.
+            The names of the store are kept in memory for the whole run.
+        progress (bool): Print the progress, the throughput and the peak RSS after every batch.
+
+    Returns:
+        dict: The number of images processed, encoded and without a face, the elapsed seconds,
+            the throughput in images/sec and the peak RSS in MB.
+
+    Examples:
+        >>> stats = enroll_folder(Path("images"), Path("encodings.csv"), workers=4, resume=True)
+        >>> print(f"{stats['images_per_sec']:.1f} images/sec, peak RSS {stats['peak_rss_mb']:.0f} MB")
+    """
+    csv_filename = Path(csv_filename)
+    if csv_filename.exists():
+        store = open_store_for_csv(csv_filename)
+    else:
+        with open(csv_filename, mode='w', newline='') as file:
+            csv.writer(file).writerow(['Image Name', 'encodings'])
+        store = EncodingStore.for_csv(csv_filename)
+        store.write({}, source=csv_filename)
+
+    images = iter_image_files(image_folder)
+    if resume:
+        enrolled = set(store.names)
+        images = ((name, path) for name, path in images if name not in enrolled)
+
+    stats = {"images": 0, "encoded": 0, "no_face": 0, "failed": 0}
+    start = time.perf_counter()
+    for names, encodings, statuses in iter_encoded_batches(images, batch_size, workers):
+        rows = [(name, encoding) for name, encoding, status in zip(names, encodings, statuses) if status == STATUS_OK]
+        # Appended to the CSV file and to the store under the store lock, so a station enrolling
+        # into the same gallery at the same time never leaves the store stamped without its rows
+        store.append_to_csv(csv_filename, rows)
+
+        stats["images"] += len(names)
+        stats["encoded"] += len(rows)
+        stats["no_face"] += statuses.count(STATUS_NO_FACE)
+        stats["failed"] += len(names) - len(rows) - statuses.count(STATUS_NO_FACE)
+        if progress:
+            elapsed = time.perf_counter() - start
+            rss = peak_rss_bytes()
+            print(f"Enrolled {stats['encoded']}/{stats['images']} images "
+                  f"({stats['images'] / elapsed:.1f} images/sec"
+                  + (f", peak RSS {rss / 2 ** 20:.0f} MB)" if rss is not None else ")"))
+
+    elapsed = time.perf_counter() - start
+    rss = peak_rss_bytes()
+    stats["seconds"] = elapsed
+    stats["images_per_sec"] = stats["images"] / elapsed if elapsed > 0 else 0.0
+    stats["peak_rss_mb"] = rss / 2 ** 20 if rss is not None else None
+    return stats
+
+
+def reencode_gallery(csv_filename: Path, image_folder: Path, batch_size: int = DEFAULT_BATCH_SIZE,
+                     workers: int = 1) -> dict:
+    """
+    Re-encode the rows of an enrolled gallery from their images with the current pipeline.
+
+    Galleries enrolled before images were converted from BGR to RGB hold encodings about
+    0.17-0.19 away from what the current pipeline computes for the same photo, a third of the
+    tolerance. Such a gallery must be re-encoded: the two encodings are not related by any
+    transform that could be applied to the stored rows.
+
+    Each row whose image is found at ``image_folder / name`` is re-encoded. A row without an
+    image that holds exactly the same old encoding as a re-encoded row (an enrollment copied
+    from it) gets the same new encoding. The other rows are kept unchanged and reported as
+    stale, to be re-enrolled from a new photo. The CSV file is rewritten in the same row order
+    and its binary store rebuilt.
+
+    Args:
+        csv_filename (Path): The CSV file of the gallery.
+        image_folder (Path): The root folder of the enrolled images, the row names are relative to it.
+        batch_size (int): Number of images encoded at once.
+        workers (int): Number of processes encoding images in parallel.
+
+    Returns:
+        dict: The number of rows re-encoded and copied, and the names of the stale rows.
+
+    Examples:
+        >>> stats = reencode_gallery(Path("encodings.csv"), Path("images"))
+        >>> print(stats["stale"], "still need a new photo")
+    """
+    csv_filename, image_folder = Path(csv_filename), Path(image_folder)
+    old = read_encodings_csv(csv_filename)
+    images = [(name, str(image_folder / name)) for name in old if (image_folder / name).is_file()]
+    new = {}
+    for names, encodings, statuses in iter_encoded_batches(images, batch_size, workers):
+        new.update((name, encoding) for name, encoding, status in zip(names, encodings, statuses) if status == STATUS_OK)
+
+    stats = {"reencoded": len(new), "copied": 0, "stale": []}
+    # The re-encoded rows by their old encoding, the first one when several rows shared it
+    sources = {}
+    for name in new:
+        sources.setdefault(old[name].tobytes(), name)
+    encodings_dict = {}
+    for name, encoding in old.items():
+        if name not in new:
+            source = sources.get(encoding.tobytes())
+            if source is not None:
+                new[name] = new[source]
+                stats["copied"] += 1
+            else:
+                stats["stale"].append(name)
+        encodings_dict[name] = new.get(name, encoding)
+    write_encodings_to_csv(encodings_dict, csv_filename)
+    if stats["stale"]:
+        logger.warning("%d rows could not be re-encoded.", len(stats["stale"]), extra={"stale": stats["stale"]})
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream the encodings of a folder tree of images to a CSV file.")
+    parser.add_argument("--images", type=Path, default=Path("images"))
+    parser.add_argument("--csv", type=Path, default=Path("encodings.csv"))
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--resume", action="store_true", help="skip the images already enrolled")
+    parser.add_argument("--reencode", action="store_true",
+                        help="re-encode the rows of --csv from the images of --images instead of enrolling new images")
+    args = parser.parse_args()
+
+    if args.reencode:
+        stats = reencode_gallery(args.csv, args.images, args.batch_size, args.workers)
+    else:
+        stats = enroll_folder(args.images, args.csv, args.batch_size, args.workers, args.resume, progress=True)
+    print(stats)
@@ -0,0 +1,420 @@
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from encoding_store import EncodingStore, open_store_for_csv
+from metrics import metrics
+
+# Same default as face_recognition.compare_faces
+DEFAULT_TOLERANCE = 0.6
+# Rows of the gallery scanned at once, bounds the temporary memory of a search
+DEFAULT_CHUNK_SIZE = 16384
+# Storage precisions of a gallery matrix, from exact to most compact (8, 4, 2 and 1 bytes per value)
+PRECISIONS = ("float64", "float32", "float16", "int8")
+
+
+class Match(NamedTuple):
+    """
+    One candidate identity returned by a gallery search.
+    """
+    name: str
+    distance: float
+    is_match: bool
+
+
+class QuantizedMatrix:
+    """
+    A gallery matrix stored in a compact precision.
+
+    ``float32`` and ``float16`` keep the values in a narrower float type. ``int8`` is a scalar
+    quantization with a scale and an offset per dimension: a value is stored as the nearest of
+    255 levels spanning the range of its dimension. Distances are computed chunk by chunk on the
+    compact codes, so no full-precision copy of the gallery is ever materialized.
+
+    Examples:
+        >>> quantized = QuantizedMatrix.from_matrix(store.matrix, precision="int8")
+        >>> print(quantized.nbytes, quantized.distances(encodings).shape)
+    """
+
+    def __init__(self, data: np.ndarray, scale: np.ndarray | None = None, offset: np.ndarray | None = None):
+        self.data = data
+        self.scale = scale
+        self.offset = offset
+        self.data.flags.writeable = False
+        # Squared norms of the decoded rows, the |b|^2 term of every distance
+        self.squared_norms = np.empty(len(data), dtype=np.float32)
+        for start in range(0, len(data), DEFAULT_CHUNK_SIZE):
+            rows = self.rows(start, start + DEFAULT_CHUNK_SIZE)
+            self.squared_norms[start:start + len(rows)] = np.einsum('ij,ij->i', rows, rows)
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, precision: str = "float16",
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> "QuantizedMatrix":
+        """
+        Convert a full-precision matrix, in chunks, so a memory-mapped store is never copied whole.
+
+        Args:
+            matrix (np.ndarray): The ``(N, D)`` encodings.
+            precision (str): "float32", "float16" or "int8".
+            chunk_size (int): Number of rows converted at once.
+
+        Returns:
+            QuantizedMatrix: The compact matrix.
+        """
+        if precision not in PRECISIONS[1:]:
+            raise ValueError(f"Unsupported precision {precision!r}, expected one of {PRECISIONS[1:]}.")
+        matrix = np.atleast_2d(matrix)
+        if precision != "int8":
+            data = np.empty(matrix.shape, dtype=precision)
+            for start in range(0, len(matrix), chunk_size):
+                data[start:start + chunk_size] = matrix[start:start + chunk_size]
+            return cls(data)
+
+        low = np.full(matrix.shape[1], np.inf)
+        high = np.full(matrix.shape[1], -np.inf)
+        for start in range(0, len(matrix), chunk_size):
+            chunk = matrix[start:start + chunk_size]
+            low = np.minimum(low, chunk.min(axis=0, initial=np.inf))
+            high = np.maximum(high, chunk.max(axis=0, initial=-np.inf))
+        if len(matrix) == 0:
+            low = high = np.zeros(matrix.shape[1])
+        offset = ((low + high) / 2).astype(np.float32)
+        # 254 steps between the extremes, so the codes fit in [-127, 127]
+        scale = np.maximum((high - low) / 254, np.finfo(np.float32).tiny).astype(np.float32)
+        data = np.empty(matrix.shape, dtype=np.int8)
+        for start in range(0, len(matrix), chunk_size):
+            codes = np.rint((matrix[start:start + chunk_size] - offset) / scale)
+            data[start:start + chunk_size] = np.clip(codes, -127, 127)
+        return cls(data, scale, offset)
+
+    @property
+    def precision(self) -> str:
+        return self.data.dtype.name
+
+    @property
+    def shape(self) -> tuple:
+        return self.data.shape
+
+    @property
+    def nbytes(self) -> int:
+        extra = 0 if self.scale is None else self.scale.nbytes + self.offset.nbytes
+        return self.data.nbytes + self.squared_norms.nbytes + extra
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def rows(self, start: int, stop: int) -> np.ndarray:
+        """
+        Decode a range of rows.
+
+        Returns:
+            np.ndarray: The ``(stop - start, D)`` float32 encodings.
+        """
+        rows = self.data[start:stop].astype(np.float32)
+        if self.scale is not None:
+            rows *= self.scale
+            rows += self.offset
+        return rows
+
+    def __getitem__(self, row: int) -> np.ndarray:
+        return self.rows(row, row + 1)[0].astype(np.float64)
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        # Full decode, for the code paths that need a plain matrix
+        return self.rows(0, len(self)).astype(dtype or np.float64)
+
+    def distances(self, encodings: np.ndarray, start: int = 0, stop: int | None = None) -> np.ndarray:
+        """
+        Compute the euclidean distances between a range of rows and query encodings.
+
+        For ``int8`` the product is taken with the codes directly: with ``b = offset + scale * c``,
+        ``a.b = a.offset + (a * scale).c``.
+
+        Args:
+            encodings (np.ndarray): The ``(Q, D)`` query encodings.
+            start (int): First row of the range.
+            stop (int | None): End of the range, the end of the matrix if None.
+
+        Returns:
+            np.ndarray: The ``(Q, stop - start)`` float64 distances.
+        """
+        encodings = np.atleast_2d(np.asarray(encodings, dtype=np.float32))
+        stop = len(self) if stop is None else min(stop, len(self))
+        codes = self.data[start:stop].astype(np.float32)
+        if self.scale is None:
+            products = encodings @ codes.T
+        else:
+            products = (encodings * self.scale) @ codes.T
+            products += (encodings @ self.offset)[:, np.newaxis]
+        squared = self.squared_norms[np.newaxis, start:stop] - 2.0 * products
+        squared += np.einsum('ij,ij->i', encodings, encodings)[:, np.newaxis]
+        np.maximum(squared, 0.0, out=squared)
+        return np.sqrt(squared, out=squared).astype(np.float64)
+
+
+class Gallery:
+    """
+    An in-memory gallery: the names, a contiguous ``(N, 128)`` matrix and a name to row index.
+
+    With a ``precision`` other than float64 the matrix is a ``QuantizedMatrix``, 2 to 8 times smaller.
+    """
+
+    def __init__(self, names: list, matrix: np.ndarray, precision: str = "float64"):
+        self.names = list(names)
+        if precision == "float64":
+            self.matrix = np.ascontiguousarray(matrix, dtype=np.float64)
+            self.matrix.flags.writeable = False
+        else:
+            self.matrix = QuantizedMatrix.from_matrix(matrix, precision)
+        self.index = {name: row for row, name in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, image_name: str) -> bool:
+        return image_name in self.index
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def get(self, image_name: str) -> np.ndarray | None:
+        """
+        Get the encoding of an image.
+
+        Args:
+            image_name (str): Name of the image.
+
+        Returns:
+            np.ndarray | None: A read-only view of the encoding if found (a decoded copy for a
+                quantized gallery), None otherwise.
+        """
+        row = self.index.get(image_name)
+        return None if row is None else self.matrix[row]
+
+
+class GalleryCache:
+    """
+    Process-wide cache of the galleries loaded from CSV files.
+
+    A cached gallery is reused as long as the size and mtime of its CSV file are unchanged,
+    and reloaded otherwise. When ``max_bytes`` is set, the least recently used galleries are
+    evicted to keep the cached matrices under that size; a gallery larger than the bound is
+    returned without being cached. ``precision`` sets the storage precision of the loaded galleries.
+
+    Examples:
+        >>> cache = GalleryCache(max_bytes=512 * 1024 * 1024, precision="float16")
+        >>> gallery = cache.get(Path("encodings.csv"))
+        >>> print(cache.stats())
+    """
+
+    def __init__(self, max_bytes: int | None = None, precision: str = "float64"):
+        self.max_bytes = max_bytes
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, csv_filename: Path) -> Gallery:
+        """
+        Get the gallery of a CSV file, loading it only if it is not cached or changed on disk.
+
+        Args:
+            csv_filename (Path): Path to the CSV file containing image encodings.
+
+        Returns:
+            Gallery: The gallery holding the encodings of the CSV file.
+        """
+        key = os.path.abspath(csv_filename)
+        stat = os.stat(key)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            if entry is None:
+                self.misses += 1
+            else:
+                self.reloads += 1
+                del self._entries[key]
+
+        store = open_store_for_csv(Path(csv_filename))
+        gallery = Gallery(store.names, store.matrix, self.precision)
+
+        with self._lock:
+            if self.max_bytes is None or gallery.nbytes <= self.max_bytes:
+                self._entries[key] = (signature, gallery)
+                self._entries.move_to_end(key)
+                self._evict()
+        return gallery
+
+    def _evict(self) -> None:
+        if self.max_bytes is None:
+            return
+        while self._entries and self.nbytes > self.max_bytes:
+            self._entries.popitem(last=False)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(gallery.nbytes for _, gallery in self._entries.values())
+
+    def stats(self) -> dict:
+        """
+        Get the cache counters.
+
+        Returns:
+            dict: The hits, misses, reloads, number of cached galleries and their size in bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "galleries": len(self._entries),
+                "bytes": self.nbytes,
+            }
+
+    def clear(self) -> None:
+        """
+        Drop every cached gallery and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.reloads = 0
+
+
+gallery_cache = GalleryCache()
+
+
+def load_gallery(csv_filename: Path) -> Gallery:
+    """
+    Load the gallery of a CSV file through the process-wide cache.
+
+    Args:
+        csv_filename (Path): Path to the CSV file containing image encodings.
+
+    Returns:
+        Gallery: The gallery holding the encodings of the CSV file.
+    """
+    return gallery_cache.get(csv_filename)
+
+
+def as_gallery(gallery) -> tuple:
+    """
+    Get the names and the encoding matrix of a gallery.
+
+    Args:
+        gallery (Path | Gallery | EncodingStore | dict | tuple): A CSV file of encodings, a loaded
+            gallery, a binary store, a dictionary of image names to encodings, or an already
+            split ``(names, matrix)`` pair.
+
+    Returns:
+        tuple: The list of names and the ``(N, 128)`` encoding matrix (a ``QuantizedMatrix`` for
+            a quantized gallery), in the same order.
+    """
+    if isinstance(gallery, (str, Path)):
+        gallery = load_gallery(Path(gallery))
+    if isinstance(gallery, (Gallery, EncodingStore)):
+        return gallery.names, gallery.matrix
+    if isinstance(gallery, dict):
+        names = list(gallery.keys())
+        if not names:
+            return names, np.empty((0, 128))
+        return names, np.stack([np.asarray(encoding, dtype=np.float64) for encoding in gallery.values()])
+    names, matrix = gallery
+    return list(names), np.asarray(matrix)
+
+
+def face_distance_matrix(matrix: np.ndarray, encodings: np.ndarray) -> np.ndarray:
+    """
+    Compute the euclidean distances between gallery rows and query encodings with one matrix product.
+
+    Args:
+        matrix (np.ndarray): The ``(N, D)`` gallery encodings.
+        encodings (np.ndarray): The ``(Q, D)`` query encodings.
+
+    Returns:
+        np.ndarray: The ``(Q, N)`` float64 distances.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    encodings = np.asarray(encodings, dtype=np.float64)
+    # |a - b|^2 = |a|^2 - 2 a.b + |b|^2
+    squared = np.einsum('ij,ij->i', matrix, matrix)[np.newaxis, :]
+    squared = squared - 2.0 * (encodings @ matrix.T)
+    squared += np.einsum('ij,ij->i', encodings, encodings)[:, np.newaxis]
+    np.maximum(squared, 0.0, out=squared)
+    return np.sqrt(squared, out=squared)
+
+
+def search_gallery(matrix: np.ndarray, names: list, encodings: np.ndarray, k: int = 5,
+                   tolerance: float = DEFAULT_TOLERANCE, chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+    """
+    Find the k closest gallery identities of one or more encodings.
+
+    The gallery is scanned in chunks of ``chunk_size`` rows, so the temporary memory stays
+    bounded no matter how large the gallery is, and only the best k candidates of each
+    query are kept between chunks.
+
+    Args:
+        matrix (np.ndarray | QuantizedMatrix): The ``(N, 128)`` gallery encodings, full precision or compact.
+        names (list): The gallery names, in the same order as the rows of the matrix.
+        encodings (np.ndarray): One ``(128,)`` encoding or a ``(Q, 128)`` batch of encodings.
+        k (int): Number of candidates to return per encoding.
+        tolerance (float): Maximum distance for a candidate to be considered a match.
+        chunk_size (int): Number of gallery rows compared at once.
+
+    Returns:
+        list: The candidates sorted by increasing distance, as a list of ``Match`` for a single
+            encoding, or one such list per encoding for a batch.
+
+    Examples:
+        >>> names, matrix = as_gallery(Path("encodings.csv"))
+        >>> for match in search_gallery(matrix, names, encoding, k=3):
+        >>>     print(match.name, match.distance, match.is_match)
+    """
+    with metrics.timer("distance"):
+        return _search_gallery(matrix, names, encodings, k, tolerance, chunk_size)
+
+
+def _search_gallery(matrix, names: list, encodings: np.ndarray, k: int, tolerance: float, chunk_size: int) -> list:
+    encodings = np.asarray(encodings, dtype=np.float64)
+    single = encodings.ndim == 1
+    encodings = np.atleast_2d(encodings)
+    queries = encodings.shape[0]
+    k = min(k, len(names))
+
+    best_distances = np.empty((queries, 0))
+    best_rows = np.empty((queries, 0), dtype=np.int64)
+    if k > 0:
+        for start in range(0, len(names), chunk_size):
+            if isinstance(matrix, QuantizedMatrix):
+                distances = matrix.distances(encodings, start, start + chunk_size)
+            else:
+                distances = face_distance_matrix(matrix[start:start + chunk_size], encodings)
+            rows = np.broadcast_to(np.arange(start, start + distances.shape[1]), distances.shape)
+            distances = np.concatenate([best_distances, distances], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            if distances.shape[1] > k:
+                keep = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                distances = np.take_along_axis(distances, keep, axis=1)
+                rows = np.take_along_axis(rows, keep, axis=1)
+            best_distances, best_rows = distances, rows
+
+    order = np.argsort(best_distances, axis=1, kind='stable')
+    best_distances = np.take_along_axis(best_distances, order, axis=1)
+    best_rows = np.take_along_axis(best_rows, order, axis=1)
+
+    results = [
+        [Match(names[row], float(distance), bool(distance <= tolerance))
+         for row, distance in zip(query_rows, query_distances)]
+        for query_rows, query_distances in zip(best_rows, best_distances)
+    ]
+    return results[0] if single else results
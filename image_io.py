@@ -0,0 +1,126 @@
+import io
+import struct
+
+import numpy as np
+
+from metrics import metrics
+
+# Scale factors OpenCV can decode a JPEG at directly, by skipping DCT coefficients
+REDUCTION_FACTORS = (8, 4, 2)
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG start-of-frame markers: every 0xC0-0xCF marker except DHT (C4), JPG (C8) and DAC (CC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _jpeg_size(file) -> tuple | None:
+    if file.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        if file.read(1) != b'\xff':
+            return None
+        marker = file.read(1)
+        while marker == b'\xff':  # Fill bytes before a marker
+            marker = file.read(1)
+        if not marker:
+            return None
+        marker = marker[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            continue  # Markers without a payload
+        header = file.read(2)
+        if len(header) < 2:
+            return None
+        length = struct.unpack('>H', header)[0]
+        if marker in JPEG_SOF_MARKERS:
+            frame = file.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack('>xHH', frame)
+            return width, height
+        # Skip the segment, e.g. the EXIF block and its thumbnail, without reading it
+        file.seek(length - 2, io.SEEK_CUR)
+
+
+def image_size(image) -> tuple | None:
+    """
+    Read the dimensions of a JPEG or PNG image from its header, without decoding it.
+
+    Args:
+        image (Path | str | bytes): The image file or its content.
+
+    Returns:
+        tuple | None: The (width, height) of the image, None if it is not a readable JPEG or PNG.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        file = io.BytesIO(image)
+    else:
+        try:
+            file = open(image, mode='rb')
+        except OSError:
+            return None
+    with file:
+        signature = file.read(8)
+        if signature == PNG_SIGNATURE:
+            header = file.read(16)
+            if len(header) < 16 or header[4:8] != b'IHDR':
+                return None
+            return struct.unpack('>II', header[8:16])
+        file.seek(0)
+        return _jpeg_size(file)
+
+
+def reduction_factor(size: tuple | None, max_side: int | None) -> int:
+    """
+    Choose the largest reduced decode that keeps the longest side of an image at least ``max_side``.
+
+    Args:
+        size (tuple | None): The (width, height) of the image, None if unknown.
+        max_side (int | None): The resolution detection needs, None to always decode at full size.
+
+    Returns:
+        int: 1 (full size), 2, 4 or 8.
+    """
+    if size is None or max_side is None:
+        return 1
+    for factor in REDUCTION_FACTORS:
+        if max(size) // factor >= max_side:
+            return factor
+    return 1
+
+
+def read_image(image, max_side: int | None = None, grayscale: bool = False) -> np.ndarray | None:
+    """
+    Decode an image given as a file, as the content of a file, or already decoded.
+
+    When ``max_side`` is set and the image is much larger, it is decoded at 1/2, 1/4 or 1/8 of its
+    size with OpenCV's ``IMREAD_REDUCED_*`` modes, which for a JPEG skip the high frequency DCT
+    coefficients instead of decoding every pixel and resizing. The longest side of the result
+    stays at least ``max_side``.
+
+    Args:
+        image (Path | str | bytes | np.ndarray): A path, encoded image bytes, or a decoded BGR image.
+        max_side (int | None): The resolution the caller needs, None to decode at full size.
+            Arrays are returned as they are.
+        grayscale (bool): Decode to a single channel image instead of BGR.
+
+    Returns:
+        np.ndarray | None: The decoded image, None if it could not be decoded.
+
+    Examples:
+        >>> image = read_image(Path("images/ouail.jpg"), max_side=1000)
+        >>> image = read_image(request_body, grayscale=True)
+    """
+    import cv2
+
+    if isinstance(image, np.ndarray):
+        if grayscale and image.ndim == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return image
+    factor = reduction_factor(image_size(image), max_side) if max_side is not None else 1
+    if factor == 1:
+        flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+    else:
+        flags = getattr(cv2, f"IMREAD_REDUCED_{'GRAYSCALE' if grayscale else 'COLOR'}_{factor}")
+    with metrics.timer("decode"):
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), flags)
+        return cv2.imread(str(image), flags)
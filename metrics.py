@@ -0,0 +1,257 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+# Latency buckets of the stage histograms, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Pipeline stages timed across the modules
+STAGES = ("decode", "gate", "detect", "landmark", "encode", "lookup", "distance")
+# Set FACE_METRICS=1 to collect metrics from the start of the process
+METRICS_ENV = "FACE_METRICS"
+
+
+class _NullTimer:
+    """
+    Timer handed out while metrics are disabled: entering and leaving it does nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, metrics: "Metrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram, in the layout Prometheus expects.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self) -> list:
+        """
+        Get the cumulative counts of the buckets.
+
+        Returns:
+            list: (upper bound, count) pairs, the last bound being ``inf``.
+        """
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """
+    Process-wide registry of stage timers, event counters and latency histograms.
+
+    While disabled, ``timer`` returns a shared no-op context manager and ``increment`` returns
+    right away, so the instrumentation left in the hot paths costs one attribute check.
+
+    Examples:
+        >>> metrics.enable()
+        >>> with metrics.timer("detect"):
+        >>>     face_locations = face_recognition.face_locations(image)
+        >>> metrics.increment("no_face")
+        >>> print(metrics.prometheus())
+    """
+
+    def __init__(self, enabled: bool = False, buckets: tuple = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        """
+        Drop every counter and histogram.
+        """
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def timer(self, stage: str):
+        """
+        Time a block of code as one observation of a stage.
+
+        Args:
+            stage (str): The stage name, e.g. "detect".
+
+        Returns:
+            A context manager recording the elapsed time when the block exits.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Record one latency of a stage.
+
+        Args:
+            stage (str): The stage name.
+            seconds (float): The latency in seconds.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def increment(self, event: str, amount: int = 1) -> None:
+        """
+        Count an event, e.g. "no_face" or "cache_hit".
+
+        Args:
+            event (str): The event name.
+            amount (int): How many events happened.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[event] = self.counters.get(event, 0) + amount
+
+    def snapshot(self) -> dict:
+        """
+        Get the current values as plain Python types.
+
+        Returns:
+            dict: The counters, and per stage the count, total, mean, estimated p50/p99 and max latencies.
+        """
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "stages": {
+                    stage: {
+                        "count": histogram.count,
+                        "total_seconds": histogram.sum,
+                        "mean_ms": histogram.sum / histogram.count * 1000,
+                        "p50_ms": histogram.quantile(0.5) * 1000,
+                        "p99_ms": histogram.quantile(0.99) * 1000,
+                        "max_ms": histogram.max * 1000,
+                    }
+                    for stage, histogram in self.histograms.items()
+                },
+            }
+
+    def prometheus(self, prefix: str = "face") -> str:
+        """
+        Render the current values in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): Prefix of the metric names.
+
+        Returns:
+            str: The ``<prefix>_events_total`` counters and the ``<prefix>_stage_seconds`` histograms.
+        """
+        lines = [
+            f"# HELP {prefix}_events_total Events counted by the face recognition pipeline.",
+            f"# TYPE {prefix}_events_total counter",
+        ]
+        with self._lock:
+            for event, value in sorted(self.counters.items()):
+                lines.append(f'{prefix}_events_total{{event="{event}"}} {value}')
+            lines.append(f"# HELP {prefix}_stage_seconds Latency of the face recognition pipeline stages.")
+            lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+            for stage, histogram in sorted(self.histograms.items()):
+                for bound, total in histogram.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {total}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum!r}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(enabled=os.environ.get(METRICS_ENV) == "1")
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format log records as one JSON object per line, with the ``extra`` fields of the call.
+    """
+
+    # Attributes every LogRecord has, the others come from ``extra``
+    _RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self._RESERVED})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: int = logging.INFO, json_format: bool = False) -> None:
+    """
+    Send the log records of every module to stderr, as text or as JSON lines.
+
+    Args:
+        level (int): The minimum level of the records shown.
+        json_format (bool): Write one JSON object per record instead of a line of text.
+    """
+    handler = logging.StreamHandler()
+    if json_format:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logging.basicConfig(level=level, handlers=[handler], force=True)
@@ -0,0 +1,406 @@
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from encoding_image import encode_image
+from gallery import DEFAULT_TOLERANCE, load_gallery, search_gallery
+from metrics import configure_logging, metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 20 * 1024 * 1024
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+           422: "Unprocessable Entity", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    """
+    An error answered to the client with its status code.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def encode_image_bytes(image_bytes: bytes) -> np.ndarray | None:
+    """
+    Decode an image file held in memory and get its face encoding.
+
+    Args:
+        image_bytes (bytes): The content of a JPEG or PNG file.
+
+    Returns:
+        np.ndarray | None: The encoding of the first face found, None if there is no face.
+
+    Raises:
+        HTTPError: 400 if the upload is empty or is not an image.
+    """
+    if not image_bytes:
+        raise HTTPError(400, "Empty image.")
+    with metrics.timer("decode"):
+        try:
+            image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        except cv2.error:
+            image = None
+    if image is None or image.size == 0:
+        raise HTTPError(400, "Could not decode the image.")
+    return encode_image(image)
+
+
+class MicroBatcher:
+    """
+    Groups the items submitted within a short window and processes them with one call.
+
+    The first item of a batch waits at most ``max_delay`` seconds for others to join it; a
+    batch is flushed early once it holds ``max_batch`` items. ``process_batch`` runs in the
+    executor, so the event loop never blocks on it.
+
+    Examples:
+        >>> batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_batch=8, max_delay=0.005)
+        >>> result = await batcher.submit(21)
+    """
+
+    def __init__(self, process_batch, max_batch: int = 16, max_delay: float = 0.005, executor=None):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.executor = executor
+        self.batches = 0
+        self.items = 0
+        self._pending = []
+        self._timer = None
+
+    async def submit(self, item):
+        """
+        Add an item to the current batch and wait for its result.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: list) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.process_batch, [item for item, _ in batch])
+        except Exception as error:
+            results = [error] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+class VerificationServer:
+    """
+    Long-running HTTP service answering 1:1 verifications and 1:N identifications.
+
+    The face models are loaded once at startup and the gallery is kept in memory through the
+    process-wide gallery cache. Each image is decoded and encoded in its own task of a thread
+    pool, so the images of concurrent requests are encoded in parallel, and the encodings
+    arriving within ``batch_delay`` seconds are compared as one batch. An image that fails
+    only fails its own request. At most ``max_concurrency`` requests are processed at once and
+    up to ``max_queue`` more wait; beyond that the server answers 503 right away so clients
+    back off instead of piling up.
+
+    Endpoints (JSON bodies, images as base64):
+        POST /verify    {"image": ..., "voter_id": "ouail.jpg"} -> {"match": true, "distance": 0.31}
+        POST /identify  {"image": ..., "k": 5} -> {"matches": [{"name": ..., "distance": ..., "match": ...}]}
+        GET  /health, GET /stats, GET /metrics (Prometheus text)
+
+    Examples:
+        >>> server = VerificationServer(Path("encodings.csv"), port=8080)
+        >>> asyncio.run(server.serve_forever())
+    """
+
+    def __init__(self, csv_filename: Path, host: str = "127.0.0.1", port: int = 8080, max_concurrency: int = 32,
+                 max_queue: int = 128, max_batch: int = 16, batch_delay: float = 0.005, workers: int | None = None,
+                 tolerance: float = DEFAULT_TOLERANCE, encode=encode_image_bytes):
+        self.csv_filename = Path(csv_filename)
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.tolerance = tolerance
+        self.encode = encode
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+        self.batcher = MicroBatcher(self._process_batch, max_batch=max_batch, max_delay=batch_delay,
+                                    executor=self.executor)
+        self.requests = 0
+        self.rejected = 0
+        self._in_flight = 0
+        self._semaphore = None
+        self._server = None
+
+    def warm_up(self) -> None:
+        """
+        Load the gallery and run the models once, so the first request does not pay for it.
+        """
+        load_gallery(self.csv_filename)
+        blank = cv2.imencode(".jpg", np.zeros((64, 64, 3), dtype=np.uint8))[1].tobytes()
+        self.encode(blank)
+
+    async def start(self) -> None:
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.warm_up)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Verification server listening on http://%s:%d", self.host, self.port)
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self.executor.shutdown(wait=False)
+
+    async def _encode(self, job: dict) -> dict:
+        """
+        Encode the image of a job in the thread pool, one task per image.
+        """
+        encoding = await asyncio.get_running_loop().run_in_executor(self.executor, self.encode, job["image"])
+        if encoding is None:
+            raise HTTPError(422, "No face detected in the image.")
+        return {**job, "image": None, "encoding": encoding}
+
+    def _process_batch(self, jobs: list) -> list:
+        """
+        Compare the encodings of the batch with the gallery, the identifications with one matrix operation.
+
+        A job that fails gets its exception as its result, the other jobs are answered.
+        """
+        gallery = load_gallery(self.csv_filename)
+        results = [None] * len(jobs)
+
+        identify = [i for i, job in enumerate(jobs) if job["endpoint"] == "identify"]
+        if identify:
+            try:
+                k = max(jobs[i]["k"] for i in identify)
+                batch = np.stack([jobs[i]["encoding"] for i in identify])
+                matches = search_gallery(gallery.matrix, gallery.names, batch, k=k, tolerance=self.tolerance)
+                for i, candidates in zip(identify, matches):
+                    results[i] = {"matches": [
+                        {"name": match.name, "distance": match.distance, "match": match.is_match}
+                        for match in candidates[:jobs[i]["k"]]
+                    ]}
+            except Exception as error:
+                for i in identify:
+                    results[i] = error
+
+        for i, job in enumerate(jobs):
+            if job["endpoint"] != "verify":
+                continue
+            try:
+                with metrics.timer("lookup"):
+                    known_encoding = gallery.get(job["voter_id"])
+                if known_encoding is None:
+                    raise HTTPError(404, f"Unknown voter {job['voter_id']}.")
+                distance = float(np.linalg.norm(known_encoding - job["encoding"]))
+                results[i] = {"voter_id": job["voter_id"], "match": distance <= self.tolerance, "distance": distance}
+            except Exception as error:
+                results[i] = error
+        return results
+
+    async def _handle_request(self, method: str, path: str, body: bytes) -> dict | str:
+        if method == "GET" and path == "/health":
+            return {"status": "ok"}
+        if method == "GET" and path == "/stats":
+            return self.stats()
+        if method == "GET" and path == "/metrics":
+            return metrics.prometheus()
+        if method != "POST" or path not in ("/verify", "/identify"):
+            raise HTTPError(404, f"No route for {method} {path}.")
+
+        try:
+            payload = json.loads(body)
+            job = {"endpoint": path[1:], "image": base64.b64decode(payload["image"])}
+            if job["endpoint"] == "verify":
+                job["voter_id"] = str(payload["voter_id"])
+            else:
+                job["k"] = max(1, int(payload.get("k", 5)))
+        except (ValueError, KeyError, TypeError) as error:
+            raise HTTPError(400, f"Invalid request body: {error}")
+
+        # Backpressure: refuse work the server cannot start soon
+        if self._in_flight >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise HTTPError(503, "Server busy, retry later.")
+        self._in_flight += 1
+        try:
+            async with self._semaphore:
+                return await self.batcher.submit(await self._encode(job))
+        finally:
+            self._in_flight -= 1
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+
+                start = time.perf_counter()
+                self.requests += 1
+                if length > MAX_BODY_BYTES:
+                    status, response = 413, {"error": "Request body too large."}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    try:
+                        status, response = 200, await self._handle_request(method, path, body)
+                    except HTTPError as error:
+                        status, response = error.status, {"error": str(error)}
+                    except Exception as error:
+                        logger.exception("Request %s %s failed", method, path)
+                        status, response = 500, {"error": str(error)}
+                if isinstance(response, str):
+                    data, content_type = response.encode(), "text/plain; version=0.0.4"
+                else:
+                    response["latency_ms"] = (time.perf_counter() - start) * 1000
+                    data, content_type = json.dumps(response).encode(), "application/json"
+                head = [
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                    f"Content-Type: {content_type}",
+                    f"Content-Length: {len(data)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                ]
+                if status == 503:
+                    head.append("Retry-After: 1")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def stats(self) -> dict:
+        """
+        Get the server counters.
+
+        Returns:
+            dict: Requests received and rejected, requests in flight, the average batch size
+                and the pipeline metrics.
+        """
+        return {
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "in_flight": self._in_flight,
+            "batches": self.batcher.batches,
+            "average_batch_size": self.batcher.items / self.batcher.batches if self.batcher.batches else 0.0,
+            "metrics": metrics.snapshot(),
+        }
+
+
+async def request(host: str, port: int, method: str, path: str, payload: dict | None = None) -> tuple:
+    """
+    Send one request to a verification server, the bundled client used for tests and load tests.
+
+    Args:
+        host (str): Server host.
+        port (int): Server port.
+        method (str): "GET" or "POST".
+        path (str): The endpoint, e.g. "/verify".
+        payload (dict | None): The JSON body.
+
+    Returns:
+        tuple: The HTTP status code and the decoded JSON response (the text of a text response).
+
+    Examples:
+        >>> image = base64.b64encode(Path("images/unknown.jpg").read_bytes()).decode()
+        >>> status, response = await request("127.0.0.1", 8080, "POST", "/verify", {"image": image, "voter_id": "ouail.jpg"})
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        body = json.dumps(payload).encode() if payload is not None else b""
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        content_type = "application/json"
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+            elif name.strip().lower() == "content-type":
+                content_type = value.strip()
+        data = await reader.readexactly(length)
+        return status, json.loads(data) if content_type.startswith("application/json") else data.decode()
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Face verification HTTP server.")
+    parser.add_argument("--csv", type=Path, default=Path("encodings.csv"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--max-queue", type=int, default=128)
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--batch-delay-ms", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--metrics", action="store_true", help="collect the stage timers and counters")
+    parser.add_argument("--log-json", action="store_true", help="write the logs as JSON lines")
+    args = parser.parse_args()
+
+    configure_logging(json_format=args.log_json)
+    if args.metrics:
+        metrics.enable()
+
+    server = VerificationServer(args.csv, args.host, args.port, max_concurrency=args.max_concurrency,
+                                max_queue=args.max_queue, max_batch=args.max_batch,
+                                batch_delay=args.batch_delay_ms / 1000, workers=args.workers)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,374 @@
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from gallery import DEFAULT_CHUNK_SIZE, DEFAULT_TOLERANCE, Gallery, as_gallery, search_gallery
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds a shard has to answer a query before the coordinator gives up on it
+DEFAULT_SHARD_TIMEOUT = 5.0
+# Seconds a shard worker has to load its gallery
+DEFAULT_START_TIMEOUT = 120.0
+
+
+def shard_of(image_name: str) -> str:
+    """
+    Get the default shard of an image: its top folder, e.g. the region of "casablanca/anfa/1234.jpg".
+
+    Args:
+        image_name (str): The name of the image, relative to the enrollment folder.
+
+    Returns:
+        str: The first component of the name, "default" for a name without a folder.
+    """
+    head, separator, _ = image_name.partition("/")
+    return head if separator else "default"
+
+
+def partition_gallery(gallery, key=shard_of) -> dict:
+    """
+    Split a gallery into shards.
+
+    Args:
+        gallery (Path | Gallery | EncodingStore | dict | tuple): The gallery to split.
+        key (callable): Maps an image name to the name of its shard, by default its top folder.
+
+    Returns:
+        dict: The ``(names, matrix)`` of every shard, by shard name.
+
+    Examples:
+        >>> shards = partition_gallery(Path("encodings.csv"), key=lambda name: name.split("/")[0])
+        >>> print({shard: len(names) for shard, (names, _) in shards.items()})
+    """
+    names, matrix = as_gallery(gallery)
+    rows = {}
+    for row, name in enumerate(names):
+        rows.setdefault(key(name), []).append(row)
+    matrix = np.asarray(matrix)
+    return {shard: ([names[row] for row in shard_rows], matrix[shard_rows]) for shard, shard_rows in rows.items()}
+
+
+def _serve_shard(connection, source, precision: str, chunk_size: int) -> None:
+    """
+    Body of a shard worker: load the shard once, then answer queries until told to stop.
+    """
+    try:
+        names, matrix = as_gallery(Path(source) if isinstance(source, str) else source)
+        gallery = Gallery(names, matrix, precision)
+    except Exception as error:
+        connection.send((None, error))
+        return
+    connection.send((None, len(gallery)))
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        request_id, operation, args = request
+        try:
+            if operation == "search":
+                encodings, k, tolerance = args
+                result = search_gallery(gallery.matrix, gallery.names, encodings, k, tolerance, chunk_size)
+            else:
+                result = gallery.get(args)
+                result = None if result is None else np.array(result)
+        except Exception as error:
+            result = error
+        connection.send((request_id, result))
+
+
+class ScatterResult(NamedTuple):
+    """
+    The merged answer of the shards, and the shards that did not answer in time.
+    """
+    matches: list
+    timed_out: list
+
+
+class ShardedGallery:
+    """
+    A gallery split into shards, each held and scanned by its own worker process.
+
+    A query is sent to every selected shard at once (scatter), each shard searches its own
+    rows, and the coordinator merges their top k (gather). Shards scan in parallel, so the
+    latency of a query shrinks, and the throughput grows, with the number of shards as long
+    as there are cores for them; the memory of the gallery is split between the workers.
+    A shard that does not answer within ``timeout`` is left out of the answer instead of
+    delaying it, and reported in ``ScatterResult.timed_out``.
+
+    Queries from several threads run concurrently: each query has its own request id, and a
+    receiver thread routes the answers of the shards to the query waiting for them.
+
+    Shards are typically regions or polling stations, so a query can be restricted to the
+    shards a voter is registered in.
+
+    Args:
+        shards (dict): The source of every shard by shard name: a CSV file of encodings, a
+            ``Gallery``, an ``EncodingStore``, a dict of encodings or a ``(names, matrix)`` pair,
+            e.g. the output of ``partition_gallery``.
+        timeout (float): Seconds a shard has to answer a query.
+        precision (str): Storage precision of the shard matrices, one of ``PRECISIONS``.
+        chunk_size (int): Number of gallery rows compared at once in a shard.
+        mp_context: The multiprocessing context of the workers, "spawn" by default.
+
+    Examples:
+        >>> with ShardedGallery(partition_gallery(Path("encodings.csv"))) as gallery:
+        >>>     matches = gallery.search(encoding, k=5, shards=["casablanca"])
+        >>>     matches = identify(Path("images/unknown.jpg"), gallery, k=3)
+    """
+
+    def __init__(self, shards: dict, timeout: float = DEFAULT_SHARD_TIMEOUT, precision: str = "float64",
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, mp_context=None):
+        self.sources = {name: self._picklable(source) for name, source in shards.items()}
+        self.timeout = timeout
+        self.precision = precision
+        self.chunk_size = chunk_size
+        self.mp_context = mp_context or multiprocessing.get_context("spawn")
+        self.sizes = {}
+        self._connections = {}
+        self._processes = {}
+        self._send_locks = {}
+        self._request_ids = itertools.count(1)
+        # Queries waiting for answers by request id, guarded by the lock
+        self._queries = {}
+        self._lock = threading.Lock()
+        self._receiver = None
+        self._closing = False
+        self._stopped = set()
+
+    @staticmethod
+    def _picklable(source):
+        # Files are loaded by the workers themselves, anything else is sent to them as arrays
+        if isinstance(source, (str, Path)):
+            return str(source)
+        names, matrix = as_gallery(source)
+        return list(names), np.asarray(matrix, dtype=np.float64)
+
+    @property
+    def shard_names(self) -> list:
+        return list(self.sources)
+
+    def __len__(self) -> int:
+        return sum(self.sizes.values())
+
+    def __enter__(self) -> "ShardedGallery":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def start(self, timeout: float = DEFAULT_START_TIMEOUT) -> "ShardedGallery":
+        """
+        Start one worker per shard and wait until every shard is loaded.
+
+        Args:
+            timeout (float): Seconds the shards have to load.
+
+        Returns:
+            ShardedGallery: The gallery itself.
+
+        Raises:
+            RuntimeError: If a shard failed to load or did not load in time.
+        """
+        for name, source in self.sources.items():
+            parent, child = self.mp_context.Pipe()
+            process = self.mp_context.Process(target=_serve_shard, args=(child, source, self.precision, self.chunk_size),
+                                              name=f"shard-{name}", daemon=True)
+            process.start()
+            child.close()
+            self._connections[name] = parent
+            self._processes[name] = process
+            self._send_locks[name] = threading.Lock()
+
+        deadline = time.monotonic() + timeout
+        for name, connection in self._connections.items():
+            if not connection.poll(max(0.0, deadline - time.monotonic())):
+                self.close()
+                raise RuntimeError(f"Shard {name} did not load in {timeout} seconds.")
+            try:
+                _, size = connection.recv()
+            except EOFError:
+                size = RuntimeError("the worker exited")
+            if isinstance(size, Exception):
+                self.close()
+                raise RuntimeError(f"Shard {name} failed to load: {size}")
+            self.sizes[name] = size
+        self._closing = False
+        self._stopped.clear()
+        self._receiver = threading.Thread(target=self._receive, name="shard-receiver", daemon=True)
+        self._receiver.start()
+        logger.info("Started %d shards holding %d encodings.", len(self.sizes), len(self), extra={"shards": self.sizes})
+        return self
+
+    def close(self) -> None:
+        """
+        Stop the shard workers.
+        """
+        self._closing = True
+        for name, connection in self._connections.items():
+            try:
+                with self._send_locks[name]:
+                    connection.send(None)
+            except (OSError, ValueError):
+                pass
+        for process in self._processes.values():
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        if self._receiver is not None:
+            self._receiver.join()
+            self._receiver = None
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+        self._processes.clear()
+        self._send_locks.clear()
+
+    def _receive(self) -> None:
+        """
+        Body of the receiver thread: route the answer of every shard to the query waiting for it.
+        """
+        connections = {connection: name for name, connection in self._connections.items()}
+        while connections and not self._closing:
+            for connection in wait(list(connections), timeout=0.1):
+                name = connections[connection]
+                try:
+                    request_id, result = connection.recv()
+                except (EOFError, OSError):
+                    del connections[connection]
+                    self._stopped.add(name)
+                    if not self._closing:
+                        logger.error("Shard %s stopped.", name, extra={"shard": name})
+                    request_id, result = None, RuntimeError(f"shard {name} stopped")
+                with self._lock:
+                    # Late answers to a query that already timed out are dropped
+                    queries = self._queries.values() if request_id is None else [self._queries.get(request_id)]
+                    for query in queries:
+                        if query is None or name not in query["pending"]:
+                            continue
+                        query["pending"].discard(name)
+                        query["answers"][name] = result
+                        if not query["pending"]:
+                            query["done"].set()
+
+    def _scatter(self, operation: str, args, shards: list | None, timeout: float | None) -> tuple:
+        """
+        Send a request to the selected shards and collect the answers that arrive in time.
+
+        Returns:
+            tuple: The answers by shard name and the names of the shards that timed out or failed.
+
+        Raises:
+            KeyError: If a selected shard is not a shard of the gallery.
+        """
+        if shards is None:
+            selected = self.shard_names
+        else:
+            selected = list(dict.fromkeys(shards))
+            unknown = [name for name in selected if name not in self.sources]
+            if unknown:
+                raise KeyError(f"Unknown shards {unknown}, the shards are {self.shard_names}.")
+        timeout = self.timeout if timeout is None else timeout
+        query = {"pending": set(), "answers": {}, "done": threading.Event()}
+        with self._lock:
+            request_id = next(self._request_ids)
+            query["pending"].update(name for name in selected if name not in self._stopped)
+            self._queries[request_id] = query
+        try:
+            for name in list(query["pending"]):
+                try:
+                    # Only one thread writes to a pipe at a time, the answers are read by the receiver thread
+                    with self._send_locks[name]:
+                        self._connections[name].send((request_id, operation, args))
+                except (OSError, ValueError):
+                    with self._lock:
+                        query["pending"].discard(name)
+            if query["pending"]:
+                query["done"].wait(timeout)
+        finally:
+            with self._lock:
+                del self._queries[request_id]
+                results = dict(query["answers"])
+        answers = {}
+        for name, result in results.items():
+            if isinstance(result, Exception):
+                logger.error("Shard %s failed: %s", name, result, extra={"shard": name})
+            else:
+                answers[name] = result
+        failed = [name for name in selected if name not in answers]
+        if failed:
+            metrics.increment("shard_timeout", len(failed))
+            logger.warning("Shards %s did not answer in time.", failed, extra={"shards": failed})
+        return answers, failed
+
+    def scatter(self, encodings: np.ndarray, k: int = 5, tolerance: float = DEFAULT_TOLERANCE,
+                shards: list | None = None, timeout: float | None = None) -> ScatterResult:
+        """
+        Find the k closest identities of one or more encodings across the shards.
+
+        Args:
+            encodings (np.ndarray): One ``(128,)`` encoding or a ``(Q, 128)`` batch of encodings.
+            k (int): Number of candidates to return per encoding.
+            tolerance (float): Maximum distance for a candidate to be considered a match.
+            shards (list | None): Search only these shards, e.g. the district of the voter. None searches all.
+            timeout (float | None): Seconds each shard has to answer, defaults to ``self.timeout``.
+
+        Returns:
+            ScatterResult: The merged candidates sorted by increasing distance, shaped as the
+                output of ``search_gallery``, and the shards left out of them.
+
+        Raises:
+            KeyError: If a shard of ``shards`` is not a shard of the gallery.
+        """
+        encodings = np.asarray(encodings, dtype=np.float64)
+        single = encodings.ndim == 1
+        encodings = np.atleast_2d(encodings)
+        with metrics.timer("distance"):
+            answers, timed_out = self._scatter("search", (encodings, k, tolerance), shards, timeout)
+        matches = [
+            sorted((match for answer in answers.values() for match in answer[query]), key=lambda match: match.distance)[:k]
+            for query in range(len(encodings))
+        ]
+        return ScatterResult(matches[0] if single else matches, timed_out)
+
+    def search(self, encodings: np.ndarray, k: int = 5, tolerance: float = DEFAULT_TOLERANCE,
+               shards: list | None = None, timeout: float | None = None) -> list:
+        """
+        Find the k closest identities of one or more encodings across the shards.
+
+        Same as ``scatter``, without the shards that timed out.
+
+        Returns:
+            list: The candidates sorted by increasing distance, as a list of ``Match`` for a single
+                encoding, or one such list per encoding for a batch.
+        """
+        return self.scatter(encodings, k, tolerance, shards, timeout).matches
+
+    def get(self, image_name: str, shards: list | None = None) -> np.ndarray | None:
+        """
+        Get the encoding of an image from the shard holding it.
+
+        Args:
+            image_name (str): Name of the image.
+            shards (list | None): Look only in these shards. None looks in all.
+
+        Returns:
+            np.ndarray | None: The encoding if found, None otherwise.
+
+        Raises:
+            KeyError: If a shard of ``shards`` is not a shard of the gallery.
+        """
+        answers, _ = self._scatter("get", image_name, shards, None)
+        return next((encoding for encoding in answers.values() if encoding is not None), None)
@@ -1,154 +1,656 @@
 import cv2
+import logging
+import threading
+import time
+import numpy as np
 from pathlib import Path
+from typing import NamedTuple
+
+from compare_image import verify_encoding
+from encoding_image import encode_image, refine_face_location
+from gallery import DEFAULT_TOLERANCE, load_gallery
+from image_io import read_image
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# The nose and mouth cascades ship with the repository, next to this file
+REPO_DIR = Path(__file__).resolve().parent
+FACE_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+EYE_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_eye.xml'
+NOSE_CASCADE_PATH = str(REPO_DIR / 'haarcascade_mcs_nose.xml')
+MOUTH_CASCADE_PATH = str(REPO_DIR / 'haarcascade_mcs_mouth.xml')
+
+# Where each feature is searched, as (top, bottom, left, right) fractions of the face box
+FEATURE_REGIONS = {"eye": (0.0, 0.5, 0.0, 1.0), "nose": (0.25, 0.85, 0.15, 0.85), "mouth": (2 / 3, 1.0, 0.0, 1.0)}
+# The (smallest, largest) width of each feature, as fractions of the face width
+FEATURE_SIZES = {"eye": (0.1, 0.4), "nose": (0.15, 0.5), "mouth": (0.2, 0.65)}
+# Features checked in this order, the cheapest first, with the number each face must have
+FEATURE_CHECKS = (("eye", 2), ("mouth", 1), ("nose", 1))
+
+
+# Reasons an image is rejected, besides the feature that failed its check ("eye", "mouth" or "nose")
+REJECT_MISSING = "missing"
+REJECT_UNREADABLE = "unreadable"
+REJECT_CASCADES = "cascades_not_loaded"
+REJECT_NO_FACE = "no_face"
+REJECT_MULTIPLE_FACES = "multiple_faces"
+REJECT_UNKNOWN_VOTER = "unknown_voter"
+REJECT_NO_ENCODING = "no_encoding"
+
+
+class GateResult(NamedTuple):
+    """
+    The decision of the quality gate on one image.
+    """
+    # (x, y, width, height) of the accepted face, None if the image was rejected
+    face_box: tuple | None
+    # The first check that failed, None if the image was accepted
+    reason: str | None
+
+
+class FaceQualityGate:
+    """
+    Checks that an image shows one person with a face, two eyes, one nose and one mouth.
+
+    The four Haar cascades are loaded once per thread and reused by every check, instead
+    of parsing the XML files on each call. Each thread gets its own classifiers because
+    ``cv2.CascadeClassifier`` is not guaranteed to be thread safe.
+
+    By default each feature is only searched where it can be (eyes in the upper half of the
+    face, nose in the middle, mouth in the lower third), at sizes bounded by the size of the
+    face, and the cheapest cascade runs first so most rejected faces stop early. This scans a
+    fraction of the windows of a search over the whole face at every scale, and drops the
+    detections of a feature in the wrong place, e.g. an eye found on the mouth. That changes
+    some decisions: the whole face search finds a third eye on the mouth of
+    ``image_with_all_requirements.jpg`` and ``ouail.jpg`` and rejects them, the restricted
+    search accepts them. Both searches reject the same labelled negatives (see
+    ``benchmarks/bench_gate_regions.py``). ``restrict_regions=False`` gives the whole face search.
+
+    Examples:
+        >>> gate = FaceQualityGate()
+        >>> whole_face_gate = FaceQualityGate(restrict_regions=False)
+        >>> gate.check(cv2.imread("images/ouail.jpg"))
+        >>> gate.check_batch([frame_1, frame_2])
+    """
+
+    def __init__(self, face_cascade_path: str = FACE_CASCADE_PATH, eye_cascade_path: str = EYE_CASCADE_PATH,
+                 nose_cascade_path: str = NOSE_CASCADE_PATH, mouth_cascade_path: str = MOUTH_CASCADE_PATH,
+                 restrict_regions: bool = True):
+        self.cascade_paths = (face_cascade_path, eye_cascade_path, nose_cascade_path, mouth_cascade_path)
+        self.restrict_regions = restrict_regions
+        self._local = threading.local()
+
+    def cascades(self) -> tuple:
+        """
+        Get the face, eye, nose and mouth classifiers of the current thread, loading them on first use.
+
+        Returns:
+            tuple: The four ``cv2.CascadeClassifier``.
+        """
+        cascades = getattr(self._local, "cascades", None)
+        if cascades is None:
+            cascades = tuple(cv2.CascadeClassifier(path) for path in self.cascade_paths)
+            self._local.cascades = cascades
+        return cascades
+
+    def is_loaded(self) -> bool:
+        """
+        Check that every cascade file loaded properly.
+
+        Returns:
+            bool: True if all four cascades are usable, False otherwise.
+        """
+        return not any(cascade.empty() for cascade in self.cascades())
+
+    def check(self, image: np.ndarray) -> bool:
+        """
+        Check a single image.
+
+        Parameters:
+            image (np.ndarray): A BGR or grayscale image.
+
+        Returns:
+            bool: True if the image contains one person with a face, eyes, nose, and mouth, False otherwise.
+        """
+        return self.find_face(image) is not None
+
+    def find_face(self, image: np.ndarray) -> tuple | None:
+        """
+        Check a single image and locate the face that passed.
+
+        Parameters:
+            image (np.ndarray): A BGR or grayscale image.
+
+        Returns:
+            tuple | None: The (x, y, width, height) box of the face if the image contains one person
+                with a face, eyes, nose, and mouth, None otherwise.
+        """
+        return self.evaluate(image).face_box
+
+    def evaluate(self, image: np.ndarray) -> "GateResult":
+        """
+        Check a single image, and tell where the face is or why the image was rejected.
+
+        Parameters:
+            image (np.ndarray): A BGR or grayscale image.
+
+        Returns:
+            GateResult: The (x, y, width, height) box of the accepted face, or the first check that
+                failed: "cascades_not_loaded", "no_face", "multiple_faces", "eye", "mouth" or "nose".
+        """
+        with metrics.timer("gate"):
+            result = self._evaluate(image)
+        if result.face_box is None:
+            metrics.increment("gate_rejected")
+        return result
+
+    def _evaluate(self, image: np.ndarray) -> "GateResult":
+        # Check if cascades are loaded properly
+        if not self.is_loaded():
+            logger.error("One or more cascade files failed to load.")
+            return GateResult(None, REJECT_CASCADES)
+        face_cascade, eye_cascade, nose_cascade, mouth_cascade = self.cascades()
+
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        # Detect faces in the image
+        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+
+        # Check if only one face is detected
+        if len(faces) != 1:
+            return GateResult(None, REJECT_NO_FACE if len(faces) == 0 else REJECT_MULTIPLE_FACES)
+
+        x, y, w, h = faces[0]
+        feature_cascades = {"eye": eye_cascade, "nose": nose_cascade, "mouth": mouth_cascade}
+        for feature, expected in FEATURE_CHECKS:
+            if len(self._detect_feature(gray, (x, y, w, h), feature, feature_cascades[feature])) != expected:
+                return GateResult(None, feature)
 
+        return GateResult((int(x), int(y), int(w), int(h)), None)
 
-def take_image(image_path: Path = Path(("temp/captured_photo.jpg")))->None:
+    def _detect_feature(self, gray: np.ndarray, face: tuple, feature: str, cascade: cv2.CascadeClassifier):
+        x, y, w, h = face
+        if not self.restrict_regions:
+            # Search the whole region of interest (ROI) of the face, at every scale
+            return cascade.detectMultiScale(gray[y:y+h, x:x+w])
+
+        top, bottom, left, right = FEATURE_REGIONS[feature]
+        region = gray[y + int(top * h):y + int(bottom * h), x + int(left * w):x + int(right * w)]
+        # Keep the aspect ratio of the cascade window when bounding its size
+        window_width, window_height = cascade.getOriginalWindowSize()
+        smallest, largest = FEATURE_SIZES[feature]
+        min_size = (int(smallest * w), int(smallest * w * window_height / window_width))
+        max_size = (int(largest * w), int(largest * w * window_height / window_width))
+        return cascade.detectMultiScale(region, minSize=min_size, maxSize=max_size)
+
+    def check_batch(self, images: list) -> list:
+        """
+        Check several images with the same classifiers.
+
+        Parameters:
+            images (list): BGR or grayscale images.
+
+        Returns:
+            list: One bool per image, in the same order.
+        """
+        return [self.check(image) for image in images]
+
+
+# Shared by every caller of this module, the cascades are loaded on first use
+quality_gate = FaceQualityGate()
+
+
+class CapturedFrame(NamedTuple):
+    """
+    A frame accepted by the quality gate, kept in memory at full resolution.
+    """
+    frame: np.ndarray
+    # (x, y, width, height) of the face found by the gate, in the coordinates of the frame
+    face_box: tuple
+
+
+class FrameGrabber:
+    """
+    Reads frames from a ``cv2.VideoCapture`` in a background thread and keeps only the latest one.
+
+    Consumers always get the most recent frame instead of stale frames from the camera
+    buffer; frames nobody asked for in time are simply overwritten.
+
+    Examples:
+        >>> grabber = FrameGrabber(cv2.VideoCapture(0)).start()
+        >>> frame_id, frame = grabber.latest()
+        >>> grabber.stop()
+    """
+
+    def __init__(self, capture: cv2.VideoCapture):
+        self.capture = capture
+        self.frames_read = 0
+        self.finished = False
+        self._frame = None
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self) -> "FrameGrabber":
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while self._running:
+            ret, frame = self.capture.read()
+            with self._condition:
+                if not ret:
+                    self.finished = True
+                    self._condition.notify_all()
+                    return
+                self._frame = frame
+                self.frames_read += 1
+                self._condition.notify_all()
+
+    def latest(self, after_id: int = 0, timeout: float | None = None) -> tuple:
+        """
+        Wait for a frame newer than ``after_id``.
+
+        Parameters:
+            after_id (int): The id of the last frame already processed.
+            timeout (float | None): Maximum time to wait, in seconds.
+
+        Returns:
+            tuple: The id and the frame, or ``(after_id, None)`` if the source ended or the wait timed out.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.frames_read > after_id or self.finished, timeout)
+            if self.frames_read > after_id:
+                return self.frames_read, self._frame
+            return after_id, None
+
+    def stop(self) -> None:
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+
+
+class CapturePipeline:
+    """
+    Non-blocking capture loop: a grabber thread keeps the latest frame while the quality gate
+    checks a downscaled copy of it at a limited cadence.
+
+    Frames arriving while the gate is busy, or outside the cadence, are dropped rather than
+    queued, so the gate always looks at a fresh frame.
+
+    Parameters:
+        source (int | str | cv2.VideoCapture): Camera index, video file or stream URL, or an opened capture.
+        gate (FaceQualityGate): The quality gate deciding whether a frame is accepted.
+        gate_every (int): Check at most every Nth captured frame.
+        target_fps (float | None): Check at most this many frames per second.
+        gate_scale (float): Factor frames are resized by before being checked.
+
+    Examples:
+        >>> pipeline = CapturePipeline(Path("temp/kiosk.avi"), gate_every=3)
+        >>> frame = pipeline.run(timeout=10)
+        >>> print(pipeline.stats())
+    """
+
+    def __init__(self, source=0, gate: FaceQualityGate = quality_gate, gate_every: int = 1,
+                 target_fps: float | None = None, gate_scale: float = 0.5):
+        self.source = source
+        self.gate = gate
+        self.gate_every = max(1, gate_every)
+        self.target_fps = target_fps
+        self.gate_scale = gate_scale
+        self.frames_gated = 0
+        self.frames_captured = 0
+        self.elapsed = 0.0
+
+    def _open(self) -> cv2.VideoCapture:
+        if isinstance(self.source, cv2.VideoCapture):
+            return self.source
+        source = str(self.source) if isinstance(self.source, Path) else self.source
+        return cv2.VideoCapture(source)
+
+    def _check(self, frame: np.ndarray) -> tuple | None:
+        small = frame
+        if self.gate_scale != 1.0:
+            small = cv2.resize(frame, None, fx=self.gate_scale, fy=self.gate_scale, interpolation=cv2.INTER_AREA)
+        self.frames_gated += 1
+        find_face = getattr(self.gate, "find_face", None)
+        if find_face is None:
+            # A gate that only accepts or rejects frames, the face is somewhere in the frame
+            return (0, 0, frame.shape[1], frame.shape[0]) if self.gate.check(small) else None
+        face_box = find_face(small)
+        if face_box is None:
+            return None
+        # Map the box back to the full resolution frame
+        scale = 1.0 / self.gate_scale
+        return tuple(int(round(value * scale)) for value in face_box)
+
+    def capture(self, timeout: float | None = None, show: bool = False) -> CapturedFrame | None:
+        """
+        Capture frames until one passes the quality gate.
+
+        The pipeline can be run again for the next voter, the capture is released after each run.
+
+        Parameters:
+            timeout (float | None): Give up after this many seconds.
+            show (bool): Display a preview window, closed with 'q'.
+
+        Returns:
+            CapturedFrame | None: The accepted full resolution frame and its face box, None if the
+                source ended, the timeout expired or the user quit.
+        """
+        cap = self._open()
+        grabber = FrameGrabber(cap).start()
+        min_interval = 1.0 / self.target_fps if self.target_fps else 0.0
+        start = time.perf_counter()
+        last_seen = 0
+        last_gated = -self.gate_every
+        last_gate_time = float("-inf")
+        self.frames_gated = 0
+        accepted = None
+        try:
+            while timeout is None or time.perf_counter() - start < timeout:
+                frame_id, frame = grabber.latest(last_seen, timeout=0.5)
+                if frame is None:
+                    if grabber.finished:
+                        break
+                    continue
+                last_seen = frame_id
+
+                now = time.perf_counter()
+                if frame_id - last_gated >= self.gate_every and now - last_gate_time >= min_interval:
+                    last_gated = frame_id
+                    last_gate_time = now
+                    face_box = self._check(frame)
+                    if face_box is not None:
+                        accepted = CapturedFrame(frame, face_box)
+                        break
+
+                if show:
+                    # Display the resulting frame without drawing the rectangle around the face
+                    cv2.imshow('Frame', frame)
+                    # Check for user input to close the video capture
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+        finally:
+            grabber.stop()
+            self.frames_captured = grabber.frames_read
+            self.elapsed = time.perf_counter() - start
+            cap.release()
+            if show:
+                cv2.destroyAllWindows()
+        return accepted
+
+    def run(self, timeout: float | None = None, show: bool = False) -> np.ndarray | None:
+        """
+        Capture frames until one passes the quality gate.
+
+        Parameters:
+            timeout (float | None): Give up after this many seconds.
+            show (bool): Display a preview window, closed with 'q'.
+
+        Returns:
+            np.ndarray | None: The accepted full resolution frame, None if the source ended,
+                the timeout expired or the user quit.
+        """
+        captured = self.capture(timeout, show)
+        return None if captured is None else captured.frame
+
+    def stats(self) -> dict:
+        """
+        Get the counters of the last run.
+
+        Returns:
+            dict: Frames captured and gated, and the achieved capture and gate FPS.
+        """
+        elapsed = self.elapsed or float("inf")
+        return {
+            "frames_captured": self.frames_captured,
+            "frames_gated": self.frames_gated,
+            "frames_dropped": self.frames_captured - self.frames_gated,
+            "capture_fps": self.frames_captured / elapsed,
+            "gate_fps": self.frames_gated / elapsed,
+        }
+
+
+def take_image(image_path: Path | None = Path(("temp/captured_photo.jpg")), source=0, gate_every: int = 1,
+               target_fps: float | None = None, gate_scale: float = 0.5) -> np.ndarray | None:
     """
     Takes a photo using the webcam when a single face with two eyes, one nose, and one mouth is detected.
 
     Parameters:
-        image_path (Path): The path to save the captured photo.
+        image_path (Path | None): The path to save the captured photo, None to keep it in memory only.
+        source (int | str | cv2.VideoCapture): Camera index, video file or stream URL to capture from.
+        gate_every (int): Check at most every Nth captured frame.
+        target_fps (float | None): Check at most this many frames per second.
+        gate_scale (float): Factor frames are resized by before being checked.
 
     Returns:
-        None
+        np.ndarray | None: The accepted frame, None if no frame was accepted.
+    """
+    pipeline = CapturePipeline(source, gate_every=gate_every, target_fps=target_fps, gate_scale=gate_scale)
+    frame = pipeline.run(show=True)
+    stats = pipeline.stats()
+    logger.info("Capture: %.1f FPS, quality gate: %.1f FPS", stats['capture_fps'], stats['gate_fps'], extra=stats)
+
+    # If a single face with two eyes, one nose and one mouth was detected, save the photo
+    if frame is not None and image_path is not None:
+        cv2.imwrite(str(image_path), frame)
+    return frame
+
+
+class VerificationReport(NamedTuple):
+    """
+    The outcome of a verification, why it was rejected if it was, and where the time went.
+    """
+    voter_id: str
+    # True if the face passed the gate and matched the enrolled encoding
+    match: bool
+    # Distance to the enrolled encoding, None if the face was not compared
+    distance: float | None
+    # Why the image was rejected before the comparison (see the REJECT_* reasons), None otherwise
+    reason: str | None
+    # (x, y, width, height) of the face found by the gate, None if it rejected the image
+    face_box: tuple | None
+    # Milliseconds spent in each stage that ran, and in total
+    timings: dict
+
+
+def face_box_to_location(face_box: tuple) -> tuple:
     """
-    # Load pre-trained face and eye cascade classifiers
-    # Load the Haar cascades for face, eyes, nose, and mouth
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
-    nose_cascade = cv2.CascadeClassifier('haarcascade_mcs_nose.xml')
-    mouth_cascade = cv2.CascadeClassifier( 'haarcascade_mcs_mouth.xml')
+    Convert an OpenCV (x, y, width, height) box to a dlib (top, right, bottom, left) box.
+    """
+    x, y, width, height = face_box
+    return y, x + width, y + height, x
 
-    # Initialize video capture
-    cap = cv2.VideoCapture(0)
 
-    while True:
-        # Capture frame-by-frame
-        ret, frame = cap.read()
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
 
-        # Convert frame to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-        # Detect faces in the grayscale frame
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+def _verify_face(image: np.ndarray, face_box: tuple, voter_id: str, gallery, tolerance: float, refine: bool,
+                 timings: dict, start: float) -> VerificationReport:
+    """
+    Encode the face the gate accepted, and compare it with the enrolled encoding of the voter.
+    """
+    face_location = face_box_to_location(face_box)
+    if refine:
+        stage = time.perf_counter()
+        face_location = refine_face_location(image, face_location)
+        timings["refine"] = _elapsed_ms(stage)
+
+    stage = time.perf_counter()
+    encoding = encode_image(image, face_locations=[face_location])
+    timings["encode"] = _elapsed_ms(stage)
+    if encoding is None:
+        timings["total"] = _elapsed_ms(start)
+        return VerificationReport(voter_id, False, None, REJECT_NO_ENCODING, face_box, timings)
+
+    stage = time.perf_counter()
+    verification = verify_encoding(voter_id, encoding, gallery, tolerance)
+    timings["compare"] = _elapsed_ms(stage)
+    timings["total"] = _elapsed_ms(start)
+    if verification is None:
+        return VerificationReport(voter_id, False, None, REJECT_UNKNOWN_VOTER, face_box, timings)
+    return VerificationReport(voter_id, verification.match, verification.distance, None, face_box, timings)
+
+
+def verify(image, voter_id: str, gallery=Path("encodings.csv"), tolerance: float = DEFAULT_TOLERANCE,
+           gate: FaceQualityGate = quality_gate, max_side: int | None = None, refine: bool = False) -> VerificationReport:
+    """
+    Check an image with the quality gate and verify its face against the enrolled encoding of a voter, in one pass.
 
-        var= True
+    The image is decoded once, and the same pixels go through the gate and the encoder. The face
+    box found by the gate is reused as the known face location of the encoder, so the face is
+    not searched again by dlib; with ``refine`` dlib only looks for it around that box.
 
-        # Check if exactly one face is detected
-        if len(faces) == 1:
-            # Get the coordinates and dimensions of the face
-            x, y, w, h = faces[0]
+    Parameters:
+        image (Path | bytes | np.ndarray): The path to the image file, the content of an image file,
+            or an already decoded BGR image.
+        voter_id (str): The name of the enrolled image of the voter, e.g. "ouail.jpg".
+        gallery (Path | Gallery | EncodingStore | dict | ShardedGallery): The enrolled encodings, e.g. Path("encodings.csv").
+        tolerance (float): Maximum distance for the faces to match.
+        gate (FaceQualityGate): The quality gate deciding whether the image is accepted.
+        max_side (int | None): Decode a large JPEG at 1/2, 1/4 or 1/8 of its size, as long as its
+            longest side stays at least ``max_side`` pixels. None decodes at full size.
+        refine (bool): Refine the box of the Haar face cascade with the dlib detector before encoding.
 
-            # Get the region of interest (ROI) for eyes detection
-            roi_gray = gray[y:y+h, x:x+w]
-            roi_color = frame[y:y+h, x:x+w]
+    Returns:
+        VerificationReport: The decision, the distance, the reason of a rejection and the
+            latency of each stage ("decode", "gate", "refine", "encode", "compare" and "total").
 
-            # Detect eyes in the face ROI
-            eyes = eye_cascade.detectMultiScale(roi_gray)
-            if len(faces) != 1:
-                var= False
-    
-            # Extract the region of interest (ROI) for the detected face
-            x, y, w, h = faces[0]
-            face_roi = gray[y:y+h, x:x+w]
-
-            # Detect eyes in the face region
-            eyes = eye_cascade.detectMultiScale(face_roi)
-            if len(eyes) != 2:
-                var= False
-            
-            # Detect nose in the face region
-            noses = nose_cascade.detectMultiScale(face_roi)
-            if len(noses) !=1:
-                var= False
-            
-            # Detect mouth in the face region
-            mouths = mouth_cascade.detectMultiScale(face_roi)
-            if len(mouths) != 1:
-                var= False
-
-            # If both eyes are detected, take a photo and close the video capture
-            if var:
-                cv2.imwrite(str(image_path), frame)
-                cap.release()
-                cv2.destroyAllWindows()
-                exit()
+    Examples:
+        >>> report = verify(Path("images/ouail.jpg"), "ouail.jpg", Path("encodings.csv"), max_side=1000)
+        >>> print(report.match, report.reason, report.timings)
+    """
+    start = time.perf_counter()
+    timings = {}
+
+    def rejected(reason: str, face_box: tuple | None = None) -> VerificationReport:
+        timings["total"] = _elapsed_ms(start)
+        logger.info("Verification rejected: %s.", reason, extra={"voter_id": voter_id, "reason": reason})
+        return VerificationReport(voter_id, False, None, reason, face_box, timings)
+
+    if isinstance(gallery, (str, Path)):
+        gallery = load_gallery(Path(gallery))
+    if gallery.get(voter_id) is None:
+        return rejected(REJECT_UNKNOWN_VOTER)
+    if not isinstance(image, (np.ndarray, bytes, bytearray, memoryview)) and not Path(image).exists():
+        return rejected(REJECT_MISSING)
+
+    stage = time.perf_counter()
+    decoded = read_image(image, max_side)
+    timings["decode"] = _elapsed_ms(stage)
+    if decoded is None:
+        return rejected(REJECT_UNREADABLE)
+
+    stage = time.perf_counter()
+    result = gate.evaluate(decoded)
+    timings["gate"] = _elapsed_ms(stage)
+    if result.face_box is None:
+        return rejected(result.reason)
+
+    report = _verify_face(decoded, result.face_box, voter_id, gallery, tolerance, refine, timings, start)
+    if report.reason is not None:
+        return rejected(report.reason, report.face_box)
+    return report
+
+
+class CaptureVerification(NamedTuple):
+    """
+    The frame accepted for a voter, its face box and the verification of that face.
+    """
+    frame: np.ndarray
+    face_box: tuple
+    verification: VerificationReport
 
-        # Display the resulting frame without drawing the rectangle around the face
-        cv2.imshow('Frame', frame)
 
-        # Check for user input to close the video capture
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+def capture_and_verify(voter_id: str, gallery=Path("encodings.csv"), source=0, timeout: float | None = None,
+                       tolerance: float = DEFAULT_TOLERANCE, gate: FaceQualityGate = quality_gate,
+                       gate_every: int = 1, target_fps: float | None = None, gate_scale: float = 0.5,
+                       refine: bool = False, show: bool = False) -> CaptureVerification | None:
+    """
+    Capture a voter and verify them against their enrolled encoding, without writing the photo to disk.
+
+    The accepted frame stays in memory: it is encoded straight from the capture buffer, with the
+    face box found by the quality gate instead of a second face detection, so there is no JPEG
+    round trip, and kiosks running side by side do not share any file. The capture is released
+    before returning, so the function can be called again for the next voter.
 
-    # Release the video capture and close all windows
-    cap.release()
-    cv2.destroyAllWindows()
+    Parameters:
+        voter_id (str): The name of the enrolled image of the voter, e.g. "ouail.jpg".
+        gallery (Path | Gallery | EncodingStore | dict | ShardedGallery): The enrolled encodings, e.g. Path("encodings.csv").
+        source (int | str | cv2.VideoCapture): Camera index, video file or stream URL to capture from.
+        timeout (float | None): Give up the capture after this many seconds.
+        tolerance (float): Maximum distance for the faces to match.
+        gate (FaceQualityGate): The quality gate deciding whether a frame is accepted.
+        gate_every (int): Check at most every Nth captured frame.
+        target_fps (float | None): Check at most this many frames per second.
+        gate_scale (float): Factor frames are resized by before being checked.
+        refine (bool): Refine the box of the Haar face cascade with the dlib detector before encoding.
+        show (bool): Display a preview window, closed with 'q'.
 
+    Returns:
+        CaptureVerification | None: The accepted frame, its (x, y, width, height) face box and the
+            verification report, None if the voter is not enrolled or no frame was accepted.
 
-def detect_person_with_face_eyes_nose_mouth(image_path: Path) -> bool:
+    Examples:
+        >>> result = capture_and_verify("ouail.jpg", Path("encodings.csv"), timeout=30)
+        >>> if result is not None:
+        >>>     print("Face match:", result.verification.match, result.verification.timings)
+    """
+    if isinstance(gallery, (str, Path)):
+        gallery = load_gallery(Path(gallery))
+    # Do not make the voter wait in front of the camera for nothing
+    if gallery.get(voter_id) is None:
+        logger.error("Voter not found in the gallery.", extra={"voter_id": voter_id})
+        return None
+
+    pipeline = CapturePipeline(source, gate=gate, gate_every=gate_every, target_fps=target_fps, gate_scale=gate_scale)
+    captured = pipeline.capture(timeout, show=show)
+    if captured is None:
+        logger.warning("No frame passed the quality gate.", extra={"voter_id": voter_id, **pipeline.stats()})
+        return None
+
+    start = time.perf_counter()
+    report = _verify_face(captured.frame, captured.face_box, voter_id, gallery, tolerance, refine, {}, start)
+    return CaptureVerification(captured.frame, captured.face_box, report)
+
+
+def detect_person_with_face_eyes_nose_mouth(image, max_side: int | None = None) -> bool:
     """
     Detects a person in an image based on the presence of a face, eyes, nose, and mouth.
 
     Parameters:
-        image_path (Path): The path to the image file to be processed.
+        image (Path | bytes | np.ndarray): The path to the image file to be processed, the content
+            of an image file, or an already decoded BGR or grayscale image.
+        max_side (int | None): Decode a large JPEG at 1/2, 1/4 or 1/8 of its size, as long as its
+            longest side stays at least ``max_side`` pixels. None decodes at full size.
 
     Returns:
         bool: True if the image contains one person with a face, eyes, nose, and mouth, False otherwise.
     """
+    is_path = not isinstance(image, (np.ndarray, bytes, bytearray, memoryview))
+    source = str(image) if is_path else type(image).__name__
     # Check if the image exists
-    if not image_path.exists():
-        print(f"\nError: Image {image_path} does not exist.")
-        return False
-
-    # Load the Haar cascades for face, eyes, nose, and mouth
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
-    nose_cascade = cv2.CascadeClassifier('haarcascade_mcs_nose.xml')
-    mouth_cascade = cv2.CascadeClassifier( 'haarcascade_mcs_mouth.xml')
-    
-    # Check if cascades are loaded properly
-    if face_cascade.empty() or eye_cascade.empty() or nose_cascade.empty() or mouth_cascade.empty():
-        print("Error: One or more cascade files failed to load.")
-        return False
-
-    # Load the image
-    img = cv2.imread(str(image_path))
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-    # Detect faces in the image
-    faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-    
-    # Check if only one face is detected
-    if len(faces) != 1:
+    if is_path and not Path(image).exists():
+        logger.error("Image %s does not exist.", image, extra={"image": source})
         return False
-    
-    # Extract the region of interest (ROI) for the detected face
-    x, y, w, h = faces[0]
-    face_roi = gray[y:y+h, x:x+w]
 
-    # Detect eyes in the face region
-    eyes = eye_cascade.detectMultiScale(face_roi)
-    if len(eyes) != 2:
+    # Load the image, the cascades only need the gray levels
+    img = read_image(image, max_side, grayscale=True)
+    if img is None:
+        logger.error("Could not read the image %s.", source, extra={"image": source})
         return False
-    
-    # Detect nose in the face region
-    noses = nose_cascade.detectMultiScale(face_roi)
-    if len(noses) !=1:
-        return False
-    
-    # Detect mouth in the face region
-    mouths = mouth_cascade.detectMultiScale(face_roi)
-    if len(mouths) != 1:
-        return False
-    
-    return True
 
+    return quality_gate.check(img)
 
 
 
 if __name__ == "__main__":
-    print(take_image(Path("temp/captured_photo.jpg")))
+    print(take_image(Path("temp/captured_photo.jpg")) is not None)
     
 
 
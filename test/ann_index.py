@@ -0,0 +1,86 @@
+import unittest
+import os
+import sys
+import tempfile
+from pathlib import Path
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from ann_index import IVFIndex
+from gallery import search_gallery
+
+
+class TestIVFIndex(unittest.TestCase):
+    """
+    Unit tests for the approximate nearest neighbour index.
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(scale=0.1, size=(20, 128))
+        self.matrix = centers[rng.integers(0, 20, 2000)] + rng.normal(scale=0.03, size=(2000, 128))
+        self.names = [f"voter_{i}.jpg" for i in range(2000)]
+        self.queries = self.matrix[:50] + rng.normal(scale=0.01, size=(50, 128))
+        self.index = IVFIndex(n_lists=16, n_probe=4).build(self.names, self.matrix, iterations=10)
+
+    def test_search_finds_enrolled_voter(self):
+        """
+        Test that a noisy copy of an enrolled encoding finds it.
+        """
+        results = self.index.search(self.queries, k=3)
+        found = sum(matches[0].name == f"voter_{i}.jpg" for i, matches in enumerate(results))
+        self.assertGreaterEqual(found, 45)
+
+    def test_full_probe_is_exact(self):
+        """
+        Test that probing every cell gives the exact search result.
+        """
+        approximate = self.index.search(self.queries[0], k=5, n_probe=16)
+        exact = search_gallery(self.matrix, self.names, self.queries[0], k=5)
+        self.assertEqual([match.name for match in approximate], [match.name for match in exact])
+
+    def test_incremental_insert(self):
+        """
+        Test that encodings inserted after the build can be found.
+        """
+        new_encoding = self.matrix[7] + 0.001
+        self.index.add(["new.jpg"], new_encoding[np.newaxis, :])
+        self.assertEqual(len(self.index), 2001)
+        self.assertEqual(self.index.search(new_encoding, k=1)[0].name, "new.jpg")
+
+    def test_single_inserts(self):
+        """
+        Test that inserting encodings one by one gives the same index as inserting them at once.
+        """
+        index = IVFIndex(n_lists=16, n_probe=4)
+        index.train(self.matrix, iterations=10)
+        for name, encoding in zip(self.names[:300], self.matrix[:300]):
+            index.add([name], encoding)
+        batch = IVFIndex(n_lists=16, n_probe=4)
+        batch.centroids = index.centroids
+        batch.add(self.names[:300], self.matrix[:300])
+        self.assertEqual(index.search(self.queries[:10], k=3), batch.search(self.queries[:10], k=3))
+        self.assertEqual(len(index), 300)
+
+    def test_save_and_load(self):
+        """
+        Test that a saved index gives the same results once loaded, whatever the suffix of its file.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for name in ("index.npz", "index.ivf"):
+                path = Path(temp_dir) / name
+                self.index.save(path)
+                self.assertTrue(path.exists())
+                loaded = IVFIndex.load(path)
+                self.assertEqual(len(loaded), len(self.index))
+                self.assertEqual(loaded.search(self.queries[:5], k=3), self.index.search(self.queries[:5], k=3))
+                # A loaded index keeps accepting inserts
+                loaded.add(["new.jpg"], self.matrix[7] + 0.001)
+                self.assertEqual(loaded.search(self.matrix[7] + 0.001, k=1)[0].name, "new.jpg")
+
+
+if __name__ == '__main__':
+    unittest.main()
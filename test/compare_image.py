@@ -7,7 +7,9 @@ from pathlib import Path
 parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
 sys.path.append(parent_dir)
 
-from compare_image import compare_faces, compare_face_use_csv_encoding
+from compare_image import compare_faces, compare_face_use_csv_encoding, identify, identify_faces, verify_encoding
+from encoding_image import get_image_encoding_from_csv
+from sharded_gallery import ShardedGallery, partition_gallery
 
 class TestFaceComparison(unittest.TestCase):
     """
@@ -40,6 +42,57 @@ class TestFaceComparison(unittest.TestCase):
         self.assertIsInstance(result, bool)
         self.assertEqual(result, False)
 
+    def test_identify(self):
+        """
+        Test the identify function.
+        """
+        matches = identify(self.unknown_image_path, self.csv_filename, k=2)
+        self.assertIsNotNone(matches)
+        self.assertEqual(len(matches), 2)
+        self.assertEqual(matches[0].name, "messi.jpg")
+        self.assertTrue(matches[0].is_match)
+        self.assertLessEqual(matches[0].distance, matches[1].distance)
+
+    def test_identify_sharded(self):
+        """
+        Test the identify function against a gallery split into shard worker processes.
+        """
+        shards = partition_gallery(self.csv_filename, key=lambda name: "messi" if name == "messi.jpg" else "others")
+        with ShardedGallery(shards) as gallery:
+            matches = identify(self.unknown_image_path, gallery, k=2)
+            self.assertEqual(matches[0].name, "messi.jpg")
+            self.assertTrue(matches[0].is_match)
+            matches = identify(self.unknown_image_path, gallery, k=2, shards=["others"])
+            self.assertNotEqual(matches[0].name, "messi.jpg")
+
+    def test_identify_faces(self):
+        """
+        Test that every face of a group photo gets a box and its own candidates.
+        """
+        faces = identify_faces(Path("test/test_images/multiple_persone.jpg"), self.csv_filename, k=2)
+        self.assertIsNotNone(faces)
+        self.assertGreater(len(faces), 1)
+        for face in faces:
+            top, right, bottom, left = face.box
+            self.assertLess(top, bottom)
+            self.assertLess(left, right)
+            self.assertEqual(len(face.matches), 2)
+            self.assertLessEqual(face.matches[0].distance, face.matches[1].distance)
+        self.assertEqual(identify_faces(Path("test/test_images/cat.jpg"), self.csv_filename), [])
+
+    def test_verify_encoding(self):
+        """
+        Test the verify_encoding function with an encoding computed elsewhere.
+        """
+        encoding = get_image_encoding_from_csv("messi.jpg", self.csv_filename)
+        verification = verify_encoding("messi.jpg", encoding, self.csv_filename)
+        self.assertEqual(verification.voter_id, "messi.jpg")
+        self.assertTrue(verification.match)
+        self.assertAlmostEqual(verification.distance, 0.0)
+        verification = verify_encoding("ouail.jpg", encoding, {"ouail.jpg": get_image_encoding_from_csv("ouail.jpg", self.csv_filename)})
+        self.assertFalse(verification.match)
+        self.assertIsNone(verify_encoding("nobody.jpg", encoding, self.csv_filename))
+
 
 if __name__ == '__main__':
     unittest.main()
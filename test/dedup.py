@@ -0,0 +1,153 @@
+import unittest
+import csv
+import os
+import sys
+import tempfile
+from pathlib import Path
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from dedup import StackedRows, _shareable, find_duplicates
+from encoding_store import EncodingStore
+from gallery import face_distance_matrix
+
+
+def read_pairs(filename: Path) -> dict:
+    with open(filename, newline='') as file:
+        reader = csv.reader(file)
+        next(reader)
+        return {(a, b): float(distance) for a, b, distance in reader}
+
+
+class TestFindDuplicates(unittest.TestCase):
+    """
+    Unit tests for the blocked all-pairs duplicate scan.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Build a synthetic gallery of 1000 voters, 20 of them enrolled twice, and a new batch of 100
+        with 5 voters of the gallery and 2 voters enrolled twice within the batch.
+        """
+        rng = np.random.default_rng(0)
+        matrix = rng.normal(scale=0.1, size=(1000, 128))
+        matrix[980:] = matrix[:20] + rng.normal(scale=0.005, size=(20, 128))
+        new_matrix = rng.normal(scale=0.1, size=(100, 128))
+        new_matrix[:5] = matrix[100:105] + rng.normal(scale=0.005, size=(5, 128))
+        new_matrix[98:] = new_matrix[50:52] + rng.normal(scale=0.005, size=(2, 128))
+        cls.gallery = ([f"voter_{i}.jpg" for i in range(1000)], matrix)
+        cls.new = ([f"new_{i}.jpg" for i in range(100)], new_matrix)
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.output = Path(cls.temp_dir.name) / "duplicates.csv"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
+
+    @staticmethod
+    def brute_force(names: list, matrix: np.ndarray, new_start: int = 0, tolerance: float = 0.6) -> set:
+        distances = face_distance_matrix(matrix, matrix)
+        return {(names[a], names[b]) for a in range(len(names)) for b in range(a + 1, len(names))
+                if distances[a, b] <= tolerance and b >= new_start}
+
+    def test_find_duplicates(self):
+        """
+        Test that the blocked scan finds exactly the pairs of a brute force scan, whatever the block size.
+        """
+        expected = self.brute_force(*self.gallery)
+        self.assertEqual(len(expected), 20)
+        for block_size in (2048, 128, 7):
+            stats = find_duplicates(self.gallery, self.output, block_size=block_size)
+            self.assertEqual(set(read_pairs(self.output)), expected)
+            self.assertEqual(stats["pairs"], 20)
+            # Blocks are only compared with themselves and the blocks before them
+            self.assertLessEqual(stats["comparisons"], 1000 * 1000 if block_size > 1000 else 0.6 * 1000 * 1000)
+
+    def test_output(self):
+        """
+        Test that every pair is written once, first row first, with its distance.
+        """
+        find_duplicates(self.gallery, self.output, block_size=64)
+        with open(self.output, newline='') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows[0], ['Image Name A', 'Image Name B', 'distance'])
+        self.assertEqual(len(rows), 21)
+        pairs = read_pairs(self.output)
+        names, matrix = self.gallery
+        for i in range(20):
+            distance = pairs[(f"voter_{i}.jpg", f"voter_{980 + i}.jpg")]
+            self.assertAlmostEqual(distance, np.linalg.norm(matrix[i] - matrix[980 + i]), places=6)
+
+    def test_new_batch(self):
+        """
+        Test that a new batch is checked against the gallery and itself, without the old pairs.
+        """
+        names = self.gallery[0] + self.new[0]
+        matrix = np.concatenate([self.gallery[1], self.new[1]])
+        expected = self.brute_force(names, matrix, new_start=1000)
+        self.assertEqual(len(expected), 7)
+        stats = find_duplicates(self.gallery, self.output, new=self.new, block_size=128)
+        self.assertEqual(set(read_pairs(self.output)), expected)
+        self.assertEqual(stats["new_rows"], 100)
+        # Only the blocks holding new rows are compared with the blocks before them
+        self.assertLess(stats["comparisons"], 1100 * 1100 / 2)
+
+    def test_ann(self):
+        """
+        Test that the pruned scan finds the planted duplicates, and every pair when probing every cell.
+        """
+        expected = self.brute_force(*self.gallery)
+        stats = find_duplicates(self.gallery, self.output, ann=True, n_lists=16, n_probe=16)
+        self.assertEqual(set(read_pairs(self.output)), expected)
+        stats = find_duplicates(self.gallery, self.output, ann=True, n_lists=16, n_probe=2)
+        self.assertEqual(set(read_pairs(self.output)), expected)
+        self.assertLess(stats["comparisons"], 1000 * 1000 / 2)
+
+        stats = find_duplicates(self.gallery, self.output, new=self.new, ann=True, n_lists=16, n_probe=2)
+        self.assertEqual(stats["pairs"], 7)
+
+    def test_workers(self):
+        """
+        Test that scanning blocks in worker processes finds the same pairs.
+        """
+        find_duplicates(self.gallery, self.output, block_size=128)
+        expected = read_pairs(self.output)
+        stats = find_duplicates(self.gallery, self.output, block_size=128, workers=2)
+        self.assertEqual(read_pairs(self.output).keys(), expected.keys())
+        self.assertEqual(stats["pairs"], 20)
+
+    def test_store_gallery(self):
+        """
+        Test that a store gallery is shared with the workers through its own file, only the new rows are copied.
+        """
+        store = EncodingStore(Path(self.temp_dir.name) / "gallery.store")
+        store.write_matrix(*self.gallery)
+        expected_names = self.gallery[0] + self.new[0]
+        expected = self.brute_force(expected_names, np.concatenate([self.gallery[1], self.new[1]]), new_start=1000)
+        stats = find_duplicates(store, self.output, new=self.new, block_size=128, workers=2)
+        self.assertEqual(set(read_pairs(self.output)), expected)
+        self.assertEqual(stats["rows"], 1100)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.assertEqual(_shareable(store.matrix, temp_dir, "gallery")[0], str(store.matrix.filename))
+            self.assertEqual(_shareable(self.new[1], temp_dir, "new")[0], str(Path(temp_dir) / "new.npy"))
+            self.assertEqual(os.listdir(temp_dir), ["new.npy"])
+        rows = StackedRows(store.matrix, self.new[1])
+        np.testing.assert_array_equal(rows[[998, 1000, 3]], np.stack([self.gallery[1][998], self.new[1][0],
+                                                                      self.gallery[1][3]]))
+
+    def test_empty_gallery(self):
+        """
+        Test that a gallery without encodings has no pairs.
+        """
+        stats = find_duplicates(([], np.empty((0, 128))), self.output)
+        self.assertEqual(stats["pairs"], 0)
+        self.assertEqual(len(read_pairs(self.output)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import os
+import sys
+import tempfile
+from pathlib import Path
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from encoding_cache import EncodingCache
+
+
+class TestEncodingCache(unittest.TestCase):
+    """
+    Unit tests for the on-disk encoding cache.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = EncodingCache(Path(self.temp_dir.name), evict_every=1)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_put_and_get(self):
+        """
+        Test that a stored encoding is returned and counted as a hit.
+        """
+        key = self.cache.key(b"image bytes", {"model": "hog"})
+        self.assertIsNone(self.cache.get(key))
+        encoding = np.random.rand(128)
+        self.cache.put(key, encoding)
+        np.testing.assert_array_equal(self.cache.get(key), encoding)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+        self.assertEqual(self.cache.stats()["hit_rate"], 0.5)
+
+    def test_key_depends_on_params(self):
+        """
+        Test that the same image encoded with other parameters gets another key.
+        """
+        self.assertNotEqual(self.cache.key(b"image", {"num_jitters": 1}), self.cache.key(b"image", {"num_jitters": 10}))
+        self.assertEqual(self.cache.key(b"image", {"a": 1, "b": 2}), self.cache.key(b"image", {"b": 2, "a": 1}))
+
+    def test_lru_eviction(self):
+        """
+        Test that the least recently used entries are evicted first.
+        """
+        self.cache.max_bytes = 3 * 128 * 8
+        keys = [self.cache.key(str(i).encode()) for i in range(4)]
+        for i, key in enumerate(keys[:3]):
+            self.cache.put(key, np.full(128, i, dtype=np.float64))
+            os.utime(self.cache._path(key), ns=(i * 10**9, i * 10**9))
+        self.cache.get(keys[0])  # keys[1] is now the least recently used
+        self.cache.put(keys[3], np.zeros(128))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertLessEqual(self.cache.size(), self.cache.max_bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,8 @@ import sys
 from pathlib import Path
 import numpy as np
 import csv
+import subprocess
+import tempfile
 
 # Add parent directory to sys.path
 parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
@@ -11,6 +13,8 @@ sys.path.append(parent_dir)
 
 # Import functions from encoding_image module
 from encoding_image import get_image_encoding, get_image_encoding_from_csv, extract_encodings, write_encodings_to_csv,add_encoding_to_csv
+from encoding_image import scale_face_locations, get_image_encodings_batch, get_image_face_encodings, warm_executor
+from encoding_cache import EncodingCache
 
 class TestImageEncodingFunctions(unittest.TestCase):
     """
@@ -27,6 +31,97 @@ class TestImageEncodingFunctions(unittest.TestCase):
         self.assertIsNotNone(encoding)
         self.assertIsInstance(encoding, np.ndarray)
 
+    def test_get_image_encoding_downscaled(self):
+        """
+        Test that detecting on a downscaled copy gives nearly the same encoding.
+        """
+        image_path = Path("test/test_images/ouail.jpg")
+        full = get_image_encoding(image_path)
+        downscaled = get_image_encoding(image_path, detection_scale=0.25)
+        self.assertIsNotNone(downscaled)
+        self.assertLess(np.linalg.norm(full - downscaled), 0.1)
+
+    def test_scale_face_locations(self):
+        """
+        Test that boxes are mapped back to the full image and clipped to it.
+        """
+        locations = scale_face_locations([(10, 60, 50, 20), (0, 100, 80, 90)], 0.5, (150, 190, 3))
+        self.assertEqual(locations, [(20, 120, 100, 40), (0, 190, 150, 180)])
+
+    def test_get_image_encoding_with_cache(self):
+        """
+        Test that a cached encoding is reused instead of being computed again.
+        """
+        image_path = Path("test/test_images/ouail.jpg")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = EncodingCache(Path(temp_dir))
+            first = get_image_encoding(image_path, cache=cache)
+            second = get_image_encoding(image_path, cache=cache)
+            np.testing.assert_array_equal(first, second)
+            self.assertEqual(cache.stats()["hits"], 1)
+            self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_get_image_encoding_inputs(self):
+        """
+        Test that a path, the bytes of the file and the decoded array give the same encoding,
+        and that a reduced decode stays close to it.
+        """
+        import cv2
+
+        image_path = Path("test/test_images/ouail.jpg")
+        encoding = get_image_encoding(image_path)
+        np.testing.assert_allclose(get_image_encoding(image_path.read_bytes()), encoding, atol=1e-6)
+        np.testing.assert_allclose(get_image_encoding(cv2.imread(str(image_path))), encoding, atol=1e-6)
+        reduced = get_image_encoding(image_path, max_side=1000)
+        self.assertIsNotNone(reduced)
+        self.assertLess(np.linalg.norm(reduced - encoding), 0.1)
+
+    def test_get_image_encodings_batch(self):
+        """
+        Test that a batch gives the single image encodings, and a status per image without aborting.
+        """
+        image_path = Path("test/test_images/ouail.jpg")
+        blank = np.zeros((64, 64, 3), dtype=np.uint8)
+        encodings, statuses = get_image_encodings_batch(
+            [image_path, blank, Path("test/test_images/missing.jpg"), b"not an image", image_path.read_bytes()])
+        self.assertEqual(encodings.shape, (5, 128))
+        self.assertEqual(statuses, ["ok", "no_face", "missing", "unreadable", "ok"])
+        np.testing.assert_allclose(encodings[0], get_image_encoding(image_path), atol=1e-6)
+        np.testing.assert_allclose(encodings[4], encodings[0])
+        self.assertTrue(np.isnan(encodings[1:4]).all())
+
+    def test_get_image_face_encodings(self):
+        """
+        Test that every face is encoded, and that a single face gives the same encoding as get_image_encoding.
+        """
+        boxes, encodings = get_image_face_encodings(Path("test/test_images/multiple_persone.jpg"))
+        self.assertGreater(len(boxes), 1)
+        self.assertEqual(encodings.shape, (len(boxes), 128))
+        image_path = Path("test/test_images/ouail.jpg")
+        boxes, encodings = get_image_face_encodings(image_path)
+        self.assertEqual(len(boxes), 1)
+        np.testing.assert_allclose(encodings[0], get_image_encoding(image_path), atol=1e-6)
+
+    def test_lazy_imports(self):
+        """
+        Test that importing the modules and looking up a CSV encoding does not load OpenCV or the face models.
+        """
+        code = ("import sys; from pathlib import Path; import compare_image, encoding_image; "
+                "encoding_image.get_image_encoding_from_csv('messi.jpg', Path('test/test_encodings.csv')); "
+                "print(sorted(name for name in ('cv2', 'dlib', 'face_recognition') if name in sys.modules))")
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "[]")
+
+    def test_warm_executor(self):
+        """
+        Test that a job run in a fresh worker of the warm pool gives the in-process encoding.
+        """
+        image_path = Path("test/test_images/ouail.jpg")
+        with warm_executor(1, max_tasks_per_child=1) as executor:
+            encodings = [executor.submit(get_image_encoding, image_path).result() for _ in range(2)]
+        for encoding in encodings:
+            np.testing.assert_allclose(encoding, get_image_encoding(image_path), atol=1e-6)
+
     def test_get_image_encoding_from_csv(self):
         """
         Test the get_image_encoding_from_csv function.
@@ -48,6 +143,25 @@ class TestImageEncodingFunctions(unittest.TestCase):
         self.assertIsNotNone(encodings_dict)
         self.assertIsInstance(encodings_dict, dict)
 
+    def test_extract_encodings_parallel(self):
+        """
+        Test that the parallel, checkpointed mode gives the same result as the serial one.
+        """
+        image_folder = Path("test/test_images")
+        serial = extract_encodings(image_folder)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            checkpoint = Path(temp_dir) / "checkpoint.csv"
+            parallel = extract_encodings(image_folder, workers=2, chunk_size=2, checkpoint=checkpoint)
+            self.assertEqual(list(parallel.keys()), sorted(serial.keys()))
+            for image_name, encoding in serial.items():
+                np.testing.assert_allclose(parallel[image_name], encoding)
+
+            # Every image is in the checkpoint, so resuming encodes nothing and gives the same result
+            resumed = extract_encodings(image_folder, workers=2, checkpoint=checkpoint)
+            self.assertEqual(list(resumed.keys()), list(parallel.keys()))
+            for image_name, encoding in parallel.items():
+                np.testing.assert_allclose(resumed[image_name], encoding, atol=1e-7)
+
     def test_write_encodings_to_csv(self):
         """
         Test the write_encodings_to_csv function.
@@ -0,0 +1,196 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from multiprocessing import Process
+from pathlib import Path
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from encoding_store import EncodingStore, import_csv, open_store_for_csv, read_encodings_csv, read_log
+
+
+class TestEncodingStore(unittest.TestCase):
+    """
+    Unit tests for the binary encoding store.
+    """
+
+    def setUp(self):
+        """
+        Copy the test CSV file to a temporary folder so the store files do not leak into the repository.
+        """
+        self.temp_dir = tempfile.mkdtemp()
+        self.csv_filename = Path(self.temp_dir) / "encodings.csv"
+        shutil.copy("test/test_encodings.csv", self.csv_filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_import_csv(self):
+        """
+        Test that importing a CSV file gives the same encodings as parsing it.
+        """
+        store = import_csv(self.csv_filename)
+        expected = read_encodings_csv(self.csv_filename)
+        for image_name, encoding in expected.items():
+            if encoding.shape == (store.dim,):
+                np.testing.assert_array_equal(store.get(image_name), encoding)
+        self.assertIsInstance(store.matrix, np.memmap)
+        self.assertIsNone(store.get("not_enrolled.jpg"))
+
+    def test_write_and_append(self):
+        """
+        Test writing a store from a dictionary and appending to it.
+        """
+        store = EncodingStore(Path(self.temp_dir) / "gallery.store")
+        first = np.random.rand(128)
+        second = np.random.rand(128)
+        store.write({"first.jpg": first})
+        self.assertTrue(store.append("second.jpg", second))
+        self.assertFalse(store.append("bad.jpg", np.array([0.1, 0.2, 0.3])))
+
+        reopened = EncodingStore(store.root)
+        self.assertEqual(reopened.names, ["first.jpg", "second.jpg"])
+        np.testing.assert_array_equal(reopened.get("second.jpg"), second)
+        self.assertEqual(reopened.matrix.shape, (2, 128))
+
+    def test_rebuild_when_csv_changes(self):
+        """
+        Test that the store is re-imported when the CSV file is modified.
+        """
+        store = open_store_for_csv(self.csv_filename)
+        self.assertTrue(store.is_fresh(self.csv_filename))
+        encoding = np.random.rand(128)
+        with open(self.csv_filename, mode='a', newline='') as file:
+            file.write('new.jpg,"' + str(encoding) + '"\n')
+        self.assertFalse(store.is_fresh(self.csv_filename))
+
+        store = open_store_for_csv(self.csv_filename)
+        np.testing.assert_allclose(store.get("new.jpg"), encoding, atol=1e-7)
+
+    def test_append_to_csv(self):
+        """
+        Test that rows appended by several processes at once all reach the store, which stays in sync with the CSV file.
+        """
+        open_store_for_csv(self.csv_filename)
+        processes = [Process(target=append_many, args=(self.csv_filename, f"station{i}", 10)) for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        store = EncodingStore.for_csv(self.csv_filename)
+        self.assertTrue(store.is_fresh(self.csv_filename))
+        self.assertEqual(sorted(store.names), sorted(name for name, encoding in read_encodings_csv(self.csv_filename).items()
+                                                     if encoding.shape == (store.dim,)))
+        np.testing.assert_allclose(store.get("station3_9.jpg"), np.full(128, 9.0))
+
+        # A row written to the CSV file behind the store's back is picked up by the next append
+        with open(self.csv_filename, mode='a', newline='') as file:
+            file.write('outside.jpg,"' + str(np.full(128, 0.5)) + '"\n')
+        store.append_to_csv(self.csv_filename, [("inside.jpg", np.full(128, 0.25))])
+        store = EncodingStore.for_csv(self.csv_filename)
+        self.assertTrue(store.is_fresh(self.csv_filename))
+        np.testing.assert_allclose(store.get("outside.jpg"), np.full(128, 0.5))
+        np.testing.assert_allclose(store.get("inside.jpg"), np.full(128, 0.25))
+
+
+def append_many(csv_filename, prefix, count):
+    # Runs in a separate process to append to the same CSV file and store concurrently
+    store = EncodingStore.for_csv(csv_filename)
+    for i in range(count):
+        store.append_to_csv(csv_filename, [(f"{prefix}_{i}.jpg", np.full(128, i, dtype=np.float64))])
+
+
+def enroll_many(root, prefix, count):
+    # Runs in a separate process to write to the same store concurrently
+    store = EncodingStore(root, fsync=False)
+    for i in range(count):
+        store.upsert(f"{prefix}_{i}.jpg", np.full(128, i, dtype=np.float64))
+
+
+class TestLogStructuredStore(unittest.TestCase):
+    """
+    Unit tests for upserts, deletes and compaction of the store.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = EncodingStore(Path(self.temp_dir.name) / "gallery.store")
+        self.store.write({"a.jpg": np.zeros(128), "b.jpg": np.ones(128)})
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_upsert_and_delete(self):
+        """
+        Test that re-enrolling replaces the encoding and that deleted names disappear.
+        """
+        self.store.upsert("a.jpg", np.full(128, 2.0))
+        self.store.upsert("c.jpg", np.full(128, 3.0))
+        self.store.delete("b.jpg")
+        reopened = EncodingStore(self.store.root)
+        self.assertEqual(reopened.names, ["a.jpg", "c.jpg"])
+        np.testing.assert_array_equal(reopened.get("a.jpg"), np.full(128, 2.0))
+        self.assertIsNone(reopened.get("b.jpg"))
+        self.assertEqual(reopened.matrix.shape, (2, 128))
+
+    def test_upsert_many(self):
+        """
+        Test that a batch is stored like single upserts, skipping encodings of the wrong size.
+        """
+        stored = self.store.upsert_many([("a.jpg", np.full(128, 2.0)), ("bad.jpg", np.ones(3)),
+                                         ("c.jpg", np.full(128, 3.0))])
+        self.assertEqual(stored, 2)
+        reopened = EncodingStore(self.store.root)
+        self.assertEqual(sorted(reopened.names), ["a.jpg", "b.jpg", "c.jpg"])
+        np.testing.assert_array_equal(reopened.get("a.jpg"), np.full(128, 2.0))
+        np.testing.assert_array_equal(reopened.get("c.jpg"), np.full(128, 3.0))
+
+    def test_compact(self):
+        """
+        Test that compaction keeps the content, empties the log and drops the old generation.
+        """
+        self.store.upsert("c.jpg", np.full(128, 3.0))
+        self.store.delete("a.jpg")
+        before = (self.store.names, np.array(self.store.matrix))
+        self.assertTrue(self.store.compact())
+        self.assertEqual(self.store.log_size(), 0)
+        self.assertEqual(self.store.names, before[0])
+        np.testing.assert_array_equal(self.store.matrix, before[1])
+        self.assertIsInstance(self.store.matrix, np.memmap)
+        files = sorted(path.name for path in self.store.root.iterdir())
+        self.assertEqual(files, ["lock", "meta.json", "names-2.txt", "vectors-2.bin"])
+        self.assertFalse(self.store.compact())
+
+    def test_torn_record_is_ignored(self):
+        """
+        Test that a record cut short by a crash does not hide the records written after it.
+        """
+        self.store.upsert("c.jpg", np.full(128, 3.0))
+        log_path = self.store.log_path(self.store._meta["generation"])
+        with open(log_path, mode='ab') as file:
+            file.write(b'\xfaENC\x01\x05')  # Crash in the middle of a header
+        self.store.upsert("d.jpg", np.full(128, 4.0))
+        self.assertEqual([name for _, name, _ in read_log(log_path)], ["c.jpg", "d.jpg"])
+        self.assertEqual(EncodingStore(self.store.root).names, ["a.jpg", "b.jpg", "c.jpg", "d.jpg"])
+
+    def test_concurrent_writers(self):
+        """
+        Test that several processes enrolling at once do not lose or corrupt records.
+        """
+        processes = [Process(target=enroll_many, args=(self.store.root, f"station{i}", 25)) for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        reopened = EncodingStore(self.store.root)
+        self.assertEqual(len(reopened), 2 + 4 * 25)
+        np.testing.assert_array_equal(reopened.get("station3_24.jpg"), np.full(128, 24.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
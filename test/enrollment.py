@@ -0,0 +1,108 @@
+import unittest
+import csv
+import os
+import sys
+import shutil
+import tempfile
+from multiprocessing import Process
+from pathlib import Path
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from encoding_image import get_image_encoding
+from encoding_store import EncodingStore, read_encodings_csv
+from enrollment import enroll_folder, iter_image_files, reencode_gallery
+
+
+class TestEnrollment(unittest.TestCase):
+    """
+    Unit tests for the streaming enrollment pipeline.
+    """
+
+    def setUp(self):
+        """
+        Build a small folder tree: one face at the top, one face and one image without a face in a subfolder.
+        """
+        self.temp_dir = tempfile.mkdtemp()
+        self.image_folder = Path(self.temp_dir) / "images"
+        (self.image_folder / "north").mkdir(parents=True)
+        shutil.copy("test/test_images/ouail.jpg", self.image_folder / "ouail.jpg")
+        shutil.copy("test/test_images/messi.jpg", self.image_folder / "north" / "messi.jpg")
+        shutil.copy("test/test_images/cat.jpg", self.image_folder / "north" / "cat.jpg")
+        (self.image_folder / "notes.txt").write_text("not an image")
+        self.csv_filename = Path(self.temp_dir) / "encodings.csv"
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_iter_image_files(self):
+        """
+        Test that the scan is recursive, skips other files and names images relative to the root.
+        """
+        names = sorted(name for name, _ in iter_image_files(self.image_folder))
+        self.assertEqual(names, ["north/cat.jpg", "north/messi.jpg", "ouail.jpg"])
+
+    def test_enroll_folder(self):
+        """
+        Test that the encodings are streamed to the CSV file and to a store in sync with it.
+        """
+        stats = enroll_folder(self.image_folder, self.csv_filename, batch_size=2)
+        self.assertEqual((stats["images"], stats["encoded"], stats["no_face"]), (3, 2, 1))
+        self.assertGreater(stats["images_per_sec"], 0)
+
+        encodings = read_encodings_csv(self.csv_filename)
+        self.assertEqual(sorted(encodings), ["north/messi.jpg", "ouail.jpg"])
+        np.testing.assert_allclose(encodings["ouail.jpg"], get_image_encoding(self.image_folder / "ouail.jpg"),
+                                   atol=1e-6)
+        store = EncodingStore.for_csv(self.csv_filename)
+        self.assertTrue(store.is_fresh(self.csv_filename))
+        self.assertEqual(sorted(store.names), ["north/messi.jpg", "ouail.jpg"])
+
+        # Resuming only retries the image without a face
+        resumed = enroll_folder(self.image_folder, self.csv_filename, resume=True)
+        self.assertEqual((resumed["images"], resumed["encoded"]), (1, 0))
+        self.assertEqual(len(read_encodings_csv(self.csv_filename)), 2)
+
+    def test_concurrent_enrollment(self):
+        """
+        Test that two stations enrolling into the same gallery at once leave every row in the store.
+        """
+        enroll_folder(self.image_folder / "north", self.csv_filename)
+        processes = [Process(target=enroll_folder, args=(self.image_folder, self.csv_filename), kwargs={"batch_size": 1})
+                     for _ in range(2)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        store = EncodingStore.for_csv(self.csv_filename)
+        self.assertTrue(store.is_fresh(self.csv_filename))
+        self.assertEqual(len(store), 3)
+        self.assertEqual(sorted(store.names), sorted(set(read_encodings_csv(self.csv_filename))))
+
+    def test_reencode_gallery(self):
+        """
+        Test that stale rows are re-encoded from their images, copies of them follow, and the others are reported.
+        """
+        stale = np.full(128, 0.05)
+        with open(self.csv_filename, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Image Name', 'encodings'])
+            writer.writerows([("ouail.jpg", stale), ("copy_of_ouail.jpg", stale), ("north/messi.jpg", stale + 0.1),
+                              ("lost.jpg", stale - 0.1)])
+        stats = reencode_gallery(self.csv_filename, self.image_folder)
+        self.assertEqual((stats["reencoded"], stats["copied"], stats["stale"]), (2, 1, ["lost.jpg"]))
+
+        encodings = read_encodings_csv(self.csv_filename)
+        self.assertEqual(list(encodings), ["ouail.jpg", "copy_of_ouail.jpg", "north/messi.jpg", "lost.jpg"])
+        ouail = get_image_encoding(self.image_folder / "ouail.jpg")
+        np.testing.assert_allclose(encodings["ouail.jpg"], ouail, atol=1e-6)
+        np.testing.assert_allclose(encodings["copy_of_ouail.jpg"], ouail, atol=1e-6)
+        np.testing.assert_allclose(encodings["lost.jpg"], stale - 0.1)
+        self.assertTrue(EncodingStore.for_csv(self.csv_filename).is_fresh(self.csv_filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from pathlib import Path
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from gallery import Gallery, GalleryCache, QuantizedMatrix, as_gallery, face_distance_matrix, search_gallery
+
+
+class TestGallerySearch(unittest.TestCase):
+    """
+    Unit tests for the vectorized gallery search.
+    """
+
+    def setUp(self):
+        """
+        Build a small synthetic gallery.
+        """
+        rng = np.random.default_rng(0)
+        self.matrix = rng.normal(scale=0.1, size=(1000, 128))
+        self.names = [f"voter_{i}.jpg" for i in range(1000)]
+        self.query = self.matrix[42] + rng.normal(scale=0.01, size=128)
+
+    def test_face_distance_matrix(self):
+        """
+        Test the matrix product distances against the direct computation.
+        """
+        distances = face_distance_matrix(self.matrix, self.matrix[:3])
+        expected = np.linalg.norm(self.matrix[np.newaxis, :, :] - self.matrix[:3, np.newaxis, :], axis=2)
+        np.testing.assert_allclose(distances, expected, atol=1e-6)
+
+    def test_search_gallery(self):
+        """
+        Test that the chunked top-k search matches a full sort.
+        """
+        matches = search_gallery(self.matrix, self.names, self.query, k=5, chunk_size=64)
+        expected = np.argsort(np.linalg.norm(self.matrix - self.query, axis=1))[:5]
+        self.assertEqual([match.name for match in matches], [self.names[row] for row in expected])
+        self.assertEqual(matches[0].name, "voter_42.jpg")
+        self.assertTrue(matches[0].is_match)
+        self.assertEqual(matches, sorted(matches, key=lambda match: match.distance))
+
+    def test_search_gallery_batch(self):
+        """
+        Test that a batch of encodings gives one result list per encoding.
+        """
+        results = search_gallery(self.matrix, self.names, self.matrix[[1, 2]], k=2, chunk_size=100)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0][0].name, "voter_1.jpg")
+        self.assertEqual(results[1][0].name, "voter_2.jpg")
+
+    def test_small_gallery(self):
+        """
+        Test a gallery smaller than k and an empty gallery.
+        """
+        names, matrix = as_gallery({"a.jpg": self.matrix[0], "b.jpg": self.matrix[1]})
+        self.assertEqual(len(search_gallery(matrix, names, self.query, k=5)), 2)
+        names, matrix = as_gallery({})
+        self.assertEqual(search_gallery(matrix, names, self.query, k=5), [])
+
+
+class TestQuantizedMatrix(unittest.TestCase):
+    """
+    Unit tests for the compact gallery precisions.
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.matrix = rng.normal(scale=0.1, size=(500, 128))
+        self.names = [f"voter_{i}.jpg" for i in range(500)]
+        self.queries = self.matrix[:20] + rng.normal(scale=0.02, size=(20, 128))
+
+    def test_distances(self):
+        """
+        Test that the compact distances stay close to the float64 ones and that the storage shrinks.
+        """
+        expected = face_distance_matrix(self.matrix, self.queries)
+        for precision, atol, bytes_per_value in (("float32", 1e-5, 4), ("float16", 5e-3, 2), ("int8", 2e-2, 1)):
+            quantized = QuantizedMatrix.from_matrix(self.matrix, precision, chunk_size=64)
+            self.assertEqual(quantized.precision, precision)
+            self.assertEqual(quantized.data.nbytes, self.matrix.size * bytes_per_value)
+            np.testing.assert_allclose(quantized.distances(self.queries), expected, atol=atol)
+            np.testing.assert_allclose(quantized.distances(self.queries, 100, 164), expected[:, 100:164], atol=atol)
+
+    def test_search_quantized_gallery(self):
+        """
+        Test that a quantized gallery finds the same identities through the usual search and lookup.
+        """
+        gallery = Gallery(self.names, self.matrix, precision="int8")
+        self.assertLess(gallery.nbytes, self.matrix.nbytes / 6)
+        names, matrix = as_gallery(gallery)
+        results = search_gallery(matrix, names, self.queries, k=1, chunk_size=128)
+        self.assertEqual([matches[0].name for matches in results], self.names[:20])
+        np.testing.assert_allclose(gallery.get("voter_3.jpg"), self.matrix[3], atol=2e-3)
+        np.testing.assert_allclose(np.asarray(matrix), self.matrix, atol=2e-3)
+
+    def test_unsupported_precision(self):
+        with self.assertRaises(ValueError):
+            QuantizedMatrix.from_matrix(self.matrix, "int4")
+
+class TestGalleryCache(unittest.TestCase):
+    """
+    Unit tests for the process-wide gallery cache.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.csv_filename = Path(self.temp_dir) / "encodings.csv"
+        shutil.copy("test/test_encodings.csv", self.csv_filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_hit_and_reload(self):
+        """
+        Test that an unchanged CSV file is served from memory and a modified one is reloaded.
+        """
+        cache = GalleryCache()
+        gallery = cache.get(self.csv_filename)
+        self.assertIs(cache.get(self.csv_filename), gallery)
+        self.assertIn("messi.jpg", gallery)
+        self.assertTrue(gallery.matrix.flags.c_contiguous)
+
+        with open(self.csv_filename, mode='a', newline='') as file:
+            file.write('new.jpg,"' + str(np.zeros(128)) + '"\n')
+        reloaded = cache.get(self.csv_filename)
+        self.assertIsNot(reloaded, gallery)
+        self.assertIn("new.jpg", reloaded)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["reloads"], 1)
+
+    def test_memory_bound(self):
+        """
+        Test that galleries over the memory bound are not kept.
+        """
+        cache = GalleryCache(max_bytes=1024)
+        cache.get(self.csv_filename)
+        self.assertEqual(cache.stats()["galleries"], 0)
+        cache.get(self.csv_filename)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
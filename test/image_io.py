@@ -0,0 +1,69 @@
+import unittest
+import os
+import sys
+from pathlib import Path
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+import cv2
+from image_io import image_size, read_image, reduction_factor
+
+
+class TestImageSize(unittest.TestCase):
+    def test_jpeg(self):
+        # Test that the header size matches the decoded size, EXIF blocks being skipped
+        for name in ("ouail.jpg", "messi.jpg", "multiple_persone.jpg"):
+            image_path = Path("test/test_images") / name
+            height, width = cv2.imread(str(image_path), cv2.IMREAD_IGNORE_ORIENTATION | cv2.IMREAD_COLOR).shape[:2]
+            self.assertEqual(image_size(image_path), (width, height))
+            self.assertEqual(image_size(image_path.read_bytes()), (width, height))
+
+    def test_png(self):
+        # Test a PNG given as bytes
+        ok, png = cv2.imencode(".png", np.zeros((30, 50, 3), dtype=np.uint8))
+        self.assertTrue(ok)
+        self.assertEqual(image_size(png.tobytes()), (50, 30))
+
+    def test_unknown(self):
+        # Test that unreadable inputs have no size
+        self.assertIsNone(image_size(b"not an image"))
+        self.assertIsNone(image_size(Path("test/test_images/missing.jpg")))
+        self.assertIsNone(image_size(b"\xff\xd8\xff"))
+
+
+class TestReadImage(unittest.TestCase):
+    def test_reduction_factor(self):
+        # Test that the largest factor keeping max_side pixels is chosen
+        self.assertEqual(reduction_factor((4032, 3024), None), 1)
+        self.assertEqual(reduction_factor((4032, 3024), 500), 8)
+        self.assertEqual(reduction_factor((4032, 3024), 1000), 4)
+        self.assertEqual(reduction_factor((4032, 3024), 2016), 2)
+        self.assertEqual(reduction_factor((4032, 3024), 3000), 1)
+        self.assertEqual(reduction_factor(None, 500), 1)
+
+    def test_inputs(self):
+        # Test that a path, bytes and an array decode to the same pixels
+        image_path = Path("test/test_images/messi.jpg")
+        expected = cv2.imread(str(image_path))
+        np.testing.assert_array_equal(read_image(image_path), expected)
+        np.testing.assert_array_equal(read_image(image_path.read_bytes()), expected)
+        self.assertIs(read_image(expected), expected)
+        self.assertEqual(read_image(expected, grayscale=True).ndim, 2)
+        self.assertIsNone(read_image(b"not an image"))
+
+    def test_reduced(self):
+        # Test that a large photo is decoded at a fraction of its size, never below max_side
+        image_path = Path("test/test_images/ouail.jpg")
+        full = read_image(image_path)
+        reduced = read_image(image_path, max_side=1000)
+        self.assertEqual(reduced.shape, (full.shape[0] // 4, full.shape[1] // 4, 3))
+        gray = read_image(image_path.read_bytes(), max_side=500, grayscale=True)
+        self.assertEqual(gray.shape, (full.shape[0] // 8, full.shape[1] // 8))
+        # A small image is never reduced
+        self.assertEqual(read_image(Path("test/test_images/messi.jpg"), max_side=500).shape[:2], (256, 197))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import os
+import sys
+import json
+import logging
+from pathlib import Path
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from metrics import JsonFormatter, Metrics, metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Unit tests for the instrumentation layer.
+    """
+
+    def test_disabled(self):
+        """
+        Test that nothing is recorded while the metrics are disabled.
+        """
+        registry = Metrics()
+        with registry.timer("detect"):
+            pass
+        registry.increment("no_face")
+        self.assertEqual(registry.snapshot(), {"counters": {}, "stages": {}})
+
+    def test_timers_and_counters(self):
+        """
+        Test the dict snapshot of the timers and counters.
+        """
+        registry = Metrics(enabled=True)
+        for _ in range(3):
+            with registry.timer("detect"):
+                pass
+        registry.observe("encode", 0.2)
+        registry.increment("no_face")
+        registry.increment("cache_hit", 2)
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["counters"], {"no_face": 1, "cache_hit": 2})
+        self.assertEqual(snapshot["stages"]["detect"]["count"], 3)
+        self.assertAlmostEqual(snapshot["stages"]["encode"]["mean_ms"], 200.0)
+        self.assertEqual(snapshot["stages"]["encode"]["p99_ms"], 200.0)
+
+    def test_prometheus(self):
+        """
+        Test the Prometheus text exposition of a histogram and a counter.
+        """
+        registry = Metrics(enabled=True)
+        registry.observe("gate", 0.003)
+        registry.observe("gate", 0.03)
+        registry.increment("gate_rejected")
+        lines = registry.prometheus().splitlines()
+        self.assertIn('face_events_total{event="gate_rejected"} 1', lines)
+        self.assertIn('face_stage_seconds_bucket{stage="gate",le="0.005"} 1', lines)
+        self.assertIn('face_stage_seconds_bucket{stage="gate",le="0.05"} 2', lines)
+        self.assertIn('face_stage_seconds_bucket{stage="gate",le="+Inf"} 2', lines)
+        self.assertIn('face_stage_seconds_count{stage="gate"} 2', lines)
+        self.assertIn("# TYPE face_stage_seconds histogram", lines)
+
+    def test_json_formatter(self):
+        """
+        Test that a log record becomes one JSON object holding its extra fields.
+        """
+        record = logging.LogRecord("encoding_image", logging.WARNING, __file__, 1, "No face detected in the image.",
+                                   None, None)
+        record.image = "cat.jpg"
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["level"], "WARNING")
+        self.assertEqual(entry["message"], "No face detected in the image.")
+        self.assertEqual(entry["image"], "cat.jpg")
+
+    def test_instrumented_pipeline(self):
+        """
+        Test that encoding an image times every stage of the pipeline once.
+        """
+        from encoding_image import get_image_encoding
+
+        metrics.reset()
+        metrics.enable()
+        try:
+            get_image_encoding(Path("test/test_images/ouail.jpg"))
+            get_image_encoding(Path("test/test_images/cat.jpg"))
+            snapshot = metrics.snapshot()
+        finally:
+            metrics.disable()
+            metrics.reset()
+        for stage in ("decode", "detect"):
+            self.assertEqual(snapshot["stages"][stage]["count"], 2)
+        for stage in ("landmark", "encode"):
+            self.assertEqual(snapshot["stages"][stage]["count"], 1)
+        self.assertEqual(snapshot["counters"]["no_face"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import unittest
+import asyncio
+import base64
+import os
+import sys
+import shutil
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from encoding_store import read_encodings_csv
+from metrics import metrics
+from server import HTTPError, VerificationServer, encode_image_bytes, request
+
+
+def fake_encode(image_bytes):
+    # The test "images" are raw encodings, so no face model is needed
+    if len(image_bytes) != 128 * 8:
+        return None
+    return np.frombuffer(image_bytes, dtype=np.float64)
+
+
+def slow_encode(image_bytes):
+    time.sleep(0.2)
+    return fake_encode(image_bytes)
+
+
+def broken_encode(image_bytes):
+    if image_bytes == b"broken":
+        raise RuntimeError("Encoder crashed.")
+    return fake_encode(image_bytes)
+
+
+def as_image(encoding):
+    return base64.b64encode(np.asarray(encoding, dtype=np.float64).tobytes()).decode()
+
+
+class TestVerificationServer(unittest.TestCase):
+    """
+    Unit tests for the verification server, with a fake encoder.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.csv_filename = Path(self.temp_dir) / "encodings.csv"
+        shutil.copy("test/test_encodings.csv", self.csv_filename)
+        self.messi = read_encodings_csv(self.csv_filename)["messi.jpg"]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_with_server(self, scenario, **kwargs):
+        async def main():
+            server = VerificationServer(self.csv_filename, port=0, encode=kwargs.pop("encode", fake_encode), **kwargs)
+            await server.start()
+            try:
+                return await scenario(server)
+            finally:
+                await server.close()
+        return asyncio.run(main())
+
+    def test_verify_and_identify(self):
+        """
+        Test the verify and identify endpoints.
+        """
+        async def scenario(server):
+            port = server.port
+            return (
+                await request("127.0.0.1", port, "POST", "/verify", {"image": as_image(self.messi), "voter_id": "messi.jpg"}),
+                await request("127.0.0.1", port, "POST", "/verify", {"image": as_image(self.messi), "voter_id": "ouail.jpg"}),
+                await request("127.0.0.1", port, "POST", "/identify", {"image": as_image(self.messi), "k": 2}),
+                await request("127.0.0.1", port, "POST", "/verify", {"image": as_image(self.messi), "voter_id": "nobody.jpg"}),
+                await request("127.0.0.1", port, "POST", "/verify", {"image": as_image([0.1]), "voter_id": "messi.jpg"}),
+                await request("127.0.0.1", port, "POST", "/verify", {"voter_id": "messi.jpg"}),
+            )
+
+        same, other, identified, unknown, no_face, invalid = self.run_with_server(scenario)
+        self.assertEqual(same[0], 200)
+        self.assertTrue(same[1]["match"])
+        self.assertFalse(other[1]["match"])
+        self.assertEqual(identified[1]["matches"][0]["name"], "messi.jpg")
+        self.assertEqual(len(identified[1]["matches"]), 2)
+        self.assertEqual(unknown[0], 404)
+        self.assertEqual(no_face[0], 422)
+        self.assertEqual(invalid[0], 400)
+
+    def test_micro_batching(self):
+        """
+        Test that concurrent requests are processed in fewer batches.
+        """
+        async def scenario(server):
+            payload = {"image": as_image(self.messi), "k": 1}
+            responses = await asyncio.gather(*[request("127.0.0.1", server.port, "POST", "/identify", payload)
+                                               for _ in range(12)])
+            return responses, server.stats()
+
+        responses, stats = self.run_with_server(scenario, batch_delay=0.05)
+        self.assertTrue(all(status == 200 for status, _ in responses))
+        self.assertLess(stats["batches"], 12)
+
+    def test_bad_images(self):
+        """
+        Test that an empty or undecodable upload is a 400, and that a failing image only fails its own request.
+        """
+        for image_bytes in (b"", b"not an image"):
+            with self.assertRaises(HTTPError) as context:
+                encode_image_bytes(image_bytes)
+            self.assertEqual(context.exception.status, 400)
+
+        async def scenario(server):
+            images = [as_image(self.messi), base64.b64encode(b"broken").decode(), as_image(self.messi)]
+            return await asyncio.gather(*[request("127.0.0.1", server.port, "POST", "/identify", {"image": image, "k": 1})
+                                          for image in images])
+
+        responses = self.run_with_server(scenario, encode=broken_encode, batch_delay=0.05)
+        self.assertEqual([status for status, _ in responses], [200, 500, 200])
+
+    def test_parallel_encoding(self):
+        """
+        Test that the images of a batch are encoded in parallel.
+        """
+        async def scenario(server):
+            payload = {"image": as_image(self.messi), "voter_id": "messi.jpg"}
+            start = time.perf_counter()
+            responses = await asyncio.gather(*[request("127.0.0.1", server.port, "POST", "/verify", payload)
+                                               for _ in range(4)])
+            return responses, time.perf_counter() - start
+
+        responses, seconds = self.run_with_server(scenario, encode=slow_encode, workers=4, batch_delay=0.05)
+        self.assertTrue(all(status == 200 for status, _ in responses))
+        self.assertLess(seconds, 0.6)
+
+    def test_metrics_endpoint(self):
+        """
+        Test that the stage timers are exported in the Prometheus text format.
+        """
+        async def scenario(server):
+            await request("127.0.0.1", server.port, "POST", "/identify", {"image": as_image(self.messi), "k": 1})
+            return await request("127.0.0.1", server.port, "GET", "/metrics")
+
+        metrics.enable()
+        try:
+            status, text = self.run_with_server(scenario)
+        finally:
+            metrics.disable()
+            metrics.reset()
+        self.assertEqual(status, 200)
+        self.assertIn('face_stage_seconds_count{stage="distance"} 1', text)
+
+    def test_backpressure(self):
+        """
+        Test that requests over the concurrency limit and queue are refused with 503.
+        """
+        async def scenario(server):
+            payload = {"image": as_image(self.messi), "voter_id": "messi.jpg"}
+            return await asyncio.gather(*[request("127.0.0.1", server.port, "POST", "/verify", payload)
+                                          for _ in range(6)])
+
+        responses = self.run_with_server(scenario, encode=slow_encode, max_concurrency=1, max_queue=1, max_batch=1)
+        statuses = sorted(status for status, _ in responses)
+        self.assertIn(503, statuses)
+        self.assertIn(200, statuses)
+
+
+if __name__ == '__main__':
+    unittest.main()
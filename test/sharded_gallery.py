@@ -0,0 +1,119 @@
+import unittest
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+
+from gallery import search_gallery
+from sharded_gallery import ShardedGallery, partition_gallery, shard_of
+
+
+class TestShardedGallery(unittest.TestCase):
+    """
+    Unit tests for the scatter-gather search over shard worker processes.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Start 3 shards of a synthetic gallery, named by region.
+        """
+        rng = np.random.default_rng(0)
+        cls.matrix = rng.normal(scale=0.1, size=(3000, 128))
+        cls.names = [f"{('casablanca', 'rabat', 'fes')[i % 3]}/voter_{i}.jpg" for i in range(3000)]
+        cls.queries = cls.matrix[[42, 1000, 2999]] + rng.normal(scale=0.01, size=(3, 128))
+        cls.gallery = ShardedGallery(partition_gallery((cls.names, cls.matrix))).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gallery.close()
+
+    def test_partition_gallery(self):
+        """
+        Test that every image lands in the shard of its top folder.
+        """
+        shards = partition_gallery({"rabat/a.jpg": np.zeros(128), "fes/b.jpg": np.ones(128), "c.jpg": np.ones(128)})
+        self.assertEqual(sorted(shards), ["default", "fes", "rabat"])
+        self.assertEqual(shards["rabat"][0], ["rabat/a.jpg"])
+        self.assertEqual(shards["fes"][1].shape, (1, 128))
+        self.assertEqual(shard_of("casablanca/anfa/1.jpg"), "casablanca")
+        self.assertEqual(len(self.gallery), 3000)
+        self.assertEqual(self.gallery.sizes, {"casablanca": 1000, "rabat": 1000, "fes": 1000})
+
+    def test_search(self):
+        """
+        Test that the merged top k of the shards is the top k of the whole gallery.
+        """
+        expected = search_gallery(self.matrix, self.names, self.queries, k=5)
+        result = self.gallery.scatter(self.queries, k=5)
+        self.assertEqual(result.timed_out, [])
+        for matches, expected_matches in zip(result.matches, expected):
+            self.assertEqual([match.name for match in matches], [match.name for match in expected_matches])
+            np.testing.assert_allclose([match.distance for match in matches],
+                                       [match.distance for match in expected_matches])
+        single = self.gallery.search(self.queries[0], k=1)
+        self.assertEqual(single[0].name, "casablanca/voter_42.jpg")
+        self.assertTrue(single[0].is_match)
+
+    def test_restrict_shards(self):
+        """
+        Test that a query restricted to a district only returns identities of that district.
+        """
+        matches = self.gallery.search(self.queries[0], k=5, shards=["rabat"])
+        self.assertEqual(len(matches), 5)
+        self.assertTrue(all(match.name.startswith("rabat/") for match in matches))
+        self.assertFalse(matches[0].is_match)
+
+    def test_get(self):
+        """
+        Test that an encoding is fetched from the shard holding it.
+        """
+        np.testing.assert_allclose(self.gallery.get("fes/voter_2.jpg"), self.matrix[2])
+        self.assertIsNone(self.gallery.get("fes/voter_2.jpg", shards=["rabat"]))
+        self.assertIsNone(self.gallery.get("nobody.jpg"))
+
+    def test_timeout(self):
+        """
+        Test that shards answering too late are left out, and that their late answers are dropped.
+        """
+        result = self.gallery.scatter(self.queries, k=5, timeout=0)
+        self.assertEqual(sorted(result.timed_out), ["casablanca", "fes", "rabat"])
+        self.assertEqual(result.matches, [[], [], []])
+        result = self.gallery.scatter(self.queries[0], k=1)
+        self.assertEqual(result.timed_out, [])
+        self.assertEqual(result.matches[0].name, "casablanca/voter_42.jpg")
+
+    def test_concurrent_queries(self):
+        """
+        Test that queries from several threads at once each get the answer to their own query.
+        """
+        expected = [matches[0].name for matches in self.gallery.search(self.queries, k=1)]
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(lambda query: self.gallery.search(self.queries[query % 3], k=1)[0].name,
+                                        range(30)))
+        self.assertEqual(results, [expected[query % 3] for query in range(30)])
+
+    def test_unknown_shard(self):
+        """
+        Test that a query restricted to a shard that does not exist is an error.
+        """
+        with self.assertRaises(KeyError):
+            self.gallery.search(self.queries[0], shards=["tanger"])
+        with self.assertRaises(KeyError):
+            self.gallery.get("fes/voter_2.jpg", shards=["fes", "tanger"])
+
+    def test_load_error(self):
+        """
+        Test that a shard that cannot load stops the start.
+        """
+        with self.assertRaises(RuntimeError):
+            ShardedGallery({"missing": Path("test/missing.csv")}).start()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,21 @@
 import unittest
 import os
 import sys
+import tempfile
 from pathlib import Path
+import numpy as np
 
 # Add parent directory to sys.path
 parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
 sys.path.append(parent_dir)
-from take_image import detect_person_with_face_eyes_nose_mouth
+import cv2
+from take_image import CapturePipeline, FaceQualityGate, capture_and_verify, detect_person_with_face_eyes_nose_mouth, quality_gate, verify
+from encoding_image import get_image_encoding
 
 class TestDetectPerson(unittest.TestCase):
     def test_valid_image(self):
         # Test with a valid image containing a person with face, eyes, nose, and mouth
+        # Accepted by the default restricted search only, see test_gate_modes
         image_path = Path("./test/test_images/image_with_all_requirements.jpg")
         result = detect_person_with_face_eyes_nose_mouth(image_path)
         self.assertTrue(result)
@@ -39,5 +44,174 @@ class TestDetectPerson(unittest.TestCase):
         result = detect_person_with_face_eyes_nose_mouth(image_path)
         self.assertFalse(result)
 
+    def test_image_inputs(self):
+        # Test that a path, the bytes of the file, a decoded array and a reduced decode get the same answer
+        image_path = Path("./test/test_images/multiple_persone.jpg")
+        expected = detect_person_with_face_eyes_nose_mouth(image_path)
+        self.assertEqual(detect_person_with_face_eyes_nose_mouth(image_path.read_bytes()), expected)
+        self.assertEqual(detect_person_with_face_eyes_nose_mouth(cv2.imread(str(image_path))), expected)
+        self.assertEqual(detect_person_with_face_eyes_nose_mouth(image_path, max_side=1000), expected)
+        self.assertFalse(detect_person_with_face_eyes_nose_mouth(b"not an image"))
+
+    def test_feature_regions(self):
+        # Test that the restricted regions are the default, and that each feature is only found in its part of the face
+        self.assertTrue(quality_gate.restrict_regions)
+        gray = cv2.imread("./test/test_images/image_with_all_requirements.jpg", cv2.IMREAD_GRAYSCALE)
+        face_box = quality_gate.find_face(gray)
+        self.assertIsNotNone(face_box)
+        x, y, w, h = face_box
+        eyes = quality_gate._detect_feature(gray, face_box, "eye", quality_gate.cascades()[1])
+        self.assertEqual(len(eyes), 2)
+        for _, eye_y, _, eye_h in eyes:
+            self.assertLessEqual(eye_y + eye_h, h // 2)
+            self.assertGreaterEqual(eye_h, w // 10)
+
+    def test_gate_modes(self):
+        # Test that both modes agree on the labelled negatives, and that only the labelled positives change
+        whole_face = FaceQualityGate(restrict_regions=False)
+        for image_name in ("cat.jpg", "hamass.jpg", "multiple_persone.jpg"):
+            with self.subTest(image=image_name):
+                gray = cv2.imread(f"./test/test_images/{image_name}", cv2.IMREAD_GRAYSCALE)
+                self.assertEqual(quality_gate.evaluate(gray), whole_face.evaluate(gray))
+                self.assertFalse(quality_gate.check(gray))
+        for image_name in ("image_with_all_requirements.jpg", "ouail.jpg"):
+            with self.subTest(image=image_name):
+                gray = cv2.imread(f"./test/test_images/{image_name}", cv2.IMREAD_GRAYSCALE)
+                self.assertTrue(quality_gate.check(gray))
+                # The whole face search also finds an eye on the mouth
+                self.assertEqual(whole_face.evaluate(gray).reason, "eye")
+
+    def test_check_batch(self):
+        # Test that the batch check agrees with the single image check
+        images = [cv2.imread("./test/test_images/cat.jpg"), cv2.imread("./test/test_images/messi.jpg")]
+        self.assertTrue(quality_gate.is_loaded())
+        self.assertEqual(quality_gate.check_batch(images), [quality_gate.check(image) for image in images])
+        self.assertFalse(quality_gate.check_batch(images)[0])
+
+class TestVerify(unittest.TestCase):
+    def setUp(self):
+        self.csv_filename = Path("./test/test_encodings.csv")
+        self.image_path = Path("./test/test_images/image_with_all_requirements.jpg")
+
+    def test_verify(self):
+        # Test that one decode and one face box give a verification with the latency of every stage
+        report = verify(self.image_path, "ouail.jpg", self.csv_filename, max_side=1000)
+        self.assertTrue(report.match)
+        self.assertIsNone(report.reason)
+        self.assertEqual(len(report.face_box), 4)
+        self.assertEqual(list(report.timings), ["decode", "gate", "encode", "compare", "total"])
+        self.assertFalse(verify(self.image_path, "messi.jpg", self.csv_filename, max_side=1000).match)
+        # The same image as bytes, and with the box refined by dlib
+        same = verify(self.image_path.read_bytes(), "ouail.jpg", self.csv_filename, max_side=1000, refine=True)
+        self.assertTrue(same.match)
+        self.assertIn("refine", same.timings)
+
+    def test_rejection_reasons(self):
+        # Test that a rejected image says which check failed
+        cases = [
+            (Path("./test/test_images/cat.jpg"), "ouail.jpg", "no_face"),
+            (Path("./test/test_images/multiple_persone.jpg"), "ouail.jpg", "multiple_faces"),
+            (Path("./test/test_images/messi.jpg"), "messi.jpg", "eye"),
+            (Path("./test/test_images/missing.jpg"), "ouail.jpg", "missing"),
+            (b"not an image", "ouail.jpg", "unreadable"),
+            (self.image_path, "nobody.jpg", "unknown_voter"),
+        ]
+        for image, voter_id, reason in cases:
+            report = verify(image, voter_id, self.csv_filename)
+            self.assertFalse(report.match)
+            self.assertIsNone(report.distance)
+            self.assertEqual(report.reason, reason)
+            self.assertIn("total", report.timings)
+
+
+class BrightFrameGate:
+    # Accepts frames brighter than a threshold, so the capture loop can be tested without faces
+    def check(self, image):
+        return image.mean() > 100
+
+
+class FaceOnlyGate:
+    # Accepts frames with one face, without the eye, nose and mouth checks
+    def check(self, image):
+        return self.find_face(image) is not None
+
+    def find_face(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        faces = quality_gate.cascades()[0].detectMultiScale(gray, 1.3, 5)
+        return tuple(int(value) for value in faces[0]) if len(faces) == 1 else None
+
+
+class TestCapturePipeline(unittest.TestCase):
+    def setUp(self):
+        # Write a short video: 5 dark frames followed by 15 bright ones
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.video_path = Path(self.temp_dir.name) / "capture.avi"
+        writer = cv2.VideoWriter(str(self.video_path), cv2.VideoWriter_fourcc(*'MJPG'), 30, (320, 240))
+        for i in range(20):
+            writer.write(np.full((240, 320, 3), 20 if i < 5 else 200, dtype=np.uint8))
+        writer.release()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_accepts_frame_from_video(self):
+        # Test that the first accepted frame is returned at full resolution
+        pipeline = CapturePipeline(self.video_path, gate=BrightFrameGate(), gate_scale=0.5)
+        frame = pipeline.run(timeout=10)
+        self.assertIsNotNone(frame)
+        self.assertEqual(frame.shape, (240, 320, 3))
+        self.assertGreater(frame.mean(), 100)
+
+    def test_source_ends(self):
+        # Test that the loop stops at the end of the video and drops frames it did not gate
+        pipeline = CapturePipeline(self.video_path, gate=quality_gate, gate_every=4)
+        self.assertIsNone(pipeline.run(timeout=10))
+        stats = pipeline.stats()
+        self.assertEqual(stats["frames_captured"], 20)
+        self.assertLessEqual(stats["frames_gated"], 5)
+        self.assertEqual(stats["frames_dropped"], stats["frames_captured"] - stats["frames_gated"])
+        self.assertGreater(stats["capture_fps"], 0)
+
+    def test_pipeline_is_reusable(self):
+        # Test that the same pipeline captures again after a run, with per-run counters
+        pipeline = CapturePipeline(self.video_path, gate=BrightFrameGate())
+        for _ in range(2):
+            captured = pipeline.capture(timeout=10)
+            self.assertIsNotNone(captured)
+            self.assertEqual(captured.face_box, (0, 0, 320, 240))
+            self.assertLessEqual(pipeline.stats()["frames_gated"], pipeline.stats()["frames_captured"])
+
+
+class TestCaptureAndVerify(unittest.TestCase):
+    def setUp(self):
+        # Write a short video of a voter, at a quarter of the resolution of the phone photo
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.video_path = Path(self.temp_dir.name) / "voter.avi"
+        image_path = Path("./test/test_images/ouail.jpg")
+        frame = cv2.resize(cv2.imread(str(image_path)), None, fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
+        writer = cv2.VideoWriter(str(self.video_path), cv2.VideoWriter_fourcc(*'MJPG'), 30, frame.shape[1::-1])
+        for _ in range(5):
+            writer.write(frame)
+        writer.release()
+        self.gallery = {"ouail.jpg": get_image_encoding(image_path), "messi.jpg": get_image_encoding(Path("./test/test_images/messi.jpg"))}
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_capture_and_verify(self):
+        # Test that the accepted frame is verified in memory with the face box of the gate
+        result = capture_and_verify("ouail.jpg", self.gallery, self.video_path, timeout=10, gate=FaceOnlyGate())
+        self.assertIsNotNone(result)
+        x, y, width, height = result.face_box
+        self.assertTrue(0 <= x < x + width <= result.frame.shape[1])
+        self.assertTrue(0 <= y < y + height <= result.frame.shape[0])
+        self.assertTrue(result.verification.match)
+        self.assertFalse(capture_and_verify("messi.jpg", self.gallery, self.video_path, timeout=10,
+                                            gate=FaceOnlyGate()).verification.match)
+
+    def test_unknown_voter(self):
+        # Test that an unknown voter is refused before capturing
+        self.assertIsNone(capture_and_verify("nobody.jpg", self.gallery, self.video_path, gate=FaceOnlyGate()))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
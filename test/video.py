@@ -0,0 +1,148 @@
+import unittest
+import csv
+import os
+import sys
+import tempfile
+from pathlib import Path
+import numpy as np
+
+# Add parent directory to sys.path
+parent_dir = os.path.abspath(os.path.join(os.getcwd(), '.'))
+sys.path.append(parent_dir)
+import cv2
+from encoding_image import get_image_encoding
+from video import FaceTracker, VideoScreener, box_iou, face_quality, screen_video
+
+
+class TestFaceTracker(unittest.TestCase):
+    """
+    Unit tests for the IoU tracker, on synthetic boxes.
+    """
+
+    def setUp(self):
+        self.frame = np.random.default_rng(0).integers(0, 255, size=(240, 320, 3), dtype=np.uint8)
+
+    def test_box_iou(self):
+        """
+        Test the IoU of identical, disjoint and half overlapping boxes.
+        """
+        self.assertEqual(box_iou((0, 10, 10, 0), (0, 10, 10, 0)), 1.0)
+        self.assertEqual(box_iou((0, 10, 10, 0), (20, 30, 30, 20)), 0.0)
+        self.assertAlmostEqual(box_iou((0, 10, 10, 0), (0, 15, 10, 5)), 50 / 150)
+
+    def test_tracks_moving_faces(self):
+        """
+        Test that two faces moving across frames keep their own track.
+        """
+        tracker = FaceTracker(max_age=1)
+        for frame_index in range(10):
+            boxes = [(50, 60 + 3 * frame_index, 90, 20 + 3 * frame_index), (100, 300 - 4 * frame_index, 150, 250 - 4 * frame_index)]
+            self.assertEqual(tracker.update(self.frame, boxes, frame_index), [])
+        self.assertEqual(len(tracker.tracks), 2)
+        self.assertEqual([track.hits for track in tracker.tracks], [10, 10])
+
+    def test_center_fallback(self):
+        """
+        Test that a fast face without overlap between frames is followed by its center.
+        """
+        tracker = FaceTracker()
+        tracker.update(self.frame, [(50, 90, 90, 50)], 0)
+        tracker.update(self.frame, [(50, 105, 90, 65)], 1)
+        self.assertEqual(len(tracker.tracks), 1)
+        tracker.update(self.frame, [(50, 250, 90, 210)], 2)
+        self.assertEqual(len(tracker.tracks), 2)
+
+    def test_tracks_end(self):
+        """
+        Test that a track ends after max_age frames without its face, and keeps its best crops only.
+        """
+        tracker = FaceTracker(max_age=2, keep=2)
+        for frame_index in range(4):
+            tracker.update(self.frame, [(50, 90, 90, 50)], frame_index)
+        track = tracker.tracks[0]
+        self.assertEqual(len(track.best), 2)
+        self.assertEqual(tracker.update(self.frame, [], 4), [])
+        self.assertEqual(tracker.update(self.frame, [], 5), [])
+        self.assertEqual(tracker.update(self.frame, [], 6), [track])
+        self.assertEqual(tracker.finish(), [])
+
+    def test_face_quality(self):
+        """
+        Test that a blurred face scores lower than a sharp one.
+        """
+        box = (40, 200, 200, 40)
+        blurred = cv2.GaussianBlur(self.frame, (9, 9), 0)
+        self.assertGreater(face_quality(self.frame, box), face_quality(blurred, box))
+        self.assertEqual(face_quality(self.frame, (10, 10, 10, 10)), 0.0)
+
+
+class TestVideoScreener(unittest.TestCase):
+    """
+    Unit tests for the video screening, on a short video of two moving faces.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.video_path = Path(cls.temp_dir.name) / "station.avi"
+        messi = cv2.imread("./test/test_images/messi.jpg")
+        ouail = cv2.resize(cv2.imread("./test/test_images/ouail.jpg"), None, fx=1 / 16, fy=1 / 16,
+                           interpolation=cv2.INTER_AREA)
+        writer = cv2.VideoWriter(str(cls.video_path), cv2.VideoWriter_fourcc(*'MJPG'), 30, (560, 320))
+        for frame_index in range(8):
+            frame = np.full((320, 560, 3), 127, dtype=np.uint8)
+            x = 4 * frame_index
+            frame[20:20 + messi.shape[0], x:x + messi.shape[1]] = messi
+            frame[40:40 + ouail.shape[0], 300 + x:300 + x + ouail.shape[1]] = ouail
+            writer.write(frame)
+        writer.release()
+        cls.gallery = {"messi.jpg": get_image_encoding(Path("./test/test_images/messi.jpg")),
+                       "ouail.jpg": get_image_encoding(Path("./test/test_images/ouail.jpg"))}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
+
+    def test_encodes_each_track_once(self):
+        """
+        Test that each person is tracked, encoded once and identified.
+        """
+        screener = VideoScreener(self.gallery, detection_scale=1.0)
+        identities = list(screener.process(self.video_path))
+        self.assertEqual(sorted(identity.matches[0].name for identity in identities), ["messi.jpg", "ouail.jpg"])
+        self.assertTrue(all(identity.matches[0].is_match for identity in identities))
+        self.assertTrue(all(identity.encodes == 1 and identity.detections == 8 for identity in identities))
+        stats = screener.stats()
+        self.assertEqual(stats["frames_processed"], 8)
+        self.assertEqual(stats["encodes"], 2)
+        self.assertEqual(stats["encodes_saved"], 14)
+        self.assertGreater(stats["fps"], 0)
+
+    def test_sampling(self):
+        """
+        Test that only every Nth frame is processed, and that several crops can be encoded per track.
+        """
+        screener = VideoScreener(self.gallery, sample_every=2, detection_scale=1.0, encodes_per_track=2)
+        identities = list(screener.process(self.video_path))
+        stats = screener.stats()
+        self.assertEqual((stats["frames_read"], stats["frames_processed"]), (8, 4))
+        self.assertEqual([identity.encodes for identity in identities], [2, 2])
+        self.assertEqual(sorted(identity.matches[0].name for identity in identities), ["messi.jpg", "ouail.jpg"])
+
+    def test_screen_video(self):
+        """
+        Test that the tracks are written to the output file, and that a missing video yields nothing.
+        """
+        output = Path(self.temp_dir.name) / "tracks.csv"
+        identities, stats = screen_video(self.video_path, self.gallery, output, detection_scale=1.0, max_age=1)
+        with open(output, newline='') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(len(rows), 1 + len(identities))
+        self.assertEqual(sorted(row[5] for row in rows[1:]), ["messi.jpg", "ouail.jpg"])
+
+        identities, stats = screen_video(Path(self.temp_dir.name) / "missing.avi", self.gallery)
+        self.assertEqual(identities, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,449 @@
+import argparse
+import csv
+import heapq
+import itertools
+import logging
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+from encoding_image import detect_face_locations, encode_image
+from gallery import DEFAULT_TOLERANCE, as_gallery, search_gallery
+from metrics import metrics
+from sharded_gallery import ShardedGallery
+
+logger = logging.getLogger(__name__)
+
+# Width faces are resized to before their sharpness is measured, so it does not depend on their size
+QUALITY_FACE_WIDTH = 96
+# Fraction of the box size kept around a face when its crop is saved for encoding
+CROP_MARGIN = 0.25
+
+
+def box_iou(box_a: tuple, box_b: tuple) -> float:
+    """
+    Compute the intersection over union of two (top, right, bottom, left) boxes.
+
+    Args:
+        box_a (tuple): The first box.
+        box_b (tuple): The second box.
+
+    Returns:
+        float: The area of their intersection divided by the area of their union, 0.0 if they do not overlap.
+    """
+    top, right = max(box_a[0], box_b[0]), min(box_a[1], box_b[1])
+    bottom, left = min(box_a[2], box_b[2]), max(box_a[3], box_b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    if intersection == 0:
+        return 0.0
+    area_a = (box_a[1] - box_a[3]) * (box_a[2] - box_a[0])
+    area_b = (box_b[1] - box_b[3]) * (box_b[2] - box_b[0])
+    return intersection / (area_a + area_b - intersection)
+
+
+def _center_distance(box_a: tuple, box_b: tuple) -> float:
+    # Distance between the box centers, in widths of the first box
+    dy = (box_a[0] + box_a[2] - box_b[0] - box_b[2]) / 2
+    dx = (box_a[1] + box_a[3] - box_b[1] - box_b[3]) / 2
+    return float(np.hypot(dx, dy)) / max(1, box_a[1] - box_a[3])
+
+
+def face_quality(image: np.ndarray, face_location: tuple) -> float:
+    """
+    Score how well a face can be encoded: its sharpness, penalized when it is small.
+
+    The sharpness is the variance of the Laplacian of the face resized to ``QUALITY_FACE_WIDTH``
+    pixels, so motion blur and defocus lower the score, and faces narrower than that are scaled
+    down by their width ratio.
+
+    Args:
+        image (np.ndarray): The BGR frame.
+        face_location (tuple): The (top, right, bottom, left) box of the face.
+
+    Returns:
+        float: The quality of the face, higher is better, 0.0 for an empty box.
+    """
+    top, right, bottom, left = face_location
+    face = image[max(0, top):bottom, max(0, left):right]
+    if face.size == 0:
+        return 0.0
+    width = face.shape[1]
+    gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY) if face.ndim == 3 else face
+    gray = cv2.resize(gray, (QUALITY_FACE_WIDTH, max(1, round(gray.shape[0] * QUALITY_FACE_WIDTH / width))),
+                      interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var()) * min(1.0, width / QUALITY_FACE_WIDTH)
+
+
+class Track:
+    """
+    A face followed across frames, with the best crops of it seen so far.
+
+    Only the ``keep`` best crops, each a small copy of the face and its margin, are kept, so the
+    memory of a track does not grow with its length.
+
+    Parameters:
+        track_id (int): The number of the track in the video.
+        box (tuple): The (top, right, bottom, left) box of the face in the last frame it was seen.
+        frame_index (int): The frame the face was first seen in.
+        keep (int): Number of best crops kept for encoding.
+    """
+
+    def __init__(self, track_id: int, box: tuple, frame_index: int, keep: int = 1):
+        self.track_id = track_id
+        self.box = box
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+        self.hits = 0
+        self.misses = 0
+        self.keep = max(1, keep)
+        # Min-heap of (quality, frame_index, crop, box in the crop)
+        self.best = []
+
+    def add(self, frame: np.ndarray, box: tuple, frame_index: int) -> None:
+        """
+        Record a detection of the face, keeping its crop if it is among the best ones.
+        """
+        self.box = box
+        self.last_frame = frame_index
+        self.hits += 1
+        self.misses = 0
+        quality = face_quality(frame, box)
+        if len(self.best) == self.keep and quality <= self.best[0][0]:
+            return
+        top, right, bottom, left = box
+        pad_y, pad_x = int((bottom - top) * CROP_MARGIN), int((right - left) * CROP_MARGIN)
+        crop_top, crop_left = max(0, top - pad_y), max(0, left - pad_x)
+        crop = frame[crop_top:bottom + pad_y, crop_left:right + pad_x].copy()
+        entry = (quality, frame_index, crop, (top - crop_top, right - crop_left, bottom - crop_top, left - crop_left))
+        if len(self.best) == self.keep:
+            heapq.heapreplace(self.best, entry)
+        else:
+            heapq.heappush(self.best, entry)
+
+    @property
+    def quality(self) -> float:
+        return max((entry[0] for entry in self.best), default=0.0)
+
+    @property
+    def best_frame(self) -> int | None:
+        return max(self.best, default=(None, None))[1]
+
+
+class FaceTracker:
+    """
+    Greedy IoU tracker, with a center distance fallback for fast moving faces.
+
+    Each detection is given to the free track it overlaps the most, if their IoU is at least
+    ``iou_threshold``, or else to the free track whose center is closest, if it is within
+    ``max_distance`` box widths. Detections left over start new tracks, and a track not seen
+    for more than ``max_age`` processed frames is finished.
+
+    Parameters:
+        iou_threshold (float): Minimum IoU of a detection with a track to continue it.
+        max_distance (float): Maximum center distance, in box widths, of the fallback match.
+        max_age (int): Number of processed frames a track survives without a detection.
+        keep (int): Number of best crops kept per track.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_distance: float = 0.5, max_age: int = 5, keep: int = 1):
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.keep = keep
+        self.tracks = []
+        self._track_ids = itertools.count(1)
+
+    def _match(self, boxes: list) -> dict:
+        """
+        Assign detections to tracks.
+
+        Returns:
+            dict: The track of each matched detection, by detection index.
+        """
+        assigned = {}
+        free = set(range(len(self.tracks)))
+        pairs = sorted(((box_iou(track.box, box), t, d) for t, track in enumerate(self.tracks)
+                        for d, box in enumerate(boxes)), reverse=True)
+        for iou, t, d in pairs:
+            if iou < self.iou_threshold:
+                break
+            if t in free and d not in assigned:
+                assigned[d] = self.tracks[t]
+                free.discard(t)
+        pairs = sorted((_center_distance(self.tracks[t].box, box), t, d) for t in free
+                       for d, box in enumerate(boxes) if d not in assigned)
+        for distance, t, d in pairs:
+            if distance > self.max_distance:
+                break
+            if t in free and d not in assigned:
+                assigned[d] = self.tracks[t]
+                free.discard(t)
+        return assigned
+
+    def update(self, frame: np.ndarray, boxes: list, frame_index: int) -> list:
+        """
+        Add the detections of a frame to the tracks.
+
+        Args:
+            frame (np.ndarray): The BGR frame.
+            boxes (list): The (top, right, bottom, left) boxes of the faces detected in the frame.
+            frame_index (int): The index of the frame in the video.
+
+        Returns:
+            list: The tracks finished by this frame.
+        """
+        assigned = self._match(boxes)
+        for d, box in enumerate(boxes):
+            track = assigned.get(d)
+            if track is None:
+                track = Track(next(self._track_ids), box, frame_index, self.keep)
+                self.tracks.append(track)
+            track.add(frame, box, frame_index)
+        finished = []
+        for track in self.tracks:
+            # Tracks detected in this frame were just updated
+            if track.last_frame != frame_index:
+                track.misses += 1
+                if track.misses > self.max_age:
+                    finished.append(track)
+        self.tracks = [track for track in self.tracks if track not in finished]
+        return finished
+
+    def finish(self) -> list:
+        """
+        End every track, e.g. at the end of the video.
+
+        Returns:
+            list: The tracks still open.
+        """
+        finished, self.tracks = self.tracks, []
+        return finished
+
+
+class TrackIdentity(NamedTuple):
+    """
+    A face followed through a video, and who it is.
+
+    Fields:
+        track_id (int): The number of the track in the video.
+        first_frame (int): The first frame the face was detected in.
+        last_frame (int): The last frame the face was detected in.
+        detections (int): Number of processed frames the face was detected in.
+        best_frame (int): The frame of its best quality crop.
+        quality (float): The quality of that crop, see ``face_quality``.
+        encodes (int): Number of crops encoded for the track.
+        encoding (np.ndarray | None): The mean encoding of those crops, None if no face could be encoded.
+        matches (list): Up to k ``Match`` sorted by increasing distance, empty without a gallery.
+    """
+    track_id: int
+    first_frame: int
+    last_frame: int
+    detections: int
+    best_frame: int
+    quality: float
+    encodes: int
+    encoding: np.ndarray | None
+    matches: list
+
+
+class VideoScreener:
+    """
+    Identify the people of a video by tracking their faces and encoding each face once.
+
+    Encoding every face of every frame would encode the same person dozens of times per
+    second. Instead, faces are detected on sampled frames, followed across frames by a
+    ``FaceTracker``, and each track is encoded only when it ends, from its ``encodes_per_track``
+    sharpest crops, then searched in the gallery once with their mean encoding.
+
+    Parameters:
+        gallery (Path | Gallery | EncodingStore | dict | ShardedGallery | None): The known encodings,
+            e.g. Path("encodings.csv"). None only tracks and encodes the faces.
+        sample_every (int): Process every Nth frame. The others are still decoded, since later frames
+            depend on them, but they skip the copy out of the decoder, the detection and the tracking.
+        detection_scale (float): Factor frames are resized by before face detection.
+        model (str): The face detection model, "hog" or "cnn".
+        encodes_per_track (int): Number of best crops encoded per track.
+        min_detections (int): Tracks detected in fewer processed frames are dropped as false detections.
+        k (int): Number of candidates returned per track.
+        tolerance (float): Maximum distance for a candidate to be considered a match.
+        iou_threshold (float): Minimum IoU of a detection with a track to continue it.
+        max_age (int): Number of processed frames a track survives without a detection.
+
+    Examples:
+        >>> screener = VideoScreener(Path("encodings.csv"), sample_every=3, detection_scale=0.5)
+        >>> for identity in screener.process(Path("footage/station_12.mp4")):
+        >>>     print(identity.track_id, identity.matches[:1])
+        >>> print(screener.stats())
+    """
+
+    def __init__(self, gallery=Path("encodings.csv"), sample_every: int = 1, detection_scale: float = 0.5,
+                 model: str = "hog", encodes_per_track: int = 1, min_detections: int = 2, k: int = 1,
+                 tolerance: float = DEFAULT_TOLERANCE, iou_threshold: float = 0.3, max_age: int = 5):
+        self.gallery = gallery
+        if gallery is not None and not isinstance(gallery, ShardedGallery):
+            self.gallery = as_gallery(gallery)
+        self.sample_every = max(1, sample_every)
+        self.detection_scale = detection_scale
+        self.model = model
+        self.encodes_per_track = max(1, encodes_per_track)
+        self.min_detections = min_detections
+        self.k = k
+        self.tolerance = tolerance
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self._stats = {}
+
+    def _identify(self, track: Track) -> TrackIdentity | None:
+        """
+        Encode the best crops of a finished track and search the gallery with their mean encoding.
+        """
+        self._stats["detections"] += track.hits
+        if track.hits < self.min_detections:
+            self._stats["tracks_dropped"] += 1
+            return None
+        encodings = [encode_image(crop, face_locations=[box]) for _, _, crop, box in track.best]
+        self._stats["encodes"] += len(encodings)
+        encodings = [encoding for encoding in encodings if encoding is not None]
+        encoding = np.mean(encodings, axis=0) if encodings else None
+        matches = []
+        if encoding is not None and self.gallery is not None:
+            if isinstance(self.gallery, ShardedGallery):
+                matches = self.gallery.search(encoding, k=self.k, tolerance=self.tolerance)
+            else:
+                names, matrix = self.gallery
+                matches = search_gallery(matrix, names, encoding, k=self.k, tolerance=self.tolerance)
+        self._stats["tracks"] += 1
+        return TrackIdentity(track.track_id, track.first_frame, track.last_frame, track.hits, track.best_frame,
+                             track.quality, len(track.best), encoding, matches)
+
+    def process(self, source, max_frames: int | None = None):
+        """
+        Screen a video, yielding the identity of each track as soon as it ends.
+
+        Args:
+            source (int | str | Path | cv2.VideoCapture): Video file, stream URL or camera index, or an opened capture.
+            max_frames (int | None): Stop after this many frames of the video. None reads it to the end.
+
+        Yields:
+            TrackIdentity: One per track detected in at least ``min_detections`` processed frames,
+                in the order the tracks end.
+        """
+        if isinstance(source, cv2.VideoCapture):
+            capture = source
+        else:
+            capture = cv2.VideoCapture(str(source) if isinstance(source, Path) else source)
+        if not capture.isOpened():
+            logger.error("Video source cannot be opened.", extra={"source": str(source)})
+            return
+        tracker = FaceTracker(self.iou_threshold, max_age=self.max_age, keep=self.encodes_per_track)
+        self._stats = {"frames_read": 0, "frames_processed": 0, "detections": 0, "tracks": 0, "tracks_dropped": 0,
+                       "encodes": 0}
+        start = time.perf_counter()
+        try:
+            for frame_index in itertools.count():
+                if max_frames is not None and frame_index >= max_frames:
+                    break
+                if frame_index % self.sample_every:
+                    # grab() still decodes the frame, the frames after it are predicted from it; only
+                    # retrieve(), the conversion and copy of the decoded picture to an array, is skipped
+                    if not capture.grab():
+                        break
+                    self._stats["frames_read"] += 1
+                    continue
+                with metrics.timer("decode"):
+                    ok, frame = capture.read()
+                if not ok:
+                    break
+                self._stats["frames_read"] += 1
+                self._stats["frames_processed"] += 1
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                boxes = detect_face_locations(rgb, self.detection_scale, self.model)
+                for track in tracker.update(frame, boxes, frame_index):
+                    identity = self._identify(track)
+                    if identity is not None:
+                        yield identity
+            for track in tracker.finish():
+                identity = self._identify(track)
+                if identity is not None:
+                    yield identity
+        finally:
+            self._stats["seconds"] = time.perf_counter() - start
+            if not isinstance(source, cv2.VideoCapture):
+                capture.release()
+
+    def stats(self) -> dict:
+        """
+        Get the counters of the last video processed.
+
+        Returns:
+            dict: The frames read and processed, the processed frames per second, the face
+                detections, the tracks identified and dropped, the encodes run and the encodes
+                saved compared to encoding every detection.
+        """
+        stats = dict(self._stats)
+        if not stats:
+            return stats
+        seconds = stats.get("seconds", 0.0)
+        stats["fps"] = stats["frames_processed"] / seconds if seconds > 0 else 0.0
+        stats["encodes_saved"] = stats["detections"] - stats["encodes"]
+        return stats
+
+
+def screen_video(source, gallery=Path("encodings.csv"), output: Path | None = None, **kwargs) -> tuple:
+    """
+    Screen a whole video and collect the identity of every track.
+
+    Args:
+        source (int | str | Path | cv2.VideoCapture): Video file, stream URL or camera index, or an opened capture.
+        gallery (Path | Gallery | EncodingStore | dict | ShardedGallery | None): The known encodings.
+        output (Path | None): CSV file the tracks are written to as they end, with their frames and best match.
+        **kwargs: The other parameters of ``VideoScreener``.
+
+    Returns:
+        tuple: The list of ``TrackIdentity`` and the stats of ``VideoScreener.stats``.
+
+    Examples:
+        >>> identities, stats = screen_video(Path("footage/station_12.mp4"), sample_every=3, output=Path("tracks.csv"))
+        >>> print(f"{stats['fps']:.1f} frames/sec, {stats['encodes_saved']} encodes saved")
+    """
+    screener = VideoScreener(gallery, **kwargs)
+    identities = []
+    file = open(output, mode='w', newline='') if output is not None else None
+    try:
+        writer = csv.writer(file) if file is not None else None
+        if writer is not None:
+            writer.writerow(['track', 'first frame', 'last frame', 'detections', 'best frame', 'name', 'distance', 'match'])
+        for identity in screener.process(source):
+            identities.append(identity)
+            if writer is not None:
+                best = identity.matches[0] if identity.matches else None
+                writer.writerow([identity.track_id, identity.first_frame, identity.last_frame, identity.detections,
+                                 identity.best_frame, best.name if best else '', best.distance if best else '',
+                                 best.is_match if best else False])
+                file.flush()
+    finally:
+        if file is not None:
+            file.close()
+    return identities, screener.stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Identify the people of a video, encoding each tracked face once.")
+    parser.add_argument("video", help="video file or stream URL")
+    parser.add_argument("--csv", type=Path, default=Path("encodings.csv"))
+    parser.add_argument("--output", type=Path, default=None, help="write the tracks to this CSV file")
+    parser.add_argument("--sample-every", type=int, default=1)
+    parser.add_argument("--detection-scale", type=float, default=0.5)
+    parser.add_argument("--encodes-per-track", type=int, default=1)
+    args = parser.parse_args()
+
+    identities, stats = screen_video(args.video, args.csv, args.output, sample_every=args.sample_every,
+                                     detection_scale=args.detection_scale, encodes_per_track=args.encodes_per_track)
+    for identity in identities:
+        best = identity.matches[0] if identity.matches else None
+        print(f"track {identity.track_id}: frames {identity.first_frame}-{identity.last_frame}, "
+              + (f"{best.name} ({best.distance:.3f}, match={best.is_match})" if best else "no encoding"))
+    print(stats)